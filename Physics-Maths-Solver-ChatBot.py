@@ -15,21 +15,158 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import streamlit as st
-import google.generativeai as genai
-import pyttsx3
+import streamlit.components.v1 as components
 from io import BytesIO
-from PIL import Image
-import matplotlib.pyplot as plt
-import numpy as np
+from PIL import Image, ImageOps
 import io
+import html
+import asyncio
 import base64
 import tempfile
 import os
-import requests
+import sys
+import re
+import json
+import uuid
+import random
+import wave
+import time
+import hashlib
+import sqlite3
+import threading
+import queue
+import unicodedata
+import multiprocessing
+import itertools
+import signal
+import graph_worker
+import quick_plot
+import tracing
+import jobs
+import intent_router
+import local_solver
+import example_bank
+import model_tiers
+import key_pool
+import gemini_client
+import question_splitter
+from collections import deque, OrderedDict
+from urllib.parse import quote
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError, CancelledError
+from concurrent.futures.process import BrokenProcessPool
 
-# Configure the API
-GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
-genai.configure(api_key=GOOGLE_API_KEY)
+# Set CHATBOT_STUB_MODEL=1 to run offline against a stub model instead of Gemini
+USE_STUB_MODEL = os.environ.get("CHATBOT_STUB_MODEL") == "1"
+# Set CHATBOT_STUB_TTS=1 to replace speech synthesis with timed silence (for load tests)
+USE_STUB_TTS = os.environ.get("CHATBOT_STUB_TTS") == "1"
+
+# Text-to-speech settings
+TTS_FIRST_CHUNK_CHARS = 40            # the first audio chunk is a single short sentence so playback starts quickly
+TTS_CHUNK_CHARS = 300                 # later chunks group sentences up to roughly this length
+TTS_POLL_INTERVAL = 0.5               # seconds between checks for newly synthesized chunks
+TTS_RATE = 440                        # words per minute (2x the default speed)
+TTS_MP3_BITRATE = 48                  # kbps, plenty for speech
+
+# On-disk caches shared by every session live here
+CACHE_DIR = os.environ.get("CHATBOT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+AUDIO_CACHE_MAX_BYTES = 500 * 1024 ** 2  # least recently used audio files are deleted past this
+GRAPH_CACHE_MAX_BYTES = 500 * 1024 ** 2  # and graph code and PNGs past this
+MEDIA_CACHE_MAX_BYTES = 1024 ** 3     # and chat history images past this
+CACHE_EVICT_TO = 0.9                  # eviction frees space down to this fraction of a cache's limit
+
+# Multi-part question settings (see question_splitter.py)
+FANOUT_MAX_GROUPS = 6                 # requests a multi-part question may be split into
+FANOUT_CONCURRENCY = 3                # parts answered at once; the next starts as the earliest is shown
+FANOUT_TRANSCRIPTION_WAIT = 20        # seconds to wait for a photo's transcription so a worksheet can be split
+
+# Model gateway settings (every Gemini call from every session goes through one queue)
+GATEWAY_MAX_CONCURRENCY = 8           # upstream model calls in flight at once
+GATEWAY_GLOBAL_RATE = 5.0             # upstream calls per second across all sessions
+GATEWAY_GLOBAL_BURST = 10
+GATEWAY_SESSION_RATE = 0.2            # calls per second for one student
+GATEWAY_SESSION_BURST = FANOUT_MAX_GROUPS + 3  # one question's parts, plus its graph, transcription and summary
+GATEWAY_MAX_WAIT = 30                 # seconds a student may be queued by their own limit before being told to wait
+GATEWAY_MAX_RETRIES = 3               # retries after quota (429) and overload (503) errors
+GATEWAY_BACKOFF_BASE = 1.0            # seconds before the first retry; doubled each time, with jitter
+
+# Gemini API key pool (see load_api_keys); each call goes to the key with the most quota left
+GEMINI_KEY_RPM = int(os.environ.get("CHATBOT_GEMINI_KEY_RPM", "15"))  # requests per minute for keys without their own rpm
+GEMINI_KEY_BACKOFF_BASE = 2.0         # seconds a key rests after a 429; doubled for each 429 in a row, with jitter
+GEMINI_KEY_BACKOFF_MAX = 60.0
+# Point the Gemini SDK at a local fake server, e.g. http://127.0.0.1:8766
+GEMINI_API_BASE = os.environ.get("CHATBOT_GEMINI_API_BASE")
+
+# Tracing settings
+TRACE_FILE = os.environ.get("CHATBOT_TRACE_FILE")               # append each request's spans here as OTLP/JSON lines
+TRACE_OTLP_ENDPOINT = os.environ.get("CHATBOT_OTLP_ENDPOINT")   # or send them to a collector, e.g. http://localhost:4318/v1/traces
+TRACE_HISTORY = 10                    # recent requests shown in the debug panel's waterfall
+
+# Intent routing settings
+INTENT_PROMPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_prompts.tsv")
+# Set CHATBOT_ROUTER_CLASSIFIER=1 to let a classifier trained on the labelled prompts decide weak cues
+# such as "show me" or "diagram", which are otherwise ignored (see benchmarks/bench_router.py)
+USE_ROUTER_CLASSIFIER = os.environ.get("CHATBOT_ROUTER_CLASSIFIER") == "1"
+ROUTER_CLASSIFIER_THRESHOLD = 0.9     # a wrong graph or image costs far more than a missed one
+
+# Built-in solver settings (see local_solver.py)
+SOLVER_WORKERS = 2                    # SymPy worker processes shared by every session
+SOLVER_TIME_LIMIT = 2.0               # seconds the built-in solver may spend on a question before it goes to the model
+
+# Precomputed example answers (see warm_examples.py)
+EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Chatbot_Examples_Questions.txt")
+EXAMPLE_DIFFICULTY = "Standard"       # the examples are precomputed at this difficulty only
+
+# Answer cache settings
+ANSWER_CACHE_TTL = 7 * 24 * 3600      # seconds before a cached answer expires
+ANSWER_CACHE_MAX_ENTRIES = 5000       # least recently used answers are evicted past this
+# Set CHATBOT_ANSWER_CACHE_FUZZY=1 to also serve cached answers to questions that differ only in
+# punctuation, spacing, case or stop words; other questions must match exactly
+ANSWER_CACHE_FUZZY = os.environ.get("CHATBOT_ANSWER_CACHE_FUZZY") == "1"
+
+# Conversation context settings
+CONTEXT_TOKEN_BUDGET = 2000           # tokens of summary plus recent turns sent with each question
+CONTEXT_SUMMARY_WORDS = 150           # length limit for the rolling summary of older turns
+
+# Chat history settings
+CHAT_PAGE_SIZE = 20                   # messages rendered per page; older turns load on demand
+MEDIA_THUMBNAIL_SIZE = 400            # pixels a side for uploaded photos shown in the history
+MEDIA_DISPLAY_SIZE = 1024             # pixels a side for generated images and graphs in the history
+MEDIA_MEMORY_ITEMS = 64               # history images kept in memory per process
+
+# Uploaded image settings
+UPLOAD_MAX_PIXELS = 1_000_000         # photos are downsized to this many pixels before they reach the model
+UPLOAD_JPEG_QUALITY = 85
+UPLOAD_CACHE_MAX_ENTRIES = 500        # least recently used image extractions are evicted past this
+
+# Image generation settings
+IMAGE_PROVIDER_TIMEOUT = 90           # seconds for a single provider request
+IMAGE_RACE_TOP_N = 2                  # providers fired at once in race mode
+IMAGE_RACE_HEDGE_DELAY = 5.0          # seconds before each further provider joins the race
+IMAGE_RACE_DEADLINE = 90              # total seconds a race may take
+IMAGE_UNTRIED_COST = 30.0             # assumed seconds-to-image for a provider with no history
+IMAGE_FAILURE_PENALTY = 60.0          # seconds added to a provider's cost per unit of error rate
+IMAGE_BREAKER_THRESHOLD = 3           # consecutive failures that open a provider's circuit breaker
+IMAGE_BREAKER_COOLDOWN = 300          # seconds an open breaker skips its provider
+IMAGE_LATENCY_BUCKETS = [1, 5, 15, 30, 90]  # upper edges (seconds) of the latency histogram
+
+# Graph rendering settings
+GRAPH_WORKERS = 2                     # warm worker processes that run graph code
+GRAPH_TIME_LIMIT = 10                 # seconds of wall and CPU time a graph may take
+GRAPH_MEMORY_LIMIT = 2 * 1024 ** 3    # bytes of address space per worker
+GRAPH_DPI = 150
+
+# Point every image provider at a local fake server, e.g. http://127.0.0.1:8765
+IMAGE_API_BASE = os.environ.get("CHATBOT_IMAGE_API_BASE")
+
+MODEL_NAME = 'gemini-2.0-flash-exp'
+
+# Answer models by tier, with the output tokens each may spend; model_tiers.RULES picks the tier
+MODEL_TIERS = [
+    model_tiers.Tier("fast", os.environ.get("CHATBOT_FAST_MODEL", "gemini-2.0-flash-lite"), 1024),
+    model_tiers.Tier("standard", MODEL_NAME, 4096),
+    model_tiers.Tier("deep", os.environ.get("CHATBOT_DEEP_MODEL", "gemini-2.5-pro"), 8192),
+]
 
 # System prompt defining the persona
 SYSTEM_PROMPT = """You are an expert Physics and Mathematics tutor with a passion for teaching. Your role is to:
@@ -51,185 +188,1745 @@ When a student asks a question, first understand what they're asking, then break
 
 If the user asks for diagrams or graphs, provide detailed descriptions of what should be plotted or drawn."""
 
-def initialize_session_state():
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    if "model" not in st.session_state:
-        # Use gemini-2.0-flash-exp (correct model name)
-        st.session_state.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    if "vision_model" not in st.session_state:
-        st.session_state.vision_model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    if "last_generated_image" not in st.session_state:
-        st.session_state.last_generated_image = None
-    if "last_generated_graph" not in st.session_state:
-        st.session_state.last_generated_graph = None
+class StubChunk:
+    """A single streamed piece of a stub response"""
+    def __init__(self, text):
+        self.text = text
 
-def text_to_speech(text):
-    """Convert text to speech with robust error handling"""
-    try:
-        # Remove markdown formatting for better speech
-        clean_text = text.replace('**', '').replace('*', '').replace('#', '').replace('`', '')
+class StubUsage:
+    """Mimics a Gemini response's usage_metadata"""
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class StubResponse:
+    """Mimics the parts of a Gemini response the app uses (.text, .usage_metadata and chunk iteration)"""
+    def __init__(self, chunks, delay, usage_metadata=None):
+        self._chunks = chunks
+        self._delay = delay
+        self.usage_metadata = usage_metadata
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            time.sleep(self._delay)
+            piece = StubChunk(chunk)
+            # Like the real API, usage is reported on the last chunk
+            if i == len(self._chunks) - 1:
+                piece.usage_metadata = self.usage_metadata
+            yield piece
+
+class StubAPIError(Exception):
+    """Simulated upstream failure, carrying an HTTP-style status code like the SDK's errors"""
+    def __init__(self, code):
+        super().__init__(f"{code} stub upstream error")
+        self.code = code
+
+class StubModel:
+    """Offline stand-in for a Gemini model that yields chunks on a timer"""
+    def __init__(self, model_name="stub", delay=None, system_instruction=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        if delay is None:
+            delay = float(os.environ.get("CHATBOT_STUB_DELAY", "0.05"))
+        self.delay = delay
+        # Load tests can add time before the first chunk (log-normal around the median) and failures
+        self.latency = float(os.environ.get("CHATBOT_STUB_LATENCY", "0"))
+        self.jitter = float(os.environ.get("CHATBOT_STUB_JITTER", "0"))
+        self.error_rate = float(os.environ.get("CHATBOT_STUB_ERROR_RATE", "0"))
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency * random.lognormvariate(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubAPIError(random.choice((429, 503)))
         
-        # Limit text length to avoid very long audio
-        if len(clean_text) > 1000:
-            clean_text = clean_text[:1000] + "... response truncated for audio."
+        # Flatten plain strings, part lists and multi-turn {"role", "parts"} contents to text
+        if not isinstance(contents, list):
+            contents = [contents]
+        texts = []
+        for item in contents:
+            parts = item["parts"] if isinstance(item, dict) else [item]
+            texts.extend(part for part in parts if isinstance(part, str))
+        prompt = " ".join(texts)
         
-        # Initialize pyttsx3 engine
-        engine = pyttsx3.init()
+        if "Generate Python code using matplotlib" in prompt:
+            answer = ("```python\nimport matplotlib.pyplot as plt\nimport numpy as np\n\n"
+                      "plt.figure(figsize=(10, 6))\nx = np.linspace(0, 2 * np.pi, 200)\n"
+                      "plt.plot(x, np.sin(x), label='sin(x)')\nplt.title('Stub Graph')\n"
+                      "plt.grid(True)\nplt.legend()\n```")
+        else:
+            question = prompt.rsplit("Student Question:", 1)[-1].strip()
+            # Like the real model, a question with parts gets worked steps for each of them
+            split = question_splitter.split_question(question)
+            parts = [f"{part.label} {part.text}" for group in split.groups for part in group] if split else [question]
+            answer = "".join(f"**Step 1:** Let's restate the problem: {part}\n\n"
+                             "**Step 2:** Identify the known quantities and the relevant formula.\n\n"
+                             "**Step 3:** Substitute the values and simplify.\n\n" for part in parts)
+            answer += "**Answer:** This is a stub response generated offline."
         
-        # Set much faster speed (2x faster)
-        engine.setProperty('rate', 440)  # 2x speed (was 220)
+        # Split into word-sized chunks so streaming looks like the real API
+        chunks = [word + " " for word in answer.split(" ")]
+        chunks[-1] = chunks[-1].rstrip(" ")
+        # Like the real API, an answer over the output budget is cut off
+        budget = (kwargs.get("generation_config") or {}).get("max_output_tokens")
+        while budget and len(chunks) > 1 and estimate_tokens("".join(chunks)) > budget:
+            chunks.pop()
+        answer = "".join(chunks)
+        prompt_tokens = estimate_tokens((self.system_instruction or "") + prompt)
+        response = StubResponse(chunks, self.delay, StubUsage(prompt_tokens, estimate_tokens(answer)))
+        if not stream:
+            time.sleep(self.delay * len(chunks))
+        return response
+
+def load_api_keys():
+    """The Gemini API keys to spread calls over. CHATBOT_GEMINI_API_KEYS (comma-separated) comes
+    first; otherwise GOOGLE_API_KEYS in the secrets, a list of keys or of tables with name,
+    api_key and rpm (one per key or project); otherwise the single GOOGLE_API_KEY."""
+    env_keys = [key.strip() for key in os.environ.get("CHATBOT_GEMINI_API_KEYS", "").split(",") if key.strip()]
+    entries = env_keys or st.secrets.get("GOOGLE_API_KEYS") or [st.secrets["GOOGLE_API_KEY"]]
+    keys = []
+    for number, entry in enumerate(entries, 1):
+        if isinstance(entry, str):
+            keys.append(key_pool.ApiKey(f"key {number}", entry, GEMINI_KEY_RPM))
+        else:
+            keys.append(key_pool.ApiKey(entry.get("name", f"key {number}"), entry["api_key"],
+                                        int(entry.get("rpm", GEMINI_KEY_RPM))))
+    return keys
+
+@st.cache_resource
+def get_key_pool():
+    """The API keys every model call is spread over, each with a google.genai client of its own"""
+    slots = [key_pool.KeySlot(key, gemini_client.make_client(key.api_key, GEMINI_API_BASE)) for key in load_api_keys()]
+    return key_pool.KeyPool(slots, GEMINI_KEY_BACKOFF_BASE, GEMINI_KEY_BACKOFF_MAX)
+
+def create_model(model_name, system_instruction=None):
+    """Create a Gemini model spread over the key pool, or the offline stub when CHATBOT_STUB_MODEL=1"""
+    if USE_STUB_MODEL:
+        return StubModel(model_name, system_instruction=system_instruction)
+    pool = get_key_pool()
+    models = {slot.name: gemini_client.GeminiModel(slot.client, model_name, system_instruction) for slot in pool.slots}
+    return key_pool.PooledModel(pool, models, gemini_client.model_path(model_name), system_instruction)
+
+@st.cache_resource
+def get_model(model_name, system_instruction=None):
+    """One model client per name and system prompt, shared by every session"""
+    return create_model(model_name, system_instruction)
+
+class GatewayRateLimited(Exception):
+    """A student has used up their share of model calls for now"""
+    def __init__(self, wait):
+        super().__init__(f"You're asking questions faster than I can answer them. "
+                         f"Please wait about {wait:.0f}s and try again.")
+
+class TokenBucket:
+    """Token bucket used from the gateway's event loop; acquire() reserves a token and sleeps until it is due"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, max_wait=None):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        if max_wait is not None and wait > max_wait:
+            raise GatewayRateLimited(wait)
+        self.tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+
+class GatewayChunk:
+    """A piece of a (possibly shared) response, shaped like a Gemini stream chunk"""
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class SharedCall:
+    """One upstream model call whose output is replayed to every request coalesced onto it"""
+    def __init__(self):
+        self.chunks = []
+        self.usage_metadata = None
+        self.error = None
+        self.done = False
+        self.condition = threading.Condition()
+        # Requests reading this call; once they have all been cancelled it is stopped
+        self.readers = 0
+        self.cancelled = False
+        self.started = False
+        self.task = None
+
+    def add(self, text, usage_metadata=None):
+        with self.condition:
+            self.chunks.append(text)
+            self.usage_metadata = usage_metadata or self.usage_metadata
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def __iter__(self):
+        return self.follow()
+
+    def follow(self, job=None):
+        """Yield the chunks as they arrive; stops with JobCancelled once job is cancelled, even if
+        other requests still share the call"""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    if job is not None and job.cancelled:
+                        break
+                    self.condition.wait()
+                if job is not None and job.cancelled:
+                    raise jobs.JobCancelled(job.reason)
+                if index < len(self.chunks):
+                    text = self.chunks[index]
+                    index += 1
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    break
+            yield GatewayChunk(text)
+        # Usage is only known once the call is over, like the last chunk of a Gemini stream
+        yield GatewayChunk("", self.usage_metadata)
+
+    def result(self, job=None):
+        """Wait for the whole response (for non-streaming callers)"""
+        for _ in self.follow(job):
+            pass
+        return self
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+def is_retryable(error):
+    """Quota and overload errors are worth retrying; anything else is returned to the student"""
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    return code in (429, 503) or type(error).__name__ in ("ResourceExhausted", "ServiceUnavailable", "TooManyRequests")
+
+def request_key(model, contents, stream, kwargs):
+    """Key identical requests share, or None if the request can't be coalesced (e.g. it has an image)"""
+    system_instruction = getattr(model, "system_instruction", None) or getattr(model, "_system_instruction", None)
+    try:
+        payload = json.dumps([model.model_name, str(system_instruction or ""), contents, stream, kwargs], sort_keys=True)
+    except TypeError:
+        return None
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ModelGateway:
+    """Shared asyncio gateway: queues model calls, applies global and per-session rate limits,
+    retries quota errors with jittered backoff and coalesces identical in-flight requests"""
+    def __init__(self, max_concurrency=GATEWAY_MAX_CONCURRENCY):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="chatbot-gateway")
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.global_bucket = TokenBucket(GATEWAY_GLOBAL_RATE, GATEWAY_GLOBAL_BURST)
+        self.session_buckets = {}
+        self.inflight = {}
+        self.tasks = set()
+        # Metrics (only updated on the event loop thread)
+        self.requests = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.cancelled = 0
+        self.queue_depth = 0
+        self.wait_times = deque(maxlen=200)
+        threading.Thread(target=self.loop.run_forever, name="chatbot-gateway-loop", daemon=True).start()
+
+    def submit(self, model, contents, session_id, stream=False, kwargs=None, job=None):
+        """Queue a call from any thread; returns the SharedCall to iterate or wait on. Cancelling
+        job drops this request from the call, and stops the call once nobody else reads it."""
+        future = asyncio.run_coroutine_threadsafe(
+            self._enqueue(model, contents, session_id, stream, kwargs or {}), self.loop)
+        call = future.result()
+        if job is not None:
+            def cancel():
+                call.wake()
+                self.loop.call_soon_threadsafe(self._leave, call)
+            job.on_cancel(cancel)
+        return call
+
+    def _leave(self, call):
+        call.readers -= 1
+        if call.readers > 0 or call.done:
+            return
+        call.cancelled = True
+        # A queued call never starts; a running stream stops at its next chunk (see _run_upstream)
+        if not call.started and call.task is not None:
+            call.task.cancel()
+
+    def _session_bucket(self, session_id):
+        if len(self.session_buckets) > 1000:
+            # Forget students who have been idle long enough to have a full bucket again
+            idle = time.monotonic() - GATEWAY_SESSION_BURST / GATEWAY_SESSION_RATE
+            self.session_buckets = {sid: bucket for sid, bucket in self.session_buckets.items() if bucket.updated > idle}
+        if session_id not in self.session_buckets:
+            self.session_buckets[session_id] = TokenBucket(GATEWAY_SESSION_RATE, GATEWAY_SESSION_BURST)
+        return self.session_buckets[session_id]
+
+    def set_session_limit(self, session_id, rate, burst):
+        """Give one session its own rate limit (a batch run is only bound by the global limit)"""
+        self.loop.call_soon_threadsafe(self.session_buckets.__setitem__, session_id, TokenBucket(rate, burst))
+
+    async def _enqueue(self, model, contents, session_id, stream, kwargs):
+        self.requests += 1
+        key = request_key(model, contents, stream, kwargs)
+        if key is not None and key in self.inflight:
+            self.coalesced += 1
+            self.inflight[key].readers += 1
+            return self.inflight[key]
+        
+        call = SharedCall()
+        call.readers = 1
+        if key is not None:
+            self.inflight[key] = call
+        task = self.loop.create_task(self._lead(key, call, model, contents, session_id, stream, kwargs))
+        call.task = task
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(lambda task: self._settle(key, call))
+        return call
+
+    def _settle(self, key, call):
+        """Finish a call whose task was cancelled before it reached the model"""
+        if call.done:
+            return
+        self.cancelled += 1
+        jobs.STATS.add("model call", "stopped")
+        call.finish(jobs.JobCancelled("the answer is no longer needed"))
+        if key is not None and self.inflight.get(key) is call:
+            del self.inflight[key]
+
+    async def _lead(self, key, call, model, contents, session_id, stream, kwargs):
+        queued_at = time.perf_counter()
+        self.queue_depth += 1
+        queued = True
+        try:
+            await self._session_bucket(session_id).acquire(GATEWAY_MAX_WAIT)
+            for attempt in range(GATEWAY_MAX_RETRIES + 1):
+                await self.global_bucket.acquire()
+                async with self.semaphore:
+                    if queued:
+                        self.queue_depth -= 1
+                        queued = False
+                        self.wait_times.append(time.perf_counter() - queued_at)
+                    try:
+                        self.upstream_calls += 1
+                        call.started = True
+                        await self.loop.run_in_executor(
+                            self.executor, self._run_upstream, call, model, contents, stream, kwargs)
+                        break
+                    except Exception as e:
+                        # A stream that has already been shown can't be retried
+                        if attempt == GATEWAY_MAX_RETRIES or call.chunks or not is_retryable(e):
+                            raise
+                self.retries += 1
+                await asyncio.sleep(GATEWAY_BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5))
+            call.finish()
+        except GatewayRateLimited as e:
+            self.rate_limited += 1
+            call.finish(e)
+        except jobs.JobCancelled as e:
+            self.cancelled += 1
+            jobs.STATS.add("model call", "stopped")
+            call.finish(e)
+        except Exception as e:
+            call.finish(e)
+        finally:
+            if queued:
+                self.queue_depth -= 1
+            if key is not None and self.inflight.get(key) is call:
+                del self.inflight[key]
+
+    def _run_upstream(self, call, model, contents, stream, kwargs):
+        """Make the blocking SDK call on a gateway worker thread"""
+        response = model.generate_content(contents, stream=stream, **kwargs)
+        if stream:
+            chunks = iter(response)
+            try:
+                for chunk in chunks:
+                    if call.cancelled:
+                        # Nobody reads it any more, so stop downloading the rest of the answer
+                        raise jobs.JobCancelled("the answer is no longer needed")
+                    call.add(chunk.text or "", getattr(chunk, "usage_metadata", None))
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+        else:
+            call.add(response.text or "", getattr(response, "usage_metadata", None))
+
+    def stats(self):
+        waits = sorted(self.wait_times)
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "coalescing_ratio": self.coalesced / self.requests if self.requests else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "cancelled": self.cancelled,
+            "queue_depth": self.queue_depth,
+            "in_flight": len(self.inflight),
+            "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+        }
+
+@st.cache_resource
+def get_model_gateway():
+    """One gateway per process, shared by every session"""
+    return ModelGateway()
+
+class GatewayModel:
+    """A session's handle on a model; calls are routed through the shared gateway"""
+    def __init__(self, model, session_id):
+        self.model = model
+        self.model_name = model.model_name
+        self.session_id = session_id
+        # Looked up here because background threads can't reach st.cache_resource
+        self.gateway = get_model_gateway()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        # Calls made for a question are dropped when it is cancelled
+        job = jobs.current()
+        call = self.gateway.submit(self.model, contents, self.session_id, stream, kwargs, job)
+        if stream:
+            return self._stream(call, job)
+        call.result(job)
+        if job is not None:
+            job.record("model call")
+        return call
+
+    def _stream(self, call, job):
+        yield from call.follow(job)
+        if job is not None:
+            job.record("model call")
+
+@st.cache_resource
+def get_trace_exporter():
+    """Span exporter shared by every session, or None when no trace file or collector is configured"""
+    if TRACE_FILE or TRACE_OTLP_ENDPOINT:
+        return tracing.Exporter(TRACE_FILE, TRACE_OTLP_ENDPOINT)
+    return None
+
+@st.cache_resource
+def get_background_executor():
+    """Thread pool shared by all sessions for work that overlaps the streamed answer"""
+    # A question can keep two workers busy (its graph and its image), so this covers four at once
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="chatbot-bg")
+
+def _copy_outcome(source, target):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+class AnswerStages:
+    """The parts of one answer that don't need the script thread (graph code, graph render, AI
+    image), run on the background pool as a small dependency graph: a stage starts as soon as
+    the stage it depends on has finished, so the rest overlap each other and the streamed answer."""
+    def __init__(self, executor=None):
+        self.executor = executor or get_background_executor()
+        self.futures = {}
+        self.durations = {}
+        # Stages still queued when the question is cancelled never start
+        self.job = jobs.current()
+
+    def start(self, name, fn, *args, after=None):
+        """Run fn(*args) now, or fn(result of the `after` stage, *args) once that stage is done"""
+        # Bound now, so spans made on the worker join the request's trace
+        run = tracing.bind(self._timed)
+        if after is None:
+            future = self.executor.submit(run, name, fn, *args)
+        else:
+            future = Future()
+            def launch(dependency):
+                if future.cancelled():
+                    return
+                if dependency.cancelled() or dependency.exception() is not None:
+                    _copy_outcome(dependency, future)
+                    return
+                try:
+                    inner = self.executor.submit(run, name, fn, dependency.result(), *args)
+                except RuntimeError as e:
+                    # The pool is shutting down; don't leave the page waiting forever
+                    future.set_exception(e)
+                    return
+                inner.add_done_callback(lambda done: _copy_outcome(done, future))
+            self.futures[after].add_done_callback(launch)
+        self.futures[name] = future
+        if self.job is not None:
+            self.job.on_cancel(future.cancel)
+        return future
+
+    def _timed(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.durations[name] = time.perf_counter() - start
+
+    def finish(self, name, result):
+        """Add a stage whose result is already known, e.g. a precomputed graph"""
+        future = Future()
+        future.set_result(result)
+        self.futures[name] = future
+
+    def get(self, name):
+        """The future of a stage, or None if it wasn't started"""
+        return self.futures.get(name)
+
+    def as_completed(self, names):
+        """Yield the named stages that were started, in the order they finish"""
+        pending = {self.futures[name]: name for name in names if name in self.futures}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future)
+
+# Words that don't change what a question is asking
+STOP_WORDS = {"a", "an", "the", "is", "are", "of", "to", "for", "in", "on", "at", "and",
+              "what", "find", "calculate", "please", "me", "can", "you", "how", "do", "i"}
+
+# Numbers (including 3e8 style exponents) and operators must match exactly for a near-duplicate hit
+NUMERIC_TOKEN = re.compile(r"\d+(?:\.\d+)?(?:e[-+]?\d+)?|[-+*/^=<>]")
+
+def normalize_question(text):
+    """Normalize case, unicode and whitespace so trivially different questions share a cache key"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?.!")
+
+def question_fingerprint(normalized):
+    """Split a normalized question into its numeric signature and its content words, in order"""
+    signature = "|".join(NUMERIC_TOKEN.findall(normalized))
+    words = " ".join(word for word in re.findall(r"[a-z]+", NUMERIC_TOKEN.sub(" ", normalized))
+                     if word not in STOP_WORDS)
+    return signature, words
+
+class AnswerCache:
+    """Persistent answer cache shared by all sessions, with TTL expiry and LRU eviction"""
+    def __init__(self, path, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
         
-        # Create a unique temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-            tmp_filename = tmp_file.name
+        with self.lock, self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY, model TEXT, difficulty TEXT, signature TEXT, words TEXT,
+                answer TEXT, latency REAL, created REAL, last_used REAL)""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS answers_lookup ON answers (model, difficulty, signature)")
+
+    def _key(self, normalized, difficulty, model_name):
+        return hashlib.sha256(f"{model_name}\n{difficulty}\n{normalized}".encode()).hexdigest()
+
+    def _find_near_duplicate(self, normalized, difficulty, model_name):
+        """Find a cached question with the same numbers, operators and content words in the same order"""
+        signature, words = question_fingerprint(normalized)
+        if not words:
+            return None
+        return self.conn.execute(
+            "SELECT key, answer, latency FROM answers WHERE model = ? AND difficulty = ? AND signature = ? AND words = ? "
+            "ORDER BY last_used DESC LIMIT 1", (model_name, difficulty, signature, words)).fetchone()
+
+    def get(self, question, difficulty, model_name, fuzzy=False):
+        """Return a cached answer, or None on a miss. With fuzzy, a question that differs only in
+        punctuation, spacing, case or stop words also hits."""
+        normalized = normalize_question(question)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            row = self.conn.execute("SELECT key, answer, latency FROM answers WHERE key = ?",
+                                    (self._key(normalized, difficulty, model_name),)).fetchone()
+            near = False
+            if row is None and fuzzy:
+                row = self._find_near_duplicate(normalized, difficulty, model_name)
+                near = row is not None
+            
+            if row is None:
+                self.misses += 1
+                return None
+            
+            key, answer, latency = row
+            self.conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            if near:
+                self.near_hits += 1
+            self.saved_seconds += latency or 0.0
+            return answer
+
+    def put(self, question, difficulty, model_name, answer, latency):
+        """Store an answer and evict the least recently used entries past the size limit"""
+        normalized = normalize_question(question)
+        signature, words = question_fingerprint(normalized)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (self._key(normalized, difficulty, model_name), model_name, difficulty,
+                               signature, words, answer, latency, now, now))
+            count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,))
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {"hits": self.hits, "near_hits": self.near_hits, "misses": self.misses,
+                "entries": entries, "saved_seconds": self.saved_seconds}
+
+@st.cache_resource
+def get_answer_cache():
+    """One answer cache per process, shared by every session"""
+    return AnswerCache(os.path.join(CACHE_DIR, "answers.sqlite3"))
+
+class ChatMessage:
+    """One chat turn; images are kept in the media store and referenced by hash. An answer can
+    have both an AI image and a graph, so the graph has its own field."""
+    __slots__ = ("role", "content", "image", "graph")
+
+    def __init__(self, role, content, image=None, graph=None):
+        self.role = role
+        self.content = content
+        self.image = image
+        self.graph = graph
+
+class MediaStore:
+    """History images stored once on disk by content hash, with the most recently used kept in memory.
+    Past max_bytes the least recently shown images are deleted and drop out of old chats."""
+    def __init__(self, directory, memory_items=MEDIA_MEMORY_ITEMS, max_bytes=MEDIA_CACHE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.budget = DiskBudget(directory, max_bytes)
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _remember(self, digest, data):
+        with self.lock:
+            self.memory[digest] = data
+            self.memory.move_to_end(digest)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def put(self, data, max_size):
+        """Store the image shrunk to max_size pixels a side and return its hash"""
+        digest = hashlib.sha256(f"{max_size}\n".encode() + data).hexdigest()
+        path = os.path.join(self.directory, digest)
+        if os.path.exists(path):
+            self.budget.touch(path)
+            return digest
+        image = Image.open(BytesIO(data))
+        # Photos stay JPEG; graphs and anything with transparency stay PNG
+        image_format = "JPEG" if image.format == "JPEG" else "PNG"
+        image.thumbnail((max_size, max_size))
+        buf = BytesIO()
+        image.save(buf, format=image_format, optimize=True)
+        write_file_atomic(path, buf.getvalue())
+        self.budget.added(buf.tell())
+        return digest
+
+    def get(self, digest):
+        """Return the image bytes, or None if the file has gone"""
+        path = os.path.join(self.directory, digest)
+        with self.lock:
+            data = self.memory.get(digest)
+            if data is not None:
+                self.memory.move_to_end(digest)
+        if data is None:
+            try:
+                with open(path, 'rb') as media_file:
+                    data = media_file.read()
+            except OSError:
+                return None
+            self._remember(digest, data)
+        # Images still being shown keep their place on disk
+        self.budget.touch(path)
+        return data
+
+@st.cache_resource
+def get_media_store():
+    """Media store shared by every session"""
+    return MediaStore(os.path.join(CACHE_DIR, "media"))
+
+def session_footprint():
+    """Approximate bytes held by this session's chat history and attached uploads"""
+    messages = st.session_state.messages
+    size = sys.getsizeof(messages)
+    for message in messages:
+        size += sys.getsizeof(message) + sys.getsizeof(message.content)
+    for upload in st.session_state.get("uploads", {}).values():
+        size += len(upload.jpeg_bytes) + upload.image.width * upload.image.height * 3
+    return size
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token) that needs no API call"""
+    return len(text) // 4 + 1
+
+def summarize_turns(model, summary, turns):
+    """Fold older conversation turns into the running summary (runs in a background thread)"""
+    transcript = "\n".join(
+        f"{'Tutor' if turn.role == 'assistant' else 'Student'}: {turn.content}" for turn in turns)
+    response = model.generate_content(
+        f"Update the summary of a tutoring conversation in under {CONTEXT_SUMMARY_WORDS} words. "
+        "Keep the problems discussed, given values, key formulas and final answers, and note which parts "
+        f"have been solved.\n\nCurrent summary: {summary or '(none)'}\n\nNew turns:\n{transcript}")
+    return response.text.strip()
+
+class ConversationContext:
+    """Bounded conversation history: a rolling summary of older turns plus the recent turns that fit the token budget"""
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET):
+        self.budget = budget
+        self.summary = ""
+        self.summarized_upto = 0
+        self.pending = None
+
+    def _apply_finished_summary(self):
+        if self.pending is None or not self.pending[0].done():
+            return
+        future, upto = self.pending
+        self.pending = None
+        try:
+            self.summary = future.result() or self.summary
+            self.summarized_upto = upto
+        except Exception:
+            # Leave the turns unsummarized; they are retried on the next question
+            pass
+
+    def build(self, history, question_parts, summarizer_model):
+        """Return (Gemini contents, estimated tokens) for the history followed by the new question"""
+        self._apply_finished_summary()
+        used = estimate_tokens(self.summary) + sum(estimate_tokens(part) for part in question_parts
+                                                   if isinstance(part, str))
         
-        # Generate speech
-        engine.save_to_file(clean_text, tmp_filename)
-        engine.runAndWait()
-        engine.stop()
+        # Walk back from the newest turn until the budget is spent
+        start = len(history)
+        for i in range(len(history) - 1, self.summarized_upto - 1, -1):
+            cost = estimate_tokens(history[i].content)
+            if used + cost > self.budget:
+                break
+            used += cost
+            start = i
         
-        # Wait a moment for file to be written
-        import time
-        time.sleep(0.1)
+        # Turns that no longer fit are summarized in the background, ready for the next question
+        if start > self.summarized_upto and self.pending is None:
+            future = get_background_executor().submit(
+                summarize_turns, summarizer_model, self.summary, history[self.summarized_upto:start])
+            self.pending = (future, start)
         
-        # Read the file
-        if os.path.exists(tmp_filename):
-            with open(tmp_filename, 'rb') as audio_file:
-                audio_bytes = audio_file.read()
-            
-            # Clean up
+        contents = []
+        if self.summary:
+            add_turn(contents, "user", f"Summary of our earlier conversation: {self.summary}")
+            add_turn(contents, "model", "Thanks, I'll keep that in mind.")
+        for message in history[start:]:
+            # Failed requests are not part of the conversation
+            if message.content.startswith("⚠️"):
+                continue
+            add_turn(contents, "model" if message.role == "assistant" else "user", message.content)
+        for part in question_parts:
+            add_turn(contents, "user", part)
+        return contents, used
+
+    def reset(self):
+        self.__init__(self.budget)
+
+def add_turn(contents, role, part):
+    """Append a part, merging it into the previous turn if the role repeats (Gemini wants alternating roles)"""
+    if contents and contents[-1]["role"] == role:
+        contents[-1]["parts"].append(part)
+    else:
+        contents.append({"role": role, "parts": [part]})
+
+# Questions that refer back to earlier turns depend on the conversation, so they bypass the answer cache
+FOLLOW_UP = re.compile(r"^(now|and|also|then|so|ok|okay|what about|how about)\b|"
+                       r"\b(part|previous|above|that|this|it|same|again|last|earlier)\b")
+
+def is_follow_up(question, history):
+    if not history:
+        return False
+    return len(question.split()) <= 4 or bool(FOLLOW_UP.search(question.lower()))
+
+@st.cache_resource
+def get_intent_router():
+    """The intent router, shared by every session (training the optional classifier takes a few ms)"""
+    classifier = None
+    if USE_ROUTER_CLASSIFIER and os.path.exists(INTENT_PROMPTS_PATH):
+        classifier = intent_router.NaiveBayes(intent_router.load_examples(INTENT_PROMPTS_PATH))
+    return intent_router.IntentRouter(classifier, ROUTER_CLASSIFIER_THRESHOLD)
+
+@st.cache_resource
+def get_tier_policy():
+    """The model tier policy and its per-tier statistics, shared by every session"""
+    return model_tiers.TierPolicy(MODEL_TIERS)
+
+@st.cache_resource
+def get_local_solver():
+    """The built-in solver for textbook formula and algebra questions, shared by every session"""
+    solver = local_solver.LocalSolver(workers=SOLVER_WORKERS, time_limit=SOLVER_TIME_LIMIT)
+    solver.warm()
+    return solver
+
+@st.cache_resource
+def get_example_bank():
+    """The curated example questions, or none if the file is missing"""
+    return example_bank.load_bank(EXAMPLES_PATH) if os.path.exists(EXAMPLES_PATH) else []
+
+@st.cache_resource
+def get_example_store():
+    """Precomputed example answers for the current model and system prompt, shared by every session"""
+    return example_bank.ExampleStore(os.path.join(CACHE_DIR, "examples"),
+                                     example_bank.store_version(MODEL_NAME, SYSTEM_PROMPT))
+
+def initialize_session_state():
+    if "messages" not in st.session_state:
+        st.session_state.messages = []
+    if "session_id" not in st.session_state:
+        # Identifies the student to the gateway's per-session rate limit
+        st.session_state.session_id = uuid.uuid4().hex
+    session_id = st.session_state.session_id
+    if "model" not in st.session_state:
+        # The persona is a system instruction, so it isn't repeated inside the conversation.
+        # The clients are shared across sessions; only the gateway wrapper is per session.
+        st.session_state.model = GatewayModel(get_model(MODEL_NAME, SYSTEM_PROMPT), session_id)
+    if "vision_model" not in st.session_state:
+        st.session_state.vision_model = GatewayModel(get_model(MODEL_NAME, SYSTEM_PROMPT), session_id)
+    if "tier_models" not in st.session_state:
+        st.session_state.tier_models = {tier.name: GatewayModel(get_model(tier.model_name, SYSTEM_PROMPT), session_id)
+                                        for tier in MODEL_TIERS}
+    if "utility_model" not in st.session_state:
+        # Graph code and conversation summaries don't need the tutor persona
+        st.session_state.utility_model = GatewayModel(get_model(MODEL_NAME), session_id)
+    if "context" not in st.session_state:
+        st.session_state.context = ConversationContext()
+    if "response_metrics" not in st.session_state:
+        st.session_state.response_metrics = []
+    if "speech_jobs" not in st.session_state:
+        st.session_state.speech_jobs = []
+    if "active_job" not in st.session_state:
+        st.session_state.active_job = None
+    if "messages_shown" not in st.session_state:
+        st.session_state.messages_shown = CHAT_PAGE_SIZE
+    if "render_times" not in st.session_state:
+        st.session_state.render_times = deque(maxlen=20)
+    if "traces" not in st.session_state:
+        st.session_state.traces = deque(maxlen=TRACE_HISTORY)
+
+def write_file_atomic(path, data):
+    """Write then rename so other sessions never read a half-written cache file"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as cache_file:
+        cache_file.write(data)
+    os.replace(tmp_path, path)
+
+class DiskBudget:
+    """Caps the total size of a cache directory, deleting the least recently used files first.
+    Reads refresh a file's modification time, so it doubles as its last use."""
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total = None
+
+    def _files(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+                except OSError:
+                    # Deleted by another process in the meantime
+                    continue
+        return files
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def added(self, size):
+        """Count a newly written file, evicting old files once the directory is over its limit"""
+        with self.lock:
+            if self.total is None:
+                self.total = sum(size for _, size, _ in self._files())
+            else:
+                self.total += size
+            if self.total <= self.max_bytes:
+                return
+            # Other processes may share the directory, so the real size is taken from disk
+            files = sorted(self._files())
+            self.total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if self.total <= self.max_bytes * CACHE_EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.total -= size
+
+class TTSEngine:
+    """A long-lived pyttsx3 engine owned by one thread. pyttsx3's drivers aren't thread-safe, so
+    the engine is created and driven on that thread, and the TTS workers queue text for it."""
+    def __init__(self):
+        self.requests = queue.Queue()
+        started = Future()
+        threading.Thread(target=self._run, args=(started,), name="chatbot-pyttsx3", daemon=True).start()
+        # Raises if pyttsx3 couldn't start, so gTTS is used instead
+        started.result()
+
+    def _run(self, started):
+        try:
+            if sys.platform == "win32":
+                # SAPI5 is a COM object, and COM is initialized per thread
+                import comtypes
+                comtypes.CoInitialize()
+            import pyttsx3
+            engine = pyttsx3.init()
+            engine.setProperty('rate', TTS_RATE)
+        except Exception as e:
+            started.set_exception(e)
+            return
+        started.set_result(None)
+        # pyttsx3 can only synthesize to a file, so one scratch file per process is reused
+        scratch_path = os.path.join(tempfile.gettempdir(), f"chatbot-tts-{os.getpid()}.wav")
+        while True:
+            text, future = self.requests.get()
             try:
-                os.unlink(tmp_filename)
-            except:
-                pass
-            
-            return audio_bytes
-        else:
-            raise Exception("Audio file was not created")
+                engine.save_to_file(text, scratch_path)
+                # runAndWait only returns once the file has been completely written
+                engine.runAndWait()
+                with open(scratch_path, 'rb') as audio_file:
+                    future.set_result(audio_file.read())
+            except Exception as e:
+                future.set_exception(e)
+
+    def synthesize(self, text):
+        future = Future()
+        self.requests.put((text, future))
+        return future.result()
+
+class StubTTSEngine:
+    """Offline stand-in for pyttsx3: silence of a plausible length after a delay proportional to the text"""
+    def __init__(self):
+        self.delay = float(os.environ.get("CHATBOT_STUB_TTS_DELAY", "0.002"))
+
+    def synthesize(self, text):
+        time.sleep(self.delay * len(text))
+        buf = BytesIO()
+        with wave.open(buf, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            # Roughly 15 characters are spoken per second
+            wav.writeframes(b"\0\0" * (16000 * len(text) // 15))
+        return buf.getvalue()
+
+@st.cache_resource
+def get_tts_engine():
+    """Initialize pyttsx3 once per process; None means it is unavailable and gTTS is used"""
+    if USE_STUB_TTS:
+        return StubTTSEngine()
+    try:
+        return TTSEngine()
+    except Exception:
+        return None
+
+class AudioCache:
+    """Synthesized audio on disk, keyed by a hash of the spoken text, with LRU eviction by size"""
+    def __init__(self, directory, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.budget = DiskBudget(directory, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, text):
+        digest = hashlib.sha256(f"{TTS_RATE}\n{text}".encode()).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def get(self, text):
+        path = self._path(text)
+        try:
+            with open(path, 'rb') as audio_file:
+                audio_bytes = audio_file.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self.budget.touch(path)
+        self.hits += 1
+        return audio_bytes
+
+    def put(self, text, audio_bytes):
+        write_file_atomic(self._path(text), audio_bytes)
+        self.budget.added(len(audio_bytes))
+
+@st.cache_resource
+def get_audio_cache():
+    """Audio cache shared by every session"""
+    return AudioCache(os.path.join(CACHE_DIR, "audio"))
+
+def compress_audio(wav_bytes):
+    """Encode WAV to MP3 when lameenc is installed, otherwise return the WAV unchanged"""
+    try:
+        import lameenc
         
+        with wave.open(BytesIO(wav_bytes)) as wav:
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            sample_rate = wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+        if sample_width != 2:
+            return wav_bytes
+        
+        encoder = lameenc.Encoder()
+        encoder.set_bit_rate(TTS_MP3_BITRATE)
+        encoder.set_in_sample_rate(sample_rate)
+        encoder.set_channels(channels)
+        encoder.set_quality(5)
+        return bytes(encoder.encode(frames) + encoder.flush())
+    except Exception:
+        return wav_bytes
+
+def audio_mime_type(audio_bytes):
+    """pyttsx3 audio stays WAV if it couldn't be compressed; everything else is MP3"""
+    return "audio/wav" if audio_bytes[:4] == b"RIFF" else "audio/mpeg"
+
+def clean_text_for_speech(text):
+    # Remove markdown formatting for better speech
+    return text.replace('**', '').replace('*', '').replace('#', '').replace('`', '').strip()
+
+def text_to_speech(text):
+    """Convert text to speech with robust error handling"""
+    clean_text = clean_text_for_speech(text)
+    
+    # Repeated answers (including cached ones) reuse the audio from last time
+    audio_cache = get_audio_cache()
+    audio_bytes = audio_cache.get(clean_text)
+    if audio_bytes is not None:
+        return audio_bytes
+    
+    try:
+        engine = get_tts_engine()
+        if engine is None:
+            raise Exception("pyttsx3 is not available")
+        with tracing.span("tts.synthesize", chars=len(clean_text)):
+            wav_bytes = engine.synthesize(clean_text)
+        with tracing.span("tts.compress", wav_bytes=len(wav_bytes)):
+            audio_bytes = compress_audio(wav_bytes)
     except Exception as e:
         # Fallback to gTTS if pyttsx3 fails
         try:
             from gtts import gTTS
-            clean_text = text.replace('**', '').replace('*', '').replace('#', '')
-            if len(clean_text) > 1000:
-                clean_text = clean_text[:1000]
             
-            tts = gTTS(text=clean_text, lang='en', slow=False)
-            audio_buffer = BytesIO()
-            tts.write_to_fp(audio_buffer)
-            audio_buffer.seek(0)
-            return audio_buffer.getvalue()
+            with tracing.span("tts.gtts", chars=len(clean_text)):
+                tts = gTTS(text=clean_text, lang='en', slow=False)
+                audio_buffer = BytesIO()
+                tts.write_to_fp(audio_buffer)
+                audio_bytes = audio_buffer.getvalue()
         except Exception as e2:
             return None
+    
+    if audio_bytes:
+        audio_cache.put(clean_text, audio_bytes)
+    return audio_bytes
 
-def generate_image_with_api(prompt):
-    """Generate images using multiple free APIs with fallback options"""
-    try:
-        # Clean the prompt
-        clean_prompt = prompt.replace('\n', ' ').strip()
-        
-        # Try multiple APIs in order of quality
-        apis = [
-            {
-                "name": "Hugging Face (Stable Diffusion XL)",
-                "url": "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0",
-                "method": "POST",
-                "headers": {"Content-Type": "application/json"},
-                "data": {"inputs": clean_prompt}
-            },
-            {
-                "name": "Hugging Face (Stable Diffusion 2.1)",
-                "url": "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-2-1",
-                "method": "POST",
-                "headers": {"Content-Type": "application/json"},
-                "data": {"inputs": clean_prompt}
-            },
-            {
-                "name": "Segmind Stable Diffusion",
-                "url": "https://api.segmind.com/v1/sd2.1-txt2img",
-                "method": "POST",
-                "headers": {"Content-Type": "application/json"},
-                "data": {
-                    "prompt": clean_prompt,
-                    "negative_prompt": "blurry, low quality, distorted, ugly, bad anatomy",
-                    "samples": 1,
-                    "scheduler": "UniPC",
-                    "num_inference_steps": 25,
-                    "guidance_scale": 7.5,
-                    "seed": -1,
-                    "img_width": 768,
-                    "img_height": 768,
-                    "base64": False
-                }
-            },
-            {
-                "name": "Prodia AI (Realistic)",
-                "url": f"https://image.prodia.ai/generate?prompt={requests.utils.quote(clean_prompt)}&model=realisticVisionV51_v51VAE.safetensors",
-                "method": "GET"
-            },
-            {
-                "name": "Pollinations AI (Flux)",
-                "url": f"https://image.pollinations.ai/prompt/{requests.utils.quote(clean_prompt)}",
-                "params": {
-                    "width": 1024,
-                    "height": 1024,
-                    "model": "flux",
-                    "nologo": "true",
-                    "enhance": "true"
-                },
-                "method": "GET"
+@st.cache_resource
+def get_tts_executor():
+    """Worker pool that synthesizes speech chunks off the script run"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="chatbot-tts")
+
+# A sentence ends at . ! ? or : followed by whitespace (so 3.5 isn't split), or at a line break
+SENTENCE_END = re.compile(r"(?<=[.!?:])\s+|\n+")
+
+class SpeechJob:
+    """Sentence-chunked background synthesis of one answer, delivered to the browser in order"""
+    def __init__(self, metrics=None):
+        self.executor = get_tts_executor()
+        self.metrics = metrics if metrics is not None else {}
+        self.futures = []
+        self.buffer = ""
+        self.delivered = 0
+        self.finished = False
+        self.started = time.perf_counter()
+        # Audio is embedded in later fragment runs; this keeps those spans in the request's trace
+        self.span = tracing.current_span()
+        self.job = jobs.current()
+        if self.job is not None:
+            self.job.on_cancel(self._cancel)
+
+    def _cancel(self):
+        """Drop the speech nobody will hear: queued chunks never start, synthesized ones are wasted"""
+        unplayed = self.futures[self.delivered:]
+        stopped = sum(1 for future in unplayed if future.cancel())
+        jobs.STATS.add("speech chunk", "stopped", stopped)
+        jobs.STATS.add("speech chunk", "wasted", len(unplayed) - stopped)
+
+    def feed(self, text):
+        """Add answer text; every complete group of sentences is queued for synthesis"""
+        self.buffer += text
+        self._queue_chunks()
+
+    def finish(self):
+        """The answer is complete, so whatever is left is the last chunk"""
+        self.finished = True
+        self._queue_chunks()
+
+    def _queue_chunks(self):
+        while True:
+            min_chars = TTS_FIRST_CHUNK_CHARS if not self.futures else TTS_CHUNK_CHARS
+            cut = next((match.end() for match in SENTENCE_END.finditer(self.buffer) if match.end() >= min_chars), None)
+            if cut is None:
+                if not (self.finished and self.buffer):
+                    return
+                cut = len(self.buffer)
+            chunk, self.buffer = self.buffer[:cut], self.buffer[cut:]
+            # Skip chunks with nothing to say, e.g. a markdown rule
+            if re.search(r"\w", chunk):
+                self.futures.append(self.executor.submit(tracing.bind(text_to_speech), chunk))
+
+    def ready_chunks(self):
+        """Return the audio of chunks that are ready, stopping at the first one still being synthesized"""
+        chunks = []
+        if self.cancelled:
+            return chunks
+        while self.delivered < len(self.futures) and self.futures[self.delivered].done():
+            try:
+                audio_bytes = self.futures[self.delivered].result()
+            except Exception:
+                audio_bytes = None
+            self.delivered += 1
+            if audio_bytes:
+                chunks.append(audio_bytes)
+        if chunks and "ttfa" not in self.metrics:
+            self.metrics["ttfa"] = time.perf_counter() - self.started
+        # Counted as delivered once sent to the player
+        jobs.STATS.add("speech chunk", "delivered", len(chunks))
+        return chunks
+
+    @property
+    def cancelled(self):
+        return self.job is not None and self.job.cancelled
+
+    @property
+    def done(self):
+        return self.cancelled or (self.finished and self.delivered == len(self.futures))
+
+def play_audio_chunks(chunks):
+    """Queue audio on a player that lives in the parent page, so chunks play back to back"""
+    sources = []
+    for audio_bytes in chunks:
+        # Convert audio bytes to base64 for HTML embedding
+        audio_base64 = base64.b64encode(audio_bytes).decode()
+        sources.append(f"data:{audio_mime_type(audio_bytes)};base64,{audio_base64}")
+    
+    # The player is created in the parent page's context so it keeps playing after this iframe is replaced
+    components.html(f"""
+        <script>
+        const page = window.parent;
+        if (!page.__chatbotAudio) {{
+            page.__chatbotAudio = new page.Function(`
+                const queue = [];
+                let playing = false;
+                function playNext() {{
+                    if (playing || queue.length === 0) return;
+                    playing = true;
+                    const audio = new Audio(queue.shift());
+                    const next = () => {{ playing = false; playNext(); }};
+                    audio.onended = next;
+                    audio.onerror = next;
+                    audio.play().catch(next);
+                }}
+                return {{ push(sources) {{ queue.push(...sources); playNext(); }} }};
+            `)();
+        }}
+        page.__chatbotAudio.push({json.dumps(sources)});
+        </script>
+    """, height=0)
+
+@st.fragment(run_every=TTS_POLL_INTERVAL)
+def deliver_speech():
+    """Play speech chunks as the background workers finish them"""
+    for job in st.session_state.speech_jobs:
+        chunks = job.ready_chunks()
+        if chunks:
+            with tracing.span("tts.embed", parent=job.span, chunks=len(chunks)):
+                play_audio_chunks(chunks)
+    for job in st.session_state.speech_jobs:
+        if job.done and job.job is not None:
+            # The question's work is all delivered once its speech has been played
+            job.job.close()
+    st.session_state.speech_jobs = [job for job in st.session_state.speech_jobs if not job.done]
+
+class ImageProviderError(Exception):
+    """An image provider answered, but not with a usable image"""
+
+class ImageRaceCancelled(Exception):
+    """Another provider won the race before this one finished"""
+
+class ProviderHealth:
+    """Rolling latency and error rate per image provider, plus a circuit breaker for each one"""
+    def __init__(self, window=20, threshold=IMAGE_BREAKER_THRESHOLD, cooldown=IMAGE_BREAKER_COOLDOWN):
+        self.window = window
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.histograms = {}
+        self.consecutive_failures = {}
+        self.opened_at = {}
+
+    def record(self, name, latency, ok):
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=self.window)).append((latency, ok))
+            
+            histogram = self.histograms.setdefault(name, [0] * (len(IMAGE_LATENCY_BUCKETS) + 1))
+            bucket = next((i for i, edge in enumerate(IMAGE_LATENCY_BUCKETS) if latency <= edge),
+                          len(IMAGE_LATENCY_BUCKETS))
+            histogram[bucket] += 1
+            
+            if ok:
+                self.consecutive_failures[name] = 0
+                self.opened_at.pop(name, None)
+            else:
+                self.consecutive_failures[name] = self.consecutive_failures.get(name, 0) + 1
+                # A failed trial after the cool-down re-opens the breaker straight away
+                if self.consecutive_failures[name] >= self.threshold:
+                    self.opened_at[name] = time.time()
+
+    def breaker_state(self, name):
+        """Return "closed", "open" or "half-open" (cool-down over, next request is a trial)"""
+        with self.lock:
+            opened_at = self.opened_at.get(name)
+        if opened_at is None:
+            return "closed"
+        if time.time() - opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def cooldown_left(self, name):
+        with self.lock:
+            opened_at = self.opened_at.get(name)
+        if opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.time() - opened_at))
+
+    def available(self, apis):
+        """Drop providers whose breaker is open, unless that would leave nothing to try"""
+        usable = [api for api in apis if self.breaker_state(api["name"]) != "open"]
+        return usable or list(apis)
+
+    def summary(self, name):
+        with self.lock:
+            samples = list(self.samples.get(name, ()))
+        if not samples:
+            return None
+        return {
+            "latency": sum(latency for latency, _ in samples) / len(samples),
+            "error_rate": sum(1 for _, ok in samples if not ok) / len(samples),
+            "count": len(samples),
+        }
+
+    def expected_cost(self, name):
+        """Rough seconds until this provider returns a valid image"""
+        summary = self.summary(name)
+        if summary is None:
+            return IMAGE_UNTRIED_COST
+        return summary["latency"] + summary["error_rate"] * IMAGE_FAILURE_PENALTY
+
+    def rank(self, apis):
+        # sorted() is stable, so providers with equal cost keep their default quality order
+        return sorted(apis, key=lambda api: self.expected_cost(api["name"]))
+
+@st.cache_resource
+def get_provider_health():
+    """Provider health shared by every session"""
+    return ProviderHealth()
+
+class ProviderSessions:
+    """One pooled keep-alive requests.Session per image provider (requests is only imported once
+    an image is actually fetched)"""
+    def __init__(self, pool_size=8):
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.sessions:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.sessions[name] = session
+            return self.sessions[name]
+
+@st.cache_resource
+def get_provider_sessions():
+    """HTTP sessions shared by every session, so connections and TLS handshakes are reused"""
+    return ProviderSessions()
+
+@st.cache_resource
+def get_image_executor():
+    """Thread pool used to race image providers"""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="chatbot-image")
+
+def build_image_providers(clean_prompt):
+    """List the free image APIs in order of quality"""
+    apis = [
+        {
+            "name": "Hugging Face (Stable Diffusion XL)",
+            "url": "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0",
+            "method": "POST",
+            "headers": {"Content-Type": "application/json"},
+            "data": {"inputs": clean_prompt}
+        },
+        {
+            "name": "Hugging Face (Stable Diffusion 2.1)",
+            "url": "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-2-1",
+            "method": "POST",
+            "headers": {"Content-Type": "application/json"},
+            "data": {"inputs": clean_prompt}
+        },
+        {
+            "name": "Segmind Stable Diffusion",
+            "url": "https://api.segmind.com/v1/sd2.1-txt2img",
+            "method": "POST",
+            "headers": {"Content-Type": "application/json"},
+            "data": {
+                "prompt": clean_prompt,
+                "negative_prompt": "blurry, low quality, distorted, ugly, bad anatomy",
+                "samples": 1,
+                "scheduler": "UniPC",
+                "num_inference_steps": 25,
+                "guidance_scale": 7.5,
+                "seed": -1,
+                "img_width": 768,
+                "img_height": 768,
+                "base64": False
             }
-        ]
-        
+        },
+        {
+            "name": "Prodia AI (Realistic)",
+            "url": f"https://image.prodia.ai/generate?prompt={quote(clean_prompt)}&model=realisticVisionV51_v51VAE.safetensors",
+            "method": "GET"
+        },
+        {
+            "name": "Pollinations AI (Flux)",
+            "url": f"https://image.pollinations.ai/prompt/{quote(clean_prompt)}",
+            "params": {
+                "width": 1024,
+                "height": 1024,
+                "model": "flux",
+                "nologo": "true",
+                "enhance": "true"
+            },
+            "method": "GET"
+        }
+    ]
+    
+    # Redirect every provider to a local stand-in for offline testing
+    if IMAGE_API_BASE:
         for api in apis:
-            try:
-                with st.spinner(f"🎨 Generating with {api['name']}..."):
-                    if api["method"] == "GET":
-                        # Build URL with parameters
-                        url = api["url"]
-                        if "params" in api:
-                            params_str = "&".join([f"{k}={v}" for k, v in api["params"].items()])
-                            url = f"{url}?{params_str}"
-                        
-                        response = requests.get(url, timeout=90)
-                    else:
-                        response = requests.post(
-                            api["url"],
-                            headers=api.get("headers", {}),
-                            json=api.get("data", {}),
-                            timeout=90
-                        )
-                    
-                    if response.status_code == 200:
-                        try:
-                            image = Image.open(BytesIO(response.content))
-                            st.success(f"✅ Image generated successfully using {api['name']}!")
-                            return image
-                        except:
-                            st.warning(f"⚠️ {api['name']} returned invalid image, trying next option...")
-                            continue
-                    else:
-                        st.warning(f"⚠️ {api['name']} returned status {response.status_code}, trying next option...")
-            except requests.Timeout:
-                st.warning(f"⚠️ {api['name']} timed out, trying next option...")
-                continue
-            except Exception as e:
-                st.warning(f"⚠️ {api['name']} failed: {str(e)[:50]}... Trying next option...")
-                continue
+            api["url"] = re.sub(r"^https?://[^/]+", IMAGE_API_BASE.rstrip("/"), api["url"])
+    
+    return apis
+
+def fetch_provider_image(api, health, session, timeout=IMAGE_PROVIDER_TIMEOUT, cancel_event=None):
+    """Request an image from one provider and return it, raising on failure (safe to call from a worker thread)"""
+    with tracing.span("image.provider", provider=api["name"]):
+        start = time.perf_counter()
+        try:
+            if api["method"] == "GET":
+                # Build URL with parameters
+                url = api["url"]
+                if "params" in api:
+                    params_str = "&".join([f"{k}={v}" for k, v in api["params"].items()])
+                    url = f"{url}?{params_str}"
+            
+                response = session.get(url, timeout=timeout, stream=True)
+            else:
+                response = session.post(
+                    api["url"],
+                    headers=api.get("headers", {}),
+                    json=api.get("data", {}),
+                    timeout=timeout,
+                    stream=True
+                )
         
-        st.error("❌ All image generation attempts failed. Please try again later or rephrase your prompt.")
-        return None
+            with response:
+                if response.status_code != 200:
+                    raise ImageProviderError(f"returned status {response.status_code}")
+            
+                # Read the body in blocks so a losing provider can be abandoned mid-download
+                content = BytesIO()
+                for block in response.iter_content(64 * 1024):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise ImageRaceCancelled()
+                    content.write(block)
         
-    except Exception as e:
-        st.error(f"Error generating image: {str(e)}")
-        return None
+            try:
+                image = Image.open(content)
+                image.load()
+            except Exception:
+                raise ImageProviderError("returned invalid image")
+        except ImageRaceCancelled:
+            raise
+        except Exception:
+            health.record(api["name"], time.perf_counter() - start, False)
+            raise
+    
+        health.record(api["name"], time.perf_counter() - start, True)
+        return image
 
-def generate_graph_with_ai(user_prompt):
-    """Use AI to generate Python code for creating graphs/diagrams"""
+def describe_provider_error(error):
+    """Short, user-facing reason a provider failed"""
+    import requests
+    if isinstance(error, requests.Timeout):
+        return "timed out"
+    if isinstance(error, ImageProviderError):
+        return str(error)
+    return f"failed: {str(error)[:50]}"
+
+def race_image_providers(apis, top_n=IMAGE_RACE_TOP_N, hedge_delay=IMAGE_RACE_HEDGE_DELAY, deadline=IMAGE_RACE_DEADLINE):
+    """Fire the healthiest providers at once and return (image, provider name, failures) for the first valid image"""
+    health = get_provider_health()
+    sessions = get_provider_sessions()
+    executor = get_image_executor()
+    ordered = health.rank(health.available(apis))
+    cancel_event = threading.Event()
+    start = time.perf_counter()
+    # Cancelling the question stops every provider at once, like losing the race; `woken` ends
+    # the wait below even while the providers are still waiting for a response
+    job = jobs.current()
+    woken = Future()
+    def on_cancel():
+        cancel_event.set()
+        woken.set_result(None)
+    if job is not None:
+        job.on_cancel(on_cancel)
+    
+    # The first top_n providers start immediately; each later one is a hedge that only
+    # starts if nobody has won after its delay (a provider may set its own "hedge_delay")
+    launch_at = [0.0 if i < top_n else api.get("hedge_delay", hedge_delay) * (i - top_n + 1)
+                 for i, api in enumerate(ordered)]
+    pending = {}
+    failures = []
+    next_index = 0
+    
     try:
-        code_prompt = f"""Generate Python code using matplotlib to create a diagram/graph for: {user_prompt}
+        while next_index < len(ordered) or pending:
+            if job is not None and job.cancelled:
+                job.stopped("image")
+                raise jobs.JobCancelled(job.reason)
+            elapsed = time.perf_counter() - start
+            if elapsed >= deadline:
+                failures.append(("Race", f"hit the {deadline}s deadline"))
+                break
+            
+            # Nothing in flight means waiting for the next hedge would only waste time
+            if not pending:
+                launch_at[next_index] = min(launch_at[next_index], elapsed)
+            while next_index < len(ordered) and launch_at[next_index] <= elapsed:
+                api = ordered[next_index]
+                timeout = min(IMAGE_PROVIDER_TIMEOUT, deadline - elapsed)
+                future = executor.submit(tracing.bind(fetch_provider_image), api, health, sessions.get(api["name"]), timeout, cancel_event)
+                pending[future] = api
+                next_index += 1
+            
+            next_launch = launch_at[next_index] if next_index < len(ordered) else deadline
+            done, _ = wait([*pending, woken], timeout=max(0.0, min(next_launch, deadline) - elapsed),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                if future is woken:
+                    continue
+                api = pending.pop(future)
+                try:
+                    return future.result(), api["name"], failures
+                except Exception as e:
+                    failures.append((api["name"], describe_provider_error(e)))
+        
+        return None, None, failures
+    finally:
+        # Stop the losers: queued requests never start, running ones abandon their download
+        cancel_event.set()
+        for future in pending:
+            future.cancel()
+        if job is not None:
+            job.remove(on_cancel)
+
+def find_image(prompt, race=True):
+    """Generate an image with the free APIs, falling back from one to the next. Returns the image
+    (or None) and the (level, message) notes to show; safe to call from a background thread."""
+    notes = []
+    with tracing.span("image.generate", race=race):
+        try:
+            # Clean the prompt
+            clean_prompt = prompt.replace('\n', ' ').strip()
+            apis = build_image_providers(clean_prompt)
+            
+            job = jobs.current()
+            if race:
+                image, winner, failures = race_image_providers(apis)
+                notes.extend(("caption", f"⚠️ {name} {reason}") for name, reason in failures)
+                if image is not None:
+                    if job is not None:
+                        job.record("image")
+                    notes.append(("success", f"✅ Image generated successfully using {winner}!"))
+                    return image, notes
+            else:
+                # Try multiple APIs in order of quality, skipping any with an open circuit breaker
+                health = get_provider_health()
+                sessions = get_provider_sessions()
+                cancel_event = threading.Event()
+                on_cancel = job.on_cancel(cancel_event.set) if job is not None else None
+                try:
+                    for api in health.available(apis):
+                        try:
+                            image = fetch_provider_image(api, health, sessions.get(api["name"]), cancel_event=cancel_event)
+                            if job is not None:
+                                job.record("image")
+                            notes.append(("success", f"✅ Image generated successfully using {api['name']}!"))
+                            return image, notes
+                        except ImageRaceCancelled:
+                            job.stopped("image")
+                            raise jobs.JobCancelled(job.reason)
+                        except Exception as e:
+                            notes.append(("warning", f"⚠️ {api['name']} {describe_provider_error(e)}, trying next option..."))
+                finally:
+                    if on_cancel is not None:
+                        job.remove(on_cancel)
+            
+            notes.append(("error", "❌ All image generation attempts failed. Please try again later or rephrase your prompt."))
+        except jobs.JobCancelled:
+            raise
+        except Exception as e:
+            notes.append(("error", f"Error generating image: {str(e)}"))
+    return None, notes
+
+def generate_image_with_api(prompt, race=True, image_future=None):
+    """Generate images using multiple free APIs with fallback options"""
+    # The image may already have been requested in the background while the answer streamed
+    if image_future is not None:
+        image, notes = image_future.result()
+    else:
+        with st.spinner("🎨 Generating your image..."):
+            image, notes = find_image(prompt, race)
+    for level, message in notes:
+        getattr(st, level)(message)
+    return image
+
+class GraphCache:
+    """Generated graph code keyed by prompt, and rendered PNGs keyed by code, on disk with LRU eviction by size"""
+    def __init__(self, directory, max_bytes=GRAPH_CACHE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.budget = DiskBudget(directory, max_bytes)
+
+    def _path(self, kind, text):
+        return os.path.join(self.directory, f"{hashlib.sha256(text.encode()).hexdigest()}.{kind}")
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as cache_file:
+                data = cache_file.read()
+        except OSError:
+            return None
+        self.budget.touch(path)
+        return data
+
+    def _write(self, path, data):
+        write_file_atomic(path, data)
+        self.budget.added(len(data))
+
+    def get_code(self, prompt, model_name):
+        code = self._read(self._path("py", f"{model_name}\n{normalize_question(prompt)}"))
+        return code.decode() if code is not None else None
+
+    def put_code(self, prompt, model_name, code):
+        self._write(self._path("py", f"{model_name}\n{normalize_question(prompt)}"), code.encode())
+
+    def get_png(self, code):
+        return self._read(self._path("png", f"{GRAPH_DPI}\n{code}"))
+
+    def put_png(self, code, png_bytes):
+        self._write(self._path("png", f"{GRAPH_DPI}\n{code}"), png_bytes)
+
+@st.cache_resource
+def get_graph_cache():
+    """Graph cache shared by every session"""
+    return GraphCache(os.path.join(CACHE_DIR, "graphs"))
+
+class GraphWorkerPool:
+    """Warm worker processes that run graph code with the Agg backend under time, CPU and memory limits"""
+    def __init__(self, workers=GRAPH_WORKERS):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor = None
+        # Which worker process runs each task (None until it starts), so a cancelled render can be interrupted
+        self.task_ids = itertools.count(1)
+        self.running = {}
+        self.cancel_requested = set()
+        self.cancelled_slot = 0
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                context = multiprocessing.get_context("spawn")
+                self.started = context.SimpleQueue()
+                self.cancelled = context.Array("q", 16)
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=graph_worker.init_worker,
+                    initargs=(GRAPH_MEMORY_LIMIT, self.started, self.cancelled)
+                )
+                threading.Thread(target=self._watch_started, args=(self.started,),
+                                 name="chatbot-graph-started", daemon=True).start()
+            return self.executor
+
+    def _watch_started(self, started):
+        while True:
+            item = started.get()
+            if item is None:
+                return
+            task_id, pid = item
+            with self.lock:
+                if task_id not in self.running:
+                    continue
+                self.running[task_id] = pid
+                interrupt = task_id in self.cancel_requested
+            if interrupt:
+                self._interrupt(pid)
+
+    def _interrupt(self, pid):
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except (OSError, AttributeError):
+            pass
+
+    def cancel(self, future, task_id):
+        """Stop a render: a queued one never starts, a running one is interrupted in its worker,
+        which stays warm for the next graph"""
+        if future.cancel():
+            return
+        with self.lock:
+            # The worker checks this list, so a late signal can't stop its next task
+            self.cancelled[self.cancelled_slot % len(self.cancelled)] = task_id
+            self.cancelled_slot += 1
+            pid = self.running.get(task_id)
+            if pid is None:
+                self.cancel_requested.add(task_id)
+        if pid is not None:
+            self._interrupt(pid)
+
+    def _reset(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+                self.started.put(None)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self):
+        """Start the workers now so the first graph doesn't pay for process start-up and imports"""
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(graph_worker.ping)
+
+    def render(self, code, job=None):
+        executor = self._get_executor()
+        task_id = next(self.task_ids)
+        with self.lock:
+            self.running[task_id] = None
+        on_cancel = None
+        try:
+            future = executor.submit(graph_worker.render_graph, code, GRAPH_TIME_LIMIT, GRAPH_DPI, task_id)
+            if job is not None:
+                on_cancel = job.on_cancel(lambda: self.cancel(future, task_id))
+            # The worker stops itself at the time limit; the margin covers a worker that can't be interrupted
+            png_bytes, timings = future.result(timeout=GRAPH_TIME_LIMIT + 5)
+            for step, (start_ns, end_ns) in timings.items():
+                tracing.record(f"graph.{step}", start_ns, end_ns)
+            return png_bytes
+        except (graph_worker.GraphCancelled, CancelledError):
+            if job is None or not job.cancelled:
+                # Dropped by a pool reset rather than by its question
+                raise RuntimeError("the graph render was interrupted")
+            job.stopped("graph")
+            raise jobs.JobCancelled(job.reason)
+        except MemoryError:
+            raise RuntimeError("the graph code used too much memory")
+        except (BrokenProcessPool, FutureTimeoutError):
+            # A worker was killed (e.g. at its CPU limit) or is stuck, so start fresh workers next time
+            self._reset(executor)
+            raise RuntimeError("the graph code took too long or used too much memory")
+        finally:
+            if on_cancel is not None:
+                job.remove(on_cancel)
+            with self.lock:
+                self.running.pop(task_id, None)
+                self.cancel_requested.discard(task_id)
+
+@st.cache_resource
+def get_graph_pool():
+    """Graph worker processes shared by every session"""
+    pool = GraphWorkerPool()
+    pool.warm()
+    return pool
+
+def request_graph_code(model, user_prompt):
+    """Ask the model for matplotlib code (safe to call from a background thread)"""
+    # Simple function plots are built locally, skipping the model round trip
+    with tracing.span("graph.quick_plot"):
+        code = quick_plot.build_plot_code(user_prompt)
+    if code is not None:
+        return code
+    
+    # Repeated plot requests reuse the code generated last time
+    cache = get_graph_cache()
+    with tracing.span("graph.code_cache") as cache_span:
+        code = cache.get_code(user_prompt, model.model_name)
+        cache_span.set(hit=code is not None)
+    if code is not None:
+        return code
+    
+    code_prompt = f"""Generate Python code using matplotlib to create a diagram/graph for: {user_prompt}
 
 Requirements:
 - Use matplotlib.pyplot as plt and numpy as np
@@ -242,8 +1939,6 @@ Requirements:
 
 Example format:
 ```python
-import matplotlib.pyplot as plt
-import numpy as np
 
 plt.figure(figsize=(10, 6))
 # your plotting code here
@@ -254,214 +1949,868 @@ plt.grid(True)
 plt.legend()
 ```
 """
-        
-        response = st.session_state.model.generate_content(code_prompt)
-        code = response.text
-        
-        # Extract code from markdown if present
-        if "```python" in code:
-            code = code.split("```python")[1].split("```")[0]
-        elif "```" in code:
-            code = code.split("```")[1].split("```")[0]
-        
-        return code.strip()
+    
+    with tracing.span("graph.codegen"):
+        response = model.generate_content(code_prompt)
+    code = response.text
+    
+    # Extract code from markdown if present
+    if "```python" in code:
+        code = code.split("```python")[1].split("```")[0]
+    elif "```" in code:
+        code = code.split("```")[1].split("```")[0]
+    
+    code = code.strip()
+    cache.put_code(user_prompt, model.model_name, code)
+    return code
+
+def generate_graph_with_ai(user_prompt, code_future=None):
+    """Use AI to generate Python code for creating graphs/diagrams"""
+    try:
+        # The code may already have been requested in the background while the answer streamed
+        if code_future is not None:
+            with tracing.span("graph.codegen.wait"):
+                return code_future.result()
+        return request_graph_code(st.session_state.utility_model, user_prompt)
     except Exception as e:
         st.error(f"Error generating graph code: {str(e)}")
         return None
 
-def execute_graph_code(code):
-    """Execute the AI-generated matplotlib code safely"""
+def render_graph_png(code):
+    """PNG bytes for graph code, from the cache or a sandboxed worker process"""
+    with tracing.span("graph.render") as render_span:
+        cache = get_graph_cache()
+        png_bytes = cache.get_png(code)
+        render_span.set(cached=png_bytes is not None)
+        if png_bytes is None:
+            job = jobs.current()
+            png_bytes = get_graph_pool().render(code, job)
+            cache.put_png(code, png_bytes)
+            if job is not None:
+                job.record("graph")
+    return png_bytes
+
+def execute_graph_code(code, png_future=None):
+    """Execute the AI-generated matplotlib code safely in a sandboxed worker process"""
     try:
-        # Create a new figure
-        fig = plt.figure(figsize=(10, 6))
-        
-        # Execute the code
-        exec_globals = {'plt': plt, 'np': np, 'fig': fig}
-        exec(code, exec_globals)
-        
-        # Save to buffer
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
-        
-        return buf
+        # The graph may already have been rendered in the background
+        return BytesIO(png_future.result() if png_future is not None else render_graph_png(code))
     except Exception as e:
         st.error(f"Error executing graph code: {str(e)}")
-        plt.close()
         return None
 
-def process_uploaded_image(uploaded_file):
-    """Process uploaded image and analyze it"""
-    try:
-        image = Image.open(uploaded_file)
+def prepare_image(data):
+    """Fix EXIF orientation, fit the photo in the pixel budget and re-encode it as JPEG"""
+    image = Image.open(BytesIO(data))
+    # JPEG phone photos can be decoded straight at a reduced scale
+    pixels = image.width * image.height
+    if pixels > UPLOAD_MAX_PIXELS:
+        scale = (UPLOAD_MAX_PIXELS / pixels) ** 0.5
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        # Transparent areas become white rather than black
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    else:
+        image = image.convert("RGB")
+    
+    pixels = image.width * image.height
+    if pixels > UPLOAD_MAX_PIXELS:
+        scale = (UPLOAD_MAX_PIXELS / pixels) ** 0.5
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+    
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=UPLOAD_JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+class ImageStore:
+    """Vision-model extractions of uploaded photos, keyed by a hash of the prepared image bytes.
+    Only the same photo matches: two worksheet pages can look alike at low resolution."""
+    def __init__(self, path, max_entries=UPLOAD_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
         
-        # Use vision model to analyze the image
-        response = st.session_state.vision_model.generate_content([
+        with self.lock, self.conn:
+            # Older versions keyed extractions by a perceptual hash, which let similar pages share them
+            self.conn.execute("DROP TABLE IF EXISTS extractions")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS transcriptions (
+                digest TEXT, model TEXT, extraction TEXT, last_used REAL, PRIMARY KEY (digest, model))""")
+
+    def get(self, digest, model_name):
+        """Return the extraction of the same prepared photo, or None"""
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT extraction FROM transcriptions WHERE digest = ? AND model = ?",
+                                    (digest, model_name)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE transcriptions SET last_used = ? WHERE digest = ? AND model = ?",
+                              (time.time(), digest, model_name))
+            self.hits += 1
+            return row[0]
+
+    def put(self, digest, model_name, extraction):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?, ?)",
+                              (digest, model_name, extraction, time.time()))
+            self.conn.execute(
+                "DELETE FROM transcriptions WHERE rowid NOT IN "
+                "(SELECT rowid FROM transcriptions ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+
+@st.cache_resource
+def get_image_store():
+    """Image extraction store shared by every session"""
+    return ImageStore(os.path.join(CACHE_DIR, "uploads.sqlite3"))
+
+class PreparedUpload:
+    """An uploaded photo after pre-processing, plus its vision extraction once it is known"""
+    def __init__(self, jpeg_bytes):
+        self.jpeg_bytes = jpeg_bytes
+        self.image = Image.open(BytesIO(jpeg_bytes))
+        # Preparing the same upload always gives the same bytes, so this finds it again in any session
+        self.digest = hashlib.sha256(jpeg_bytes).hexdigest()
+        self.extraction = None
+        self.future = None
+
+    def ready_extraction(self):
+        """The extraction if it has finished, without waiting for it"""
+        if self.extraction is None and self.future is not None and self.future.done():
+            try:
+                self.extraction = self.future.result()
+            except Exception:
+                pass
+            self.future = None
+        return self.extraction
+
+def extract_image_problem(model, image, digest):
+    """Ask the vision model to transcribe the photo once and store the text (runs in a background thread)"""
+    with tracing.span("upload.transcribe"):
+        response = model.generate_content([
             "Analyze this image. If it contains a physics or mathematics problem, extract and describe it in detail. If it contains diagrams or graphs, describe what you see. Be specific about equations, numbers, and diagrams.",
             image
         ])
-        
-        return response.text, image
+    extraction = response.text.strip()
+    if extraction:
+        get_image_store().put(digest, model.model_name, extraction)
+    return extraction
+
+def prepare_upload(uploaded_file):
+    """Pre-process an upload once per session and start its extraction unless the same photo was seen before"""
+    data = uploaded_file.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    uploads = st.session_state.setdefault("uploads", {})
+    if digest in uploads:
+        return uploads[digest]
+    
+    with tracing.span("upload.prepare", bytes=len(data)):
+        upload = PreparedUpload(prepare_image(data))
+    model = st.session_state.vision_model
+    upload.extraction = get_image_store().get(upload.digest, model.model_name)
+    if upload.extraction is None:
+        upload.future = get_background_executor().submit(tracing.bind(extract_image_problem), model, upload.image, upload.digest)
+    uploads[digest] = upload
+    # Only the latest uploads are kept; older photos live on as history thumbnails
+    while len(uploads) > 2:
+        uploads.pop(next(iter(uploads)))
+    return upload
+
+def process_uploaded_image(uploaded_file, timeout=0):
+    """Process uploaded image and analyze it, waiting up to timeout seconds for its transcription"""
+    try:
+        upload = prepare_upload(uploaded_file)
+        if timeout and upload.extraction is None and upload.future is not None:
+            wait([upload.future], timeout)
+        return upload.ready_extraction(), upload.image
     except Exception as e:
         return f"Error processing image: {str(e)}", None
 
-def get_bot_response(user_message, difficulty, uploaded_image=None):
-    """Get response from Gemini API with persona"""
+def conversation_history(user_message):
+    """The chat so far, without the question being answered now (main() has already appended it)"""
+    history = st.session_state.get("messages", [])
+    if history and history[-1].role == "user" and history[-1].content == user_message:
+        history = history[:-1]
+    return history
+
+def question_parts(user_message, difficulty, uploaded_image=None, image_text=None):
+    """The student's question as request parts"""
     # Modify prompt based on settings
     modified_prompt = user_message
     
     if difficulty != "Standard":
         modified_prompt = f"[Difficulty: {difficulty}] {user_message}"
     
-    # Combine system prompt with user message
-    full_prompt = f"{SYSTEM_PROMPT}\n\nStudent Question: {modified_prompt}"
+    parts = [f"Student Question: {modified_prompt}"]
+    if image_text:
+        # The photo was transcribed when it was uploaded, so the model can lean on the text
+        parts.insert(0, f"Transcription of the attached image: {image_text}")
+    if uploaded_image:
+        parts.append(uploaded_image)
+    return parts
+
+def build_contents(user_message, difficulty, uploaded_image=None, image_text=None):
+    """Build the request: bounded conversation history followed by the student's question"""
+    return st.session_state.context.build(conversation_history(user_message),
+                                          question_parts(user_message, difficulty, uploaded_image, image_text),
+                                          st.session_state.utility_model)
+
+def plan_parts(user_message, difficulty, uploaded_image=None, image_text=None):
+    """The parts of a multi-part question or worksheet photo and the request parts they share,
+    or None to answer it in one request"""
+    if not st.session_state.get("fan_out", True):
+        return None
+    # Without its transcription, a photo has to go to the vision model whole
+    if uploaded_image and not image_text:
+        return None
+    split = question_splitter.split_question(user_message, FANOUT_MAX_GROUPS)
+    if split is not None:
+        shared = question_parts(split.stem or "The parts below are separate questions.", difficulty, image_text=image_text)
+        return split, shared
+    split = question_splitter.split_question(image_text or "", FANOUT_MAX_GROUPS)
+    if split is not None:
+        # The worksheet's stem stands in for the whole transcription
+        shared = question_parts(user_message, difficulty, image_text=split.stem or "A worksheet of separate questions.")
+        return split, shared
+    return None
+
+def part_request(group):
+    """The request turn for a group of parts"""
+    labels = [part.label for part in group]
+    if len(labels) == 1:
+        which = f"part {labels[0]}"
+    else:
+        which = f"parts {', '.join(labels[:-1])} and {labels[-1]}, in order,"
+    body = "\n".join(f"{part.label} {part.text}" for part in group)
+    return (f"Answer only {which} of the question above; the other parts are answered separately.\n\n"
+            f"Student Question: {body}")
+
+def stream_parts(user_message, plan, difficulty, metrics, start):
+    """Answer each group of parts in a request of its own, at most FANOUT_CONCURRENCY at once, and
+    yield the answers in order. A part streams once the parts before it have been shown; one that
+    finished in the meantime appears at once."""
+    split, shared_parts = plan
+    # The history, summary and stem are the same for every part, so they are built once
+    with tracing.span("context.build", parts=len(split.groups)):
+        shared, estimated_tokens = st.session_state.context.build(
+            conversation_history(user_message), shared_parts, st.session_state.utility_model)
+    metrics.update({"parts": len(split.groups), "prompt_tokens": 0, "output_tokens": 0, "part_errors": 0})
+
+    def submit(group):
+        contents = [{"role": turn["role"], "parts": list(turn["parts"])} for turn in shared]
+        add_turn(contents, "user", part_request(group))
+        text = " ".join(part.text for part in group)
+        model, call_kwargs, decision = choose_answer_model(text, difficulty)
+        try:
+            return model.generate_content(contents, stream=True, **call_kwargs), decision, time.perf_counter(), time.time_ns()
+        except jobs.JobCancelled:
+            raise
+        except Exception as e:
+            return e, decision, time.perf_counter(), time.time_ns()
+
+    streams = []
+    for index, group in enumerate(split.groups):
+        while len(streams) < min(len(split.groups), index + FANOUT_CONCURRENCY):
+            streams.append(submit(split.groups[len(streams)]))
+        response, decision, submitted, submitted_ns = streams[index]
+        labels = " ".join(part.label for part in group)
+        separator = "\n\n" if index else ""
+        yield f"{separator}**{labels}**\n\n"
+        usage_metadata = None
+        try:
+            if isinstance(response, Exception):
+                raise response
+            for chunk in response:
+                usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                if not chunk.text:
+                    continue
+                if metrics["ttft"] is None:
+                    metrics["ttft"] = time.perf_counter() - start
+                metrics["chars"] += len(chunk.text)
+                yield chunk.text
+        except jobs.JobCancelled:
+            raise
+        except GatewayRateLimited as e:
+            metrics["part_errors"] += 1
+            yield f"⚠️ {e}"
+        except Exception as e:
+            metrics["part_errors"] += 1
+            yield f"⚠️ This part couldn't be answered: {e}"
+        metrics["prompt_tokens"] += getattr(usage_metadata, "prompt_token_count", None) or 0
+        metrics["output_tokens"] += getattr(usage_metadata, "candidates_token_count", None) or 0
+        if usage_metadata is not None:
+            record_tier_usage(metrics, decision, time.perf_counter() - submitted, usage_metadata)
+        tracing.record("answer.part", submitted_ns, time.time_ns(), part=labels,
+                       tier=decision.tier.name if decision else "off")
+    metrics["prompt_tokens"] = metrics["prompt_tokens"] or estimated_tokens
+
+def record_token_usage(metrics, usage_metadata, estimated_tokens):
+    """Prefer the token count reported by the API over our estimate"""
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None)
+    metrics["prompt_tokens"] = prompt_tokens or estimated_tokens
+    metrics["output_tokens"] = getattr(usage_metadata, "candidates_token_count", None)
+
+def choose_answer_model(user_message, difficulty, uploaded_image=None):
+    """The model to answer with, the keyword arguments for its call and the tier decision (None
+    when tiering is turned off)"""
+    model = st.session_state.vision_model if uploaded_image else st.session_state.model
+    if not st.session_state.get("model_tiering", True):
+        return model, {}, None
+    policy = get_tier_policy()
+    decision = policy.choose(user_message, difficulty, image=bool(uploaded_image))
+    if not uploaded_image:
+        model = st.session_state.tier_models[decision.tier.name]
+    config = policy.generation_config(decision.tier)
+    return model, {"generation_config": config} if config else {}, decision
+
+def record_tier_usage(metrics, decision, latency, usage_metadata):
+    """Count a model call towards its tier's latency and token statistics"""
+    if decision is None:
+        return
+    metrics["tier"] = decision.tier.name
+    get_tier_policy().stats.record(decision.tier, latency, usage_metadata, decision.question_type)
+
+def instant_answer(user_message, difficulty, uploaded_image=None, image_text=None, metrics=None):
+    """A precomputed example answer or a worked solution from the built-in solver, or None when
+    the question needs the model"""
+    # Photos and follow-ups depend on context neither of them can see
+    if uploaded_image or image_text or is_follow_up(user_message, conversation_history(user_message)):
+        return None
+    entry = get_example_store().get(user_message, difficulty)
+    if entry is not None and entry.answer:
+        metrics["precomputed"] = True
+        return entry.answer
+    if not st.session_state.get("local_solver", True):
+        return None
+    with tracing.span("solver.local") as solver_span:
+        solution = get_local_solver().solve(user_message)
+        solver_span.set(hit=solution is not None)
+    if solution is None:
+        return None
+    metrics["local"] = True
+    return local_solver.to_markdown(solution)
+
+def precomputed_graph(user_message, difficulty):
+    """The graph precomputed for an example question, as PNG bytes, or None"""
+    entry = get_example_store().get(user_message, difficulty)
+    if entry is None or entry.graph_path is None:
+        return None
+    try:
+        with open(entry.graph_path, 'rb') as graph_file:
+            return graph_file.read()
+    except OSError:
+        return None
+
+def get_bot_response(user_message, difficulty, uploaded_image=None, metrics=None, image_text=None):
+    """The whole response at once: stream_bot_response joined, with the same metrics recorded"""
+    return "".join(stream_bot_response(user_message, difficulty, uploaded_image, metrics, image_text))
+
+def stream_bot_response(user_message, difficulty, uploaded_image=None, metrics=None, image_text=None):
+    """Yield the Gemini response chunk by chunk, recording time-to-first-token and total latency"""
+    if metrics is None:
+        metrics = {}
+    metrics.update({"ttft": None, "total": None, "chars": 0, "cached": False})
+    start = time.perf_counter()
+    solved = instant_answer(user_message, difficulty, uploaded_image, image_text, metrics)
+    if solved:
+        metrics.update({"ttft": time.perf_counter() - start, "chars": len(solved), "prompt_tokens": 0})
+        metrics["total"] = metrics["ttft"]
+        yield solved
+        return
+    cache = get_answer_cache()
+    model, call_kwargs, decision = choose_answer_model(user_message, difficulty, uploaded_image)
+    model_name = model.model_name
+    cacheable = not uploaded_image and not is_follow_up(user_message, conversation_history(user_message))
+    if cacheable:
+        with tracing.span("answer.cache") as cache_span:
+            cached = cache.get(user_message, difficulty, model_name, fuzzy=ANSWER_CACHE_FUZZY)
+            cache_span.set(hit=cached is not None)
+        if cached is not None:
+            metrics.update({"ttft": time.perf_counter() - start, "chars": len(cached), "cached": True,
+                            "prompt_tokens": 0})
+            metrics["total"] = metrics["ttft"]
+            yield cached
+            return
+    
+    plan = plan_parts(user_message, difficulty, uploaded_image, image_text)
+    if plan is not None:
+        answer = ""
+        try:
+            for text in stream_parts(user_message, plan, difficulty, metrics, start):
+                answer += text
+                yield text
+            if cacheable and not metrics["part_errors"]:
+                cache.put(user_message, difficulty, model_name, answer, time.perf_counter() - start)
+        finally:
+            metrics["total"] = time.perf_counter() - start
+        return
     
+    # Built only now: it can start a summary call, which a cached or fanned-out answer doesn't need
+    with tracing.span("context.build"):
+        contents, estimated_tokens = build_contents(user_message, difficulty, uploaded_image, image_text)
+    answer = ""
+    usage_metadata = None
+    # The stream is consumed across yields, so its span is recorded once it ends
+    stream_start_ns = time.time_ns()
     try:
-        if uploaded_image:
-            # Use vision model for image analysis
-            response = st.session_state.vision_model.generate_content([full_prompt, uploaded_image])
-        else:
-            response = st.session_state.model.generate_content(full_prompt)
-        return response.text
+        response = model.generate_content(contents, stream=True, **call_kwargs)
+        
+        for chunk in response:
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+            text = chunk.text
+            if not text:
+                continue
+            if metrics["ttft"] is None:
+                metrics["ttft"] = time.perf_counter() - start
+            metrics["chars"] += len(text)
+            answer += text
+            yield text
+        
+        if cacheable and answer:
+            cache.put(user_message, difficulty, model_name, answer, time.perf_counter() - start)
+        record_tier_usage(metrics, decision, time.perf_counter() - start, usage_metadata)
+    except jobs.JobCancelled:
+        raise
+    except GatewayRateLimited as e:
+        yield f"⚠️ {e}"
     except Exception as e:
-        return f"⚠️ Error connecting to API: {str(e)}\n\nPlease check your API key and internet connection."
+        yield f"⚠️ Error connecting to API: {str(e)}\n\nPlease check your API key and internet connection."
+    finally:
+        metrics["total"] = time.perf_counter() - start
+        record_token_usage(metrics, usage_metadata, estimated_tokens)
+        tracing.record("model.stream", stream_start_ns, time.time_ns(), vision=bool(uploaded_image),
+                       ttft_ms=round((metrics["ttft"] or 0) * 1000), chars=metrics["chars"],
+                       prompt_tokens=metrics["prompt_tokens"], tier=decision.tier.name if decision else "off")
 
-def main():
-    st.set_page_config(page_title="Physics & Maths Solver", page_icon="🔬", layout="wide")
+def precompute_example(example, store, model, utility_model, speech=True, difficulty=EXAMPLE_DIFFICULTY):
+    """Produce an example's answer, graph and speech the way the chat would, and store them"""
+    route = get_intent_router().route(example.text)
+    answer = None
+    if route.answer or not (route.graph or route.image):
+        solution = get_local_solver().solve(example.text)
+        if solution is not None:
+            answer = local_solver.to_markdown(solution)
+        else:
+            # A fresh context, so the answer doesn't depend on anyone's conversation
+            contents, _ = ConversationContext().build([], question_parts(example.text, difficulty), utility_model)
+            answer = model.generate_content(contents).text
+    graph_png = render_graph_png(request_graph_code(utility_model, example.text)) if route.graph else None
+    if speech and answer:
+        # Synthesized in the same sentence chunks as a live answer, so playback hits the audio cache
+        job = SpeechJob()
+        job.feed(answer)
+        job.finish()
+        for future in job.futures:
+            future.result()
+    store.put(example, difficulty, answer, graph_png)
 
-    # ---- Sidebar ----
+def refresh_examples(store, examples, model, utility_model):
+    """Precompute the examples missing from the store one by one, then drop the older versions"""
+    failed = 0
+    for example in store.missing(examples, EXAMPLE_DIFFICULTY):
+        try:
+            precompute_example(example, store, model, utility_model)
+        except Exception:
+            # Left for the next refresh; students asking it meanwhile get a live answer
+            failed += 1
+    if not failed:
+        store.prune()
+    return failed
+
+@st.cache_resource
+def start_example_refresh():
+    """Once per process: if the examples were warmed for an earlier model or system prompt,
+    precompute them again in the background. They are never warmed from scratch here
+    (that is what warm_examples.py is for)."""
+    store = get_example_store()
+    examples = get_example_bank()
+    if not store.previous_versions() or not store.missing(examples, EXAMPLE_DIFFICULTY):
+        return None
+    # Its own session, so the refresh is held to a student's rate limit and never crowds out the chat
+    session_id = f"example-refresh-{store.version}"
+    model = GatewayModel(get_model(MODEL_NAME, SYSTEM_PROMPT), session_id)
+    utility_model = GatewayModel(get_model(MODEL_NAME), session_id)
+    return get_background_executor().submit(refresh_examples, store, examples, model, utility_model)
+
+def record_response_metrics(metrics):
+    """Keep the latency metrics of the most recent responses for the sidebar"""
+    st.session_state.response_metrics.append(metrics)
+    st.session_state.response_metrics = st.session_state.response_metrics[-20:]
+
+def render_provider_health():
+    """Show each image provider's breaker state and latency histogram"""
+    health = get_provider_health()
+    names = [api["name"] for api in build_image_providers("")]
+    if not any(health.summary(name) for name in names):
+        st.caption("No image provider calls yet.")
+        return
+    
+    labels = [f"≤{edge}s" for edge in IMAGE_LATENCY_BUCKETS] + [f">{IMAGE_LATENCY_BUCKETS[-1]}s"]
+    rows = ["| Provider | Breaker | Errors | " + " | ".join(labels) + " |",
+            "|---|---|---|" + "---|" * len(labels)]
+    for name in names:
+        summary = health.summary(name)
+        if summary is None:
+            continue
+        state = health.breaker_state(name)
+        if state == "open":
+            state = f"🔴 open ({health.cooldown_left(name):.0f}s)"
+        elif state == "half-open":
+            state = "🟡 half-open"
+        else:
+            state = "🟢 closed"
+        histogram = health.histograms.get(name, [])
+        rows.append(f"| {name} | {state} | {summary['error_rate']:.0%} | " +
+                    " | ".join(str(count) for count in histogram) + " |")
+    st.markdown("\n".join(rows))
+
+def render_key_health():
+    """Show each API key's quota estimate, load and 429s"""
+    rows = ["| Key | Quota left | In flight | Calls | 429s | Errors | p50 | State |",
+            "|---|---|---|---|---|---|---|---|"]
+    for key in get_key_pool().health():
+        state = f"🔴 resting ({key['cooldown']:.0f}s)" if key["cooldown"] else "🟢 ready"
+        p50 = f"{key['latency_p50']:.2f}s" if key["latency_p50"] is not None else "–"
+        rows.append(f"| {key['name']} {key['key']} | {max(0, key['remaining'])}/{key['rpm']} | {key['in_flight']} | "
+                    f"{key['calls']} | {key['throttled']} | {key['errors']} | {p50} | {state} |")
+    st.markdown("\n".join(rows))
+
+def render_tier_stats():
+    """Show each model tier's latency and token use, to tune the tier rules and budgets"""
+    stats = get_tier_policy().stats.snapshot()
+    if not stats:
+        st.caption("No model calls yet.")
+        return
+    rows = ["| Tier | Model | Calls | p50 | p95 | Prompt tokens | Output tokens | At budget |",
+            "|---|---|---|---|---|---|---|---|"]
+    for tier in MODEL_TIERS:
+        tier_stats = stats.get(tier.name)
+        if tier_stats is None:
+            continue
+        rows.append(f"| {tier.name} | {tier.model_name} | {tier_stats['calls']} | {tier_stats['latency_p50']:.2f}s | "
+                    f"{tier_stats['latency_p95']:.2f}s | {tier_stats['avg_prompt_tokens']:.0f} | "
+                    f"{tier_stats['avg_output_tokens']:.0f} / {tier.max_output_tokens} | {tier_stats['capped']} |")
+    st.markdown("\n".join(rows))
+
+def render_performance_panel():
+    """Show recent response latency in the sidebar"""
     with st.sidebar:
-        st.title("🔬 Physics & Maths Question Solver")
-        st.caption("Your AI-powered tutor for Physics and Mathematics")
-        
-        st.markdown("---")
-        
-        # Collapsible Settings Section
-        with st.expander("⚙️ Settings", expanded=False):
-            st.markdown("### 🎯 Problem Settings")
-            difficulty = st.select_slider(
-                "Difficulty Level",
-                options=["Beginner", "Standard", "Advanced", "Expert"],
-                value="Standard"
-            )
+        with st.expander("📈 Performance", expanded=False):
+            cache_stats = get_answer_cache().stats()
+            lookups = cache_stats["hits"] + cache_stats["misses"]
+            hit_rate = cache_stats["hits"] / lookups if lookups else 0.0
+            st.markdown(f"**🗄️ Answer cache:** {cache_stats['hits']} hits ({cache_stats['near_hits']} near-duplicate) · "
+                        f"{cache_stats['misses']} misses · {hit_rate:.0%} hit rate")
+            st.caption(f"{cache_stats['entries']} cached answers · ~{cache_stats['saved_seconds']:.0f}s of model time saved")
             
-            st.markdown("### 🎨 Image Generation")
-            enable_image_gen = st.checkbox("Enable AI Image Generation", value=True)
-            if enable_image_gen:
-                st.caption("💡 Ask me to 'draw', 'create an image of', or 'show me a picture of...'")
+            audio_cache = get_audio_cache()
+            st.caption(f"🔊 Audio cache: {audio_cache.hits} hits · {audio_cache.misses} syntheses")
             
-            st.markdown("### 📊 Graph Generation")
-            enable_graphs = st.checkbox("Enable Math/Physics Graphs", value=True)
-            if enable_graphs:
-                st.caption("💡 Ask me to 'plot', 'graph' mathematical functions!")
+            image_store = get_image_store()
+            st.caption(f"🖼️ Image transcriptions: {image_store.hits} reused · {image_store.misses} new")
             
-            st.markdown("### 📖 Quick Topics")
-            topic = st.selectbox(
-                "Select a topic for guidance",
-                ["General", "Mechanics", "Thermodynamics", "Electromagnetism", 
-                 "Quantum Physics", "Algebra", "Calculus", "Geometry", 
-                 "Statistics", "Linear Algebra"],
-                index=0
-            )
+            example_store = get_example_store()
+            examples = get_example_bank()
+            ready = len(examples) - len(example_store.missing(examples, EXAMPLE_DIFFICULTY))
+            st.caption(f"⚡ Precomputed examples: {ready}/{len(examples)} ready")
             
-            if topic != "General":
-                st.caption(f"💡 Ask me anything about {topic}!")
-        
-        st.markdown("---")
-        if st.button("🗑️ Clear Chat History"):
-            st.session_state.messages = []
-            st.rerun()
-
-    # ---- Initialize session ----
-    initialize_session_state()
+            solver = get_local_solver()
+            st.caption(f"🧮 Local solver: {solver.hits} solved · {solver.misses} sent to the model "
+                       f"({solver.timeouts} over the time limit)")
+            
+            render_times = st.session_state.render_times
+            if render_times:
+                st.caption(f"🧾 Chat history: {len(st.session_state.messages)} messages · "
+                           f"~{session_footprint() / 1024:.0f} KB in this session · "
+                           f"rerun {render_times[-1] * 1000:.0f} ms (median {sorted(render_times)[len(render_times) // 2] * 1000:.0f} ms)")
+            
+            gateway_stats = get_model_gateway().stats()
+            st.markdown(f"**🚦 Model gateway:** {gateway_stats['upstream_calls']} upstream calls for "
+                        f"{gateway_stats['requests']} requests · {gateway_stats['coalescing_ratio']:.0%} coalesced")
+            st.caption(f"Queue {gateway_stats['queue_depth']} · in flight {gateway_stats['in_flight']} · "
+                       f"wait p50 {gateway_stats['wait_p50']:.2f}s / p95 {gateway_stats['wait_p95']:.2f}s · "
+                       f"{gateway_stats['retries']} retries · {gateway_stats['rate_limited']} rate-limited"
+                       f" · {gateway_stats['cancelled']} cancelled")
+            
+            work_stats = jobs.STATS.snapshot()
+            if work_stats["work"]:
+                cancelled = ", ".join(f"{count} {reason}" for reason, count in work_stats["cancelled"].items())
+                st.markdown(f"**🛑 Cancelled questions:** {cancelled or 'none'}")
+                for kind, counts in sorted(work_stats["work"].items()):
+                    st.caption(f"{kind}: {counts['delivered']} delivered · {counts['wasted']} wasted · "
+                               f"{counts['stopped']} stopped early")
+            
+            st.markdown("**🎨 Image providers:**")
+            render_provider_health()
+            
+            st.markdown("**🧠 Model tiers:**")
+            render_tier_stats()
+            
+            if not USE_STUB_MODEL:
+                st.markdown("**🔑 API keys:**")
+                render_key_health()
+            
+            metrics = [m for m in st.session_state.response_metrics if m.get("ttft") is not None]
+            if metrics:
+                last = metrics[-1]
+                st.markdown(f"**Last response:** first token {last['ttft']:.2f}s · total {last['total']:.2f}s")
+                avg_ttft = sum(m["ttft"] for m in metrics) / len(metrics)
+                avg_total = sum(m["total"] for m in metrics) / len(metrics)
+                st.caption(f"Average over {len(metrics)} responses: first token {avg_ttft:.2f}s · total {avg_total:.2f}s")
+            else:
+                st.caption("No streamed responses yet.")
+            
+            token_metrics = [m["prompt_tokens"] for m in st.session_state.response_metrics if m.get("prompt_tokens")]
+            if token_metrics:
+                st.caption(f"🧮 Prompt tokens sent: last {token_metrics[-1]} · "
+                           f"max {max(token_metrics)} over {len(token_metrics)} requests")
+            
+            audio_metrics = [m["ttfa"] for m in st.session_state.response_metrics if "ttfa" in m]
+            if audio_metrics:
+                st.caption(f"🔊 Time to first audio: last {audio_metrics[-1]:.2f}s · "
+                           f"average {sum(audio_metrics) / len(audio_metrics):.2f}s")
 
-    # ---- Emojis / Avatars ----
-    user_emoji = "👤"
-    robot_img = "🔬"
+def render_waterfall(trace):
+    """Draw one request's spans as a waterfall, each bar placed on the request's timeline"""
+    spans = sorted(list(trace.spans), key=lambda item: item.start_ns)
+    root = trace.root
+    if root is None:
+        return
+    children = {}
+    for item in spans:
+        children.setdefault(item.parent_id, []).append(item)
+    rows = []
+    stack = [(root, 0)]
+    while stack:
+        item, depth = stack.pop()
+        rows.append((item, depth))
+        stack.extend((child, depth + 1) for child in reversed(children.get(item.span_id, [])))
     
-    # ---- FIXED CSS for bottom prompt bar with icons inline ----
-    st.markdown("""
-        <style>
-        /* Ensure main content has padding at bottom for fixed input */
-        .main .block-container {
-            padding-bottom: 120px !important;
-        }
-        
-        /* Make sure file uploader appears above the fixed container */
-        .stFileUploader {
-            margin-bottom: 0.5rem !important;
-        }
+    # Background work such as speech can finish after the request, so the timeline runs to the last span
+    total = max(max(item.end_ns for item in spans) - root.start_ns, 1)
+    lines = [f"<div style='font-size:0.75rem'><b>{html.escape(root.name)}</b> · {root.duration * 1000:.0f} ms"
+             f" · trace {trace.trace_id[:8]}</div>"]
+    for item, depth in rows:
+        left = (item.start_ns - root.start_ns) / total * 100
+        width = max((item.end_ns - item.start_ns) / total * 100, 0.5)
+        colour = "#e5534b" if item.error else "#4c8bf5"
+        details = html.escape(", ".join(f"{key}={value}" for key, value in item.attributes.items()), quote=True)
+        lines.append(
+            f"<div title='{details}' style='display:flex;align-items:center;font-size:0.7rem;line-height:1.1rem'>"
+            f"<div style='width:42%;padding-left:{depth * 8}px;overflow:hidden;white-space:nowrap'>{html.escape(item.name)}</div>"
+            f"<div style='flex:1;position:relative;height:0.6rem;background:rgba(128,128,128,0.15)'>"
+            f"<div style='position:absolute;left:{left:.1f}%;width:{width:.1f}%;height:100%;background:{colour}'></div></div>"
+            f"<div style='width:3.2rem;text-align:right'>{item.duration * 1000:.0f} ms</div></div>")
+    st.markdown("".join(lines), unsafe_allow_html=True)
+
+def render_debug_panel():
+    """Sidebar waterfall of the last requests' spans, and the opt-in profiler"""
+    with st.sidebar:
+        with st.expander("🔍 Debug", expanded=False):
+            st.checkbox("Profile the next question", key="profile_next",
+                        help="Samples every thread's stack while the next question is answered")
+            if TRACE_FILE or TRACE_OTLP_ENDPOINT:
+                st.caption(f"Exporting spans to {TRACE_OTLP_ENDPOINT or TRACE_FILE}")
+            
+            if not st.session_state.traces:
+                st.caption("Ask a question to see where its time goes.")
+            for index, trace in enumerate(reversed(st.session_state.traces)):
+                render_waterfall(trace)
+                if trace.profile:
+                    st.markdown("**Profile** (samples: self / total)")
+                    st.markdown("\n".join(f"- `{frame}` {own} / {total}"
+                                          for frame, own, total in tracing.top_functions(trace.profile, 10)))
+                    st.download_button("⬇️ Folded stacks", tracing.folded_stacks(trace.profile),
+                                       file_name=f"profile-{trace.trace_id[:8]}.folded",
+                                       key=f"profile_{trace.trace_id}")
+                st.markdown("---")
+
+# Fixed prompt bar with the icons inline; one constant string, so unchanged reruns resend identical CSS
+CHAT_CSS = """
+    <style>
+    /* Ensure main content has padding at bottom for fixed input */
+    .main .block-container {
+        padding-bottom: 120px !important;
+    }
+
+    /* Make sure file uploader appears above the fixed container */
+    .stFileUploader {
+        margin-bottom: 0.5rem !important;
+    }
+
+    /* Fix the chat input at bottom */
+    section[data-testid="stChatFloatingInputContainer"] {
+        position: fixed !important;
+        bottom: 0 !important;
+        left: var(--sidebar-width, 21rem) !important;
+        right: 0 !important;
+        background: #1e1e1e !important;
+        padding: 0.75rem 1rem !important;
+        box-shadow: 0 -2px 10px rgba(0,0,0,0.3) !important;
+        z-index: 999999 !important;
+        border-top: 1px solid #333 !important;
+        margin: 0 !important;
+    }
+
+    /* Add left padding to chat input to make room for icons */
+    section[data-testid="stChatFloatingInputContainer"] div[data-testid="stChatInput"] {
+        margin-left: 120px !important;
+    }
+
+    /* Style the buttons to be more compact and match theme */
+    div[data-testid="stHorizontalBlock"]:has(button) button {
+        border-radius: 8px !important;
+        height: 45px !important;
+        font-size: 1.2rem !important;
+    }
+
+    /* Style the checkbox container */
+    div[data-testid="stHorizontalBlock"]:has(.stCheckbox) .stCheckbox {
+        margin: 0 !important;
+        display: flex !important;
+        align-items: center !important;
+        justify-content: center !important;
+    }
+
+    /* Position the icon container as overlay on the left of chat input */
+    div[data-testid="stVerticalBlock"] > div:has(div[data-testid="stHorizontalBlock"] button):not(:has(div[data-testid="stChatInput"])) {
+        position: fixed !important;
+        bottom: 10px !important;
+        left: calc(var(--sidebar-width, 21rem) + 10px) !important;
+        z-index: 9999999 !important;
+        width: auto !important;
+    }
+    </style>
+"""
+
+USER_EMOJI = "👤"
+ROBOT_IMG = "🔬"
+
+@st.cache_data(max_entries=MEDIA_MEMORY_ITEMS, show_spinner=False)
+def history_image(digest, width=None):
+    """A history image at its display width, with its format, so st.image can send the bytes as they
+    are instead of decoding and re-encoding them on every rerun"""
+    data = get_media_store().get(digest)
+    if data is None:
+        return None, None
+    image = Image.open(BytesIO(data))
+    image_format = image.format
+    if width and image.width > width:
+        image.thumbnail((width, width * image.height // image.width))
+        buf = BytesIO()
+        image.save(buf, format=image_format)
+        data = buf.getvalue()
+    return data, image_format
+
+def render_message(message, user_emoji=USER_EMOJI, robot_img=ROBOT_IMG):
+    """Draw one turn of the chat history"""
+    if message.role == "assistant":
+        with st.chat_message("assistant", avatar=robot_img):
+            st.markdown(message.content)
+            # In the order they were shown live: the AI image, then the graph
+            for digest in (message.image, message.graph):
+                if digest:
+                    image, image_format = history_image(digest)
+                    if image is not None:
+                        st.image(image, output_format=image_format, use_column_width=True)
+    else:
+        with st.chat_message("user", avatar=user_emoji):
+            st.markdown(message.content)
+            if message.image:
+                image, image_format = history_image(message.image, 200)
+                if image is not None:
+                    st.image(image, output_format=image_format, width=200)
+
+# Button callbacks run before the rerun they trigger, so it already draws the new state
+def show_earlier_messages():
+    st.session_state.messages_shown += CHAT_PAGE_SIZE
+
+def toggle_uploader():
+    st.session_state.show_uploader = not st.session_state.show_uploader
+
+@st.fragment
+def render_history():
+    """The chat so far; paging through older turns reruns only this fragment"""
+    # Only the latest page is drawn on each rerun; older turns are loaded on request
+    messages = st.session_state.messages
+    hidden = max(0, len(messages) - st.session_state.messages_shown)
+    if hidden:
+        st.button(f"⬆️ Show earlier messages ({hidden} hidden)", key="show_earlier", on_click=show_earlier_messages)
+    for message in messages[hidden:]:
+        render_message(message)
+
+@st.fragment
+def render_settings():
+    """Sidebar settings; changing one reruns only this fragment, and main() reads the values by key"""
+    with st.expander("⚙️ Settings", expanded=False):
+        st.markdown("### 🎯 Problem Settings")
+        st.select_slider(
+            "Difficulty Level",
+            options=["Beginner", "Standard", "Advanced", "Expert"],
+            value="Standard",
+            key="difficulty"
+        )
         
-        /* Fix the chat input at bottom */
-        section[data-testid="stChatFloatingInputContainer"] {
-            position: fixed !important;
-            bottom: 0 !important;
-            left: var(--sidebar-width, 21rem) !important;
-            right: 0 !important;
-            background: #1e1e1e !important;
-            padding: 0.75rem 1rem !important;
-            box-shadow: 0 -2px 10px rgba(0,0,0,0.3) !important;
-            z-index: 999999 !important;
-            border-top: 1px solid #333 !important;
-            margin: 0 !important;
-        }
+        st.markdown("### 💬 Responses")
+        st.checkbox("Stream answers as they are written", value=True, key="stream_responses")
+        st.checkbox("Solve textbook formulas locally", value=True, key="local_solver",
+                    help="Standard formula, equation and calculus questions are worked out instantly without calling Gemini")
+        st.checkbox("Answer question parts in parallel", value=True, key="fan_out",
+                    help="Questions with parts (a), (b), ... and worksheet photos are split, "
+                         "and each part is answered at the same time as the others")
+        st.checkbox("Pick the model by question", value=True, key="model_tiering",
+                    help="Short factual questions get a faster model and shorter answers; "
+                         "advanced derivations get the larger model and room to finish")
         
-        /* Add left padding to chat input to make room for icons */
-        section[data-testid="stChatFloatingInputContainer"] div[data-testid="stChatInput"] {
-            margin-left: 120px !important;
-        }
+        st.markdown("### 🎨 Image Generation")
+        enable_image_gen = st.checkbox("Enable AI Image Generation", value=True, key="enable_image_gen")
+        if enable_image_gen:
+            st.caption("💡 Ask me to 'draw', 'create an image of', or 'show me a picture of...'")
+            st.checkbox("Race image providers in parallel", value=True, key="race_image_apis")
         
-        /* Style the buttons to be more compact and match theme */
-        div[data-testid="stHorizontalBlock"]:has(button) button {
-            border-radius: 8px !important;
-            height: 45px !important;
-            font-size: 1.2rem !important;
-        }
+        st.markdown("### 📊 Graph Generation")
+        enable_graphs = st.checkbox("Enable Math/Physics Graphs", value=True, key="enable_graphs")
+        if enable_graphs:
+            st.caption("💡 Ask me to 'plot', 'graph' mathematical functions!")
         
-        /* Style the checkbox container */
-        div[data-testid="stHorizontalBlock"]:has(.stCheckbox) .stCheckbox {
-            margin: 0 !important;
-            display: flex !important;
-            align-items: center !important;
-            justify-content: center !important;
-        }
+        st.markdown("### 📖 Quick Topics")
+        topic = st.selectbox(
+            "Select a topic for guidance",
+            ["General", "Mechanics", "Thermodynamics", "Electromagnetism", 
+             "Quantum Physics", "Algebra", "Calculus", "Geometry", 
+             "Statistics", "Linear Algebra"],
+            index=0
+        )
         
-        /* Position the icon container as overlay on the left of chat input */
-        div[data-testid="stVerticalBlock"] > div:has(div[data-testid="stHorizontalBlock"] button):not(:has(div[data-testid="stChatInput"])) {
-            position: fixed !important;
-            bottom: 10px !important;
-            left: calc(var(--sidebar-width, 21rem) + 10px) !important;
-            z-index: 9999999 !important;
-            width: 110px !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-    
-    # ---- Add greeting message if chat is empty ----
-    if len(st.session_state.messages) == 0:
-        with st.chat_message("assistant", avatar=robot_img):
-            st.markdown("### Hello! 👋 How may I help you today?\n\nI'm your Physics & Mathematics tutor. Feel free to ask me any questions about physics or math problems, or request visualizations and diagrams!")
-
-    # ---- Display chat messages ----
-    for idx, message in enumerate(st.session_state.messages):
-        if message["role"] == "assistant":
-            with st.chat_message("assistant", avatar=robot_img):
-                st.markdown(message["content"])
-        else:
-            with st.chat_message("user", avatar=user_emoji):
-                st.markdown(message["content"])
-                if "image" in message and message["image"] is not None:
-                    st.image(message["image"], width=200)
+        if topic != "General":
+            st.caption(f"💡 Ask me anything about {topic}!")
+            # Example questions; ⚡ marks the ones answered instantly from the precomputed store
+            store = get_example_store()
+            for index, example in enumerate(example_bank.by_topic(get_example_bank()).get(topic, [])):
+                ready = store.has(example, EXAMPLE_DIFFICULTY) and st.session_state.difficulty == EXAMPLE_DIFFICULTY
+                label = f"{'⚡ ' if ready else ''}({example.level}) {example.text}"
+                if st.button(label, key=f"example_{topic}_{index}", use_container_width=True):
+                    # Asked on a full rerun, as if it had been typed into the chat input
+                    st.session_state.example_prompt = example.text
+                    st.rerun()
 
+@st.fragment
+def render_controls():
+    """The 📎 and 🔊 icons by the chat input, and the uploader; clicking them reruns only this fragment"""
     # Show file uploader when button is clicked
     if "show_uploader" not in st.session_state:
         st.session_state.show_uploader = False
         
-    uploaded_file = None
     if st.session_state.show_uploader:
         uploaded_file = st.file_uploader("Upload an image", type=["png", "jpg", "jpeg"], key="image_upload")
         if uploaded_file:
+            # Downsizing and transcription start now, while the question is being typed
+            process_uploaded_image(uploaded_file)
             st.success("✓ Image attached - you can now ask questions about it!")
 
     # ---- Control icons in fixed position above the chat input ----
@@ -470,130 +2819,256 @@ def main():
         col1, col2, col3 = st.columns([0.07, 0.07, 0.86])
         
         with col1:
-            if st.button("📎", help="Upload image", key="upload_trigger", use_container_width=True):
-                st.session_state.show_uploader = not st.session_state.show_uploader
-                st.rerun()
+            st.button("📎", help="Upload image", key="upload_trigger", use_container_width=True, on_click=toggle_uploader)
         
         with col2:
             enable_tts = st.checkbox("🔊", value=True, key="tts_toggle", 
                                     help="Text-to-Speech", label_visibility="collapsed")
     
-    # CSS to position icon container next to chat input
-    st.markdown("""
-        <style>
-        /* Position the icon container as overlay on the left of chat input */
-        div[data-testid="stVerticalBlock"] > div:has(div[data-testid="stHorizontalBlock"] button):not(:has(div[data-testid="stChatInput"])) {
-            position: fixed !important;
-            bottom: 10px !important;
-            left: calc(var(--sidebar-width, 21rem) + 10px) !important;
-            z-index: 9999999 !important;
-            width: auto !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Warm up the TTS engine so the first spoken answer doesn't pay for pyttsx3.init();
+    # sessions with speech turned off never load pyttsx3 at all
+    if enable_tts:
+        get_tts_engine()
+
+def main():
+    run_start = time.perf_counter()
+    st.set_page_config(page_title="Physics & Maths Solver", page_icon="🔬", layout="wide")
+
+    # ---- Sidebar ----
+    with st.sidebar:
+        st.title("🔬 Physics & Maths Question Solver")
+        st.caption("Your AI-powered tutor for Physics and Mathematics")
+        
+        st.markdown("---")
+        
+        # Collapsible Settings Section
+        render_settings()
+        
+        st.markdown("---")
+        if st.button("🗑️ Clear Chat History"):
+            # Nothing still being worked on can be shown any more
+            if st.session_state.get("active_job") is not None:
+                st.session_state.active_job.cancel("cleared")
+            st.session_state.speech_jobs = []
+            st.session_state.messages = []
+            st.session_state.messages_shown = CHAT_PAGE_SIZE
+            if "context" in st.session_state:
+                st.session_state.context.reset()
+            st.rerun()
+
+    # ---- Initialize session ----
+    initialize_session_state()
+    start_example_refresh()
+    difficulty = st.session_state.difficulty
+    stream_responses = st.session_state.stream_responses
+    enable_image_gen = st.session_state.enable_image_gen
+    race_image_apis = enable_image_gen and st.session_state.get("race_image_apis", True)
+    enable_graphs = st.session_state.enable_graphs
+
+    # ---- Emojis / Avatars ----
+    user_emoji = USER_EMOJI
+    robot_img = ROBOT_IMG
+    
+    # ---- FIXED CSS for bottom prompt bar with icons inline ----
+    st.markdown(CHAT_CSS, unsafe_allow_html=True)
+    
+    # ---- Add greeting message if chat is empty ----
+    if len(st.session_state.messages) == 0:
+        with st.chat_message("assistant", avatar=robot_img):
+            st.markdown("### Hello! 👋 How may I help you today?\n\nI'm your Physics & Mathematics tutor. Feel free to ask me any questions about physics or math problems, or request visualizations and diagrams!")
+
+    # ---- Display chat messages ----
+    render_history()
+
+    render_controls()
+    uploaded_file = st.session_state.get("image_upload") if st.session_state.show_uploader else None
+    enable_tts = st.session_state.tts_toggle
     
     # ---- Chat input (stays at bottom) ----
-    prompt = st.chat_input("Ask me a physics or maths question...")
+    prompt = st.chat_input("Ask me a physics or maths question...") or st.session_state.pop("example_prompt", None)
     
     if prompt:
-        # Check if user wants graph generation (math/physics)
-        wants_graph = enable_graphs and any(keyword in prompt.lower() for keyword in 
-                                            ["plot", "graph", "chart", "diagram of function"])
+        # Everything done for this question is traced; "Profile the next question" adds a sampling profile
+        profiler = tracing.SamplingProfiler().start() if st.session_state.pop("profile_next", False) else None
+        # A new question makes whatever is left of the previous one (usually its speech) useless
+        if st.session_state.active_job is not None:
+            st.session_state.active_job.cancel("superseded")
+        job = st.session_state.active_job = jobs.Job()
+        with jobs.running(job), tracing.trace("chat.request", get_trace_exporter(), difficulty=difficulty,
+                                              stream=stream_responses, chars=len(prompt)) as request_span:
+            with tracing.span("intent") as intent_span:
+                # Decide whether the question needs a written answer, a graph (math/physics),
+                # an AI image (creative images) or a mix of them
+                route = get_intent_router().route(prompt)
+                wants_graph = enable_graphs and route.graph
+                wants_image = enable_image_gen and route.image
+                wants_answer = route.answer or not (wants_graph or wants_image)
+                intent_span.set(answer=wants_answer, graph=wants_graph, image=wants_image)
         
-        # Check if user wants AI image generation (creative images)
-        wants_image = enable_image_gen and any(keyword in prompt.lower() for keyword in 
-                                               ["draw", "create image", "generate image", "show me", "picture of", "image of", "visualize"])
+            # The graph and the image don't depend on the answer, so they start now and run
+            # alongside it; the graph is rendered as soon as its code arrives
+            stages = AnswerStages()
+            stored_graph = precomputed_graph(prompt, difficulty) if wants_graph and not uploaded_file else None
+            if stored_graph is not None:
+                stages.finish("graph", stored_graph)
+            elif wants_graph:
+                stages.start("graph.code", request_graph_code, st.session_state.utility_model, prompt)
+                stages.start("graph", render_graph_png, after="graph.code")
+            if wants_image:
+                stages.start("image", find_image, prompt, race_image_apis)
         
-        # User message
-        with st.chat_message("user", avatar=user_emoji):
-            st.markdown(prompt)
+            # User message
+            with st.chat_message("user", avatar=user_emoji):
+                st.markdown(prompt)
         
-        user_msg = {"role": "user", "content": prompt, "image": None}
-        if uploaded_file:
-            user_msg["image"] = uploaded_file
-        st.session_state.messages.append(user_msg)
+            # Handle image input if present
+            img_for_analysis = None
+            image_text = None
+            user_msg = ChatMessage("user", prompt)
+            if uploaded_file:
+                with tracing.span("upload"):
+                    # A worksheet can only be split into its parts once it has been transcribed
+                    image_text, img_for_analysis = process_uploaded_image(
+                        uploaded_file, FANOUT_TRANSCRIPTION_WAIT if st.session_state.get("fan_out", True) else 0)
+                if img_for_analysis is None:
+                    st.error(image_text)
+                    image_text = None
+                else:
+                    # The history keeps a thumbnail rather than the original upload
+                    user_msg.image = get_media_store().put(prepare_upload(uploaded_file).jpeg_bytes, MEDIA_THUMBNAIL_SIZE)
+            st.session_state.messages.append(user_msg)
 
-        # Get bot response
-        with st.chat_message("assistant", avatar=robot_img):
-            # If user wants image generation, skip Gemini response and go straight to image generation
-            if wants_image and not wants_graph:
-                response = "🎨 Generating your image..."
-                st.markdown(response)
+            # Speech is synthesized in the background, sentence by sentence, as the answer arrives
+            metrics = {}
+            response_image = None
+            response_graph = None
+            speech_job = None
+            if enable_tts and wants_answer:
+                speech_job = SpeechJob(metrics)
+                st.session_state.speech_jobs.append(speech_job)
+
+            # Get bot response
+            with st.chat_message("assistant", avatar=robot_img):
+                # A slot per part, in reading order, so each can be filled in whenever it is ready
+                answer_slot = st.container()
+                image_slot = st.container() if wants_image else None
+                graph_slot = st.container() if wants_graph else None
+                if wants_image:
+                    with image_slot:
+                        st.markdown("---")
+                        image_status = st.empty()
+                        image_status.markdown("🎨 Generating your image...")
+                if wants_graph:
+                    with graph_slot:
+                        st.markdown("---")
+                        st.markdown("**📊 Generated Visualization:**")
+                        graph_status = st.empty()
+                        graph_status.caption("Drawing the graph...")
                 
-                # Generate AI image immediately
-                st.markdown("---")
-                generated_image = generate_image_with_api(prompt)
-                if generated_image:
-                    # Store in session state to persist after download
-                    st.session_state.last_generated_image = generated_image
-                    st.image(generated_image, caption="AI Generated Image", use_column_width=True)
-                    
-                    # Add download button for AI generated image
-                    img_buffer = BytesIO()
-                    generated_image.save(img_buffer, format='PNG')
-                    img_buffer.seek(0)
-                    st.download_button(
-                        label="⬇️ Download Image",
-                        data=img_buffer,
-                        file_name="ai_generated_image.png",
-                        mime="image/png",
-                        key=f"download_img_{len(st.session_state.messages)}"
-                    )
-                    response = "🎨 Image generated successfully!"
-                else:
-                    response = "❌ Failed to generate image. Please try again with a different prompt."
-            else:
-                with st.spinner("Thinking..."):
-                    # Handle image input if present
-                    img_for_analysis = None
-                    if uploaded_file:
-                        img_for_analysis = Image.open(uploaded_file)
-                    
-                    response = get_bot_response(prompt, difficulty, img_for_analysis)
-                    st.markdown(response)
+                response = ""
+                with answer_slot:
+                    if wants_answer and stream_responses:
+                        placeholder = st.empty()
+                        with tracing.span("answer", stream=True) as answer_span:
+                            for chunk in stream_bot_response(prompt, difficulty, img_for_analysis, metrics, image_text):
+                                response += chunk
+                                placeholder.markdown(response + "▌")
+                                if speech_job:
+                                    speech_job.feed(chunk)
+                            placeholder.markdown(response)
+                            answer_span.set(cached=metrics.get("cached", False))
+                        record_response_metrics(metrics)
+                    elif wants_answer:
+                        with st.spinner("Thinking..."), tracing.span("answer", stream=False) as answer_span:
+                            response = get_bot_response(prompt, difficulty, img_for_analysis, metrics, image_text)
+                            st.markdown(response)
+                            answer_span.set(cached=metrics.get("cached", False))
+                        record_response_metrics(metrics)
+                        if speech_job:
+                            speech_job.feed(response)
                 
-            # Generate graph if requested (for math/physics)
-            if wants_graph:
-                st.markdown("---")
-                st.markdown("**📊 Generated Visualization:**")
-                code = generate_graph_with_ai(prompt)
-                if code:
-                    graph_buf = execute_graph_code(code)
-                    if graph_buf:
-                        # Store in session state to persist after download
-                        st.session_state.last_generated_graph = graph_buf
-                        st.image(graph_buf, caption="Generated Graph", use_column_width=True)
-                        
-                        # Add download button for graph
-                        graph_buf.seek(0)
-                        st.download_button(
-                            label="⬇️ Download Graph",
-                            data=graph_buf,
-                            file_name="graph.png",
-                            mime="image/png",
-                            key=f"download_graph_{len(st.session_state.messages)}"
-                        )
-                        
-                        with st.expander("📝 View Python Code"):
-                            st.code(code, language="python")
-            
-            # Generate audio if TTS is enabled (auto-play with hidden player) - only for non-image requests
-            if enable_tts and not wants_image:
-                audio_bytes = text_to_speech(response)
-                if audio_bytes:
-                    # Convert audio bytes to base64 for HTML embedding
-                    import base64
-                    audio_base64 = base64.b64encode(audio_bytes).decode()
-                    
-                    # Create hidden audio player that auto-plays
-                    audio_html = f"""
-                    <audio autoplay style="display: none;">
-                        <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                    </audio>
-                    """
-                    st.markdown(audio_html, unsafe_allow_html=True)
+                # Speech for the last sentences can start before the graph or image is shown
+                if speech_job:
+                    speech_job.finish()
+                
+                # Whichever of the image and the graph finishes first is shown first
+                for stage in stages.as_completed(["image", "graph"]):
+                    if stage == "image":
+                        with image_slot:
+                            image_status.empty()
+                            generated_image = generate_image_with_api(prompt, race_image_apis, stages.get("image"))
+                            metrics["image"] = stages.durations.get("image")
+                            if generated_image:
+                                st.image(generated_image, caption="AI Generated Image", use_column_width=True)
+                            
+                                # Add download button for AI generated image
+                                img_buffer = BytesIO()
+                                generated_image.save(img_buffer, format='PNG')
+                                # Kept in the history so it persists after the download rerun
+                                response_image = get_media_store().put(img_buffer.getvalue(), MEDIA_DISPLAY_SIZE)
+                                img_buffer.seek(0)
+                                st.download_button(
+                                    label="⬇️ Download Image",
+                                    data=img_buffer,
+                                    file_name="ai_generated_image.png",
+                                    mime="image/png",
+                                    key=f"download_img_{len(st.session_state.messages)}"
+                                )
+                                response = response or "🎨 Image generated successfully!"
+                            else:
+                                failed = "❌ Failed to generate image. Please try again with a different prompt."
+                                response = f"{response}\n\n{failed}" if response else failed
+                    else:
+                        with graph_slot:
+                            graph_status.empty()
+                            code = None
+                            if stored_graph is not None:
+                                graph_buf = BytesIO(stored_graph)
+                            else:
+                                code = generate_graph_with_ai(prompt, stages.get("graph.code"))
+                                graph_buf = execute_graph_code(code, stages.get("graph")) if code else None
+                                metrics["graph"] = sum(stages.durations.get(name, 0.0) for name in ("graph.code", "graph"))
+                            if graph_buf:
+                                # Kept in the history so it persists after the download rerun
+                                response_graph = get_media_store().put(graph_buf.getvalue(), MEDIA_DISPLAY_SIZE)
+                                st.image(graph_buf, caption="Generated Graph", use_column_width=True)
+                            
+                                # Add download button for graph
+                                graph_buf.seek(0)
+                                st.download_button(
+                                    label="⬇️ Download Graph",
+                                    data=graph_buf,
+                                    file_name="graph.png",
+                                    mime="image/png",
+                                    key=f"download_graph_{len(st.session_state.messages)}"
+                                )
+                            
+                                if code:
+                                    with st.expander("📝 View Python Code"):
+                                        st.code(code, language="python")
+                            if not wants_answer:
+                                response = "📊 Graph generated successfully!" if response_graph else "❌ Failed to generate the graph. Please try rephrasing it."
+                if not wants_answer:
+                    record_response_metrics(metrics)
         
-        st.session_state.messages.append({"role": "assistant", "content": response})
+            st.session_state.messages.append(ChatMessage("assistant", response, response_image, response_graph))
+            if speech_job is None:
+                # Otherwise the job stays open until its speech has been played
+                job.close()
+
+        if profiler is not None:
+            request_span.trace.profile = profiler.stop()
+        st.session_state.traces.append(request_span.trace)
+    else:
+        # Reruns without a new question are pure rendering, so their time tracks the history size
+        st.session_state.render_times.append(time.perf_counter() - run_start)
+    
+    # Play speech as it is synthesized without holding up the script run
+    if st.session_state.speech_jobs:
+        deliver_speech()
+
+    render_performance_panel()
+    render_debug_panel()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,284 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Headless batch mode: solves a whole question file without the Streamlit UI, using the app's
+# own persona, answer cache, local solver and graph pipeline. Each result is appended to
+# results.jsonl as soon as it is ready, so an interrupted run resumes where it stopped;
+# solutions.md and the rendered graphs are written next to it.
+#
+#   python batch_solve.py Chatbot_Examples_Questions.txt --out solutions
+#   python batch_solve.py worksheet.jsonl --out solutions --workers 8
+#   python batch_solve.py Chatbot_Examples_Questions.txt --out /tmp/solutions --stub   # offline mock model
+#
+# JSONL input has one object per line with a "question" and optionally "id", "topic",
+# "level" and "difficulty". Text input uses the layout of Chatbot_Examples_Questions.txt:
+# blank-line separated blocks, "(Level) question" for questions and anything else as a topic.
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import example_bank
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Physics-Maths-Solver-ChatBot.py")
+DIFFICULTIES = ["Beginner", "Standard", "Advanced", "Expert"]
+
+Question = namedtuple("Question", ["id", "topic", "level", "text", "difficulty"])
+
+def question_id(text, difficulty):
+    """Stable across runs, so a checkpoint still matches after the file is reordered or extended"""
+    return hashlib.sha1(f"{difficulty}\n{text}".encode("utf-8")).hexdigest()[:12]
+
+def read_questions(path, difficulty="Standard"):
+    """Parse a JSONL or text question file into Questions"""
+    if not path.endswith(".jsonl"):
+        return [Question(question_id(example.text, difficulty), example.topic, example.level, example.text, difficulty)
+                for example in example_bank.load_bank(path)]
+
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    questions = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if not item.get("question"):
+            raise ValueError(f"{path}:{number}: missing \"question\"")
+        level = item.get("difficulty", difficulty)
+        if level not in DIFFICULTIES:
+            raise ValueError(f"{path}:{number}: difficulty must be one of {', '.join(DIFFICULTIES)}")
+        text = " ".join(item["question"].split())
+        questions.append(Question(str(item.get("id") or question_id(text, level)), item.get("topic"),
+                                  item.get("level"), text, level))
+    return questions
+
+def load_app(stub=False, cache_dir=None):
+    """Import the Streamlit script as a module and set up one headless session for the batch"""
+    if stub:
+        os.environ["CHATBOT_STUB_MODEL"] = "1"
+        os.environ.setdefault("CHATBOT_CACHE_DIR", cache_dir or tempfile.mkdtemp(prefix="chatbot-batch-"))
+    elif cache_dir:
+        os.environ["CHATBOT_CACHE_DIR"] = cache_dir
+    # Without `streamlit run` every st call warns that there is no script context
+    from streamlit import logger
+    logger.set_log_level(logging.ERROR)
+    spec = importlib.util.spec_from_file_location("chatbot_app", APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+
+    app.initialize_session_state()
+    # Every question is a fresh conversation; the global rate limit still protects the quota
+    app.get_model_gateway().set_session_limit(app.st.session_state.session_id,
+                                              app.GATEWAY_GLOBAL_RATE, app.GATEWAY_GLOBAL_BURST)
+    return app
+
+def solve_question(app, question, out_dir, graphs=True):
+    """Answer one question (and render its graph) the way the chat would; returns a result record"""
+    result = {"id": question.id, "topic": question.topic, "level": question.level,
+              "difficulty": question.difficulty, "question": question.text,
+              "answer": None, "graph": None, "source": None, "skipped": [], "error": None}
+    metrics = {}
+    start = time.perf_counter()
+    with app.tracing.trace("batch.question", app.get_trace_exporter(), question_id=question.id):
+        route = app.get_intent_router().route(question.text)
+        result["route"] = [label for label in route._fields if getattr(route, label)]
+        if route.image:
+            result["skipped"].append("image")
+        # The graph is drawn while the answer is written, as in the chat
+        stages = app.AnswerStages()
+        if route.graph and graphs:
+            stages.start("graph.code", app.request_graph_code, app.st.session_state.utility_model, question.text)
+            stages.start("graph", app.render_graph_png, after="graph.code")
+        if route.answer or not (route.graph or route.image):
+            answer = app.get_bot_response(question.text, question.difficulty, metrics=metrics)
+            if answer.startswith("⚠️"):
+                result["error"] = answer.removeprefix("⚠️").strip().split("\n")[0]
+            else:
+                result["answer"] = answer
+            result["source"] = ("precomputed" if metrics.get("precomputed") else "local" if metrics.get("local")
+                                else "cache" if metrics.get("cached") else "model")
+        if route.graph and not graphs:
+            result["skipped"].append("graph")
+        elif route.graph:
+            code = app.generate_graph_with_ai(question.text, stages.get("graph.code"))
+            png = app.execute_graph_code(code, stages.get("graph")) if code else None
+            if png is None:
+                result["error"] = result["error"] or "the graph could not be generated"
+            else:
+                os.makedirs(os.path.join(out_dir, "graphs"), exist_ok=True)
+                result["graph"] = f"graphs/{question.id}.png"
+                app.write_file_atomic(os.path.join(out_dir, result["graph"]), png.getvalue())
+    result["latency"] = round(time.perf_counter() - start, 3)
+    result["prompt_tokens"] = metrics.get("prompt_tokens")
+    result["tier"] = metrics.get("tier")
+    return result
+
+def load_checkpoint(path):
+    """Results already written by an earlier run, by question id (failed ones are retried)"""
+    done = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short when the last run was killed
+                if not result.get("error"):
+                    done[result["id"]] = result
+    return done
+
+def write_markdown(path, questions, results):
+    """All finished solutions in the order of the question file"""
+    lines = ["# Solutions", ""]
+    topic = None
+    for number, question in enumerate(questions, 1):
+        result = results.get(question.id)
+        if result is None:
+            continue
+        if question.topic and question.topic != topic:
+            topic = question.topic
+            lines += [f"## {topic}", ""]
+        level = f"({question.level}) " if question.level else ""
+        lines += [f"### {number}. {level}{question.text}", ""]
+        if result.get("answer"):
+            lines += [result["answer"], ""]
+        if result.get("graph"):
+            lines += [f"![Graph for question {number}]({result['graph']})", ""]
+        if result.get("error"):
+            lines += [f"> ⚠️ {result['error']}", ""]
+        if "image" in result.get("skipped", []):
+            lines += ["> 🎨 Image generation isn't run in batch mode; ask for this one in the chat.", ""]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))] if ordered else 0.0
+
+def solve_questions(questions, out_dir, app=None, workers=4, graphs=True, resume=True, progress=None):
+    """Solve questions with at most `workers` in flight, appending each result to
+    out_dir/results.jsonl; returns the throughput summary"""
+    app = app or load_app()
+    os.makedirs(out_dir, exist_ok=True)
+    results_path = os.path.join(out_dir, "results.jsonl")
+    results = load_checkpoint(results_path) if resume else {}
+    todo = [question for question in questions if question.id not in results]
+    if not resume and os.path.exists(results_path):
+        os.remove(results_path)
+
+    lock = threading.Lock()
+    finished = []
+    start = time.perf_counter()
+    try:
+        with open(results_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+            futures = {executor.submit(solve_question, app, question, out_dir, graphs): question for question in todo}
+            try:
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        question = futures[future]
+                        result = {"id": question.id, "question": question.text, "error": str(e), "latency": None}
+                    with lock:
+                        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                        out.flush()
+                        results[result["id"]] = result
+                        finished.append(result)
+                    if progress:
+                        progress(len(finished), len(todo), result)
+            except KeyboardInterrupt:
+                # Finished results are already on disk; the rest are picked up by the next run
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        write_markdown(os.path.join(out_dir, "solutions.md"), questions, results)
+
+    wall = time.perf_counter() - start
+    latencies = [result["latency"] for result in finished if result.get("latency") is not None]
+    return {
+        "questions": len(questions),
+        "resumed": len(questions) - len(todo),
+        "solved": len(finished),
+        "errors": sum(1 for result in finished if result.get("error")),
+        "precomputed": sum(1 for result in finished if result.get("source") == "precomputed"),
+        "local": sum(1 for result in finished if result.get("source") == "local"),
+        "cached": sum(1 for result in finished if result.get("source") == "cache"),
+        "model": sum(1 for result in finished if result.get("source") == "model"),
+        "graphs": sum(1 for result in finished if result.get("graph")),
+        "wall_seconds": wall,
+        "per_minute": len(finished) / wall * 60 if wall else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "gateway": app.get_model_gateway().stats(),
+    }
+
+def report_progress(done, total, result):
+    if result.get("error"):
+        status = f"error: {result['error']}"
+    else:
+        status = result.get("source") or ("graph" if result.get("graph") else "skipped")
+    print(f"[{done}/{total}] {result.get('latency') or 0:6.2f}s {status:10} {result['question'][:70]}",
+          file=sys.stderr, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a file of questions without the Streamlit UI")
+    parser.add_argument("questions", help="question file: .jsonl, or text laid out like Chatbot_Examples_Questions.txt")
+    parser.add_argument("--out", required=True, help="directory for results.jsonl, solutions.md and graphs/")
+    parser.add_argument("--workers", type=int, default=4, help="questions solved at once")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES, default="Standard",
+                        help="difficulty for questions that don't set their own")
+    parser.add_argument("--no-graphs", action="store_true", help="skip graph rendering")
+    parser.add_argument("--no-local", action="store_true", help="send every question to the model")
+    parser.add_argument("--restart", action="store_true", help="ignore results from an earlier run")
+    parser.add_argument("--stub", action="store_true", help="use the offline mock model and a throwaway cache")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions, args.difficulty)
+    app = load_app(stub=args.stub)
+    if args.no_local:
+        app.st.session_state.local_solver = False
+    try:
+        summary = solve_questions(questions, args.out, app, args.workers, not args.no_graphs,
+                                  resume=not args.restart, progress=report_progress)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; finished results are in {args.out}. Run again to resume.", file=sys.stderr)
+        sys.exit(130)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{summary['solved']} solved in {summary['wall_seconds']:.1f}s ({summary['per_minute']:.1f} per minute)"
+          + (f", {summary['resumed']} already done" if summary["resumed"] else ""))
+    print(f"  {summary['precomputed']} precomputed · {summary['local']} local · {summary['cached']} cached · "
+          f"{summary['model']} model · {summary['graphs']} graphs · {summary['errors']} errors")
+    print(f"  latency p50 {summary['latency_p50']:.2f}s · p95 {summary['latency_p95']:.2f}s · "
+          f"{summary['gateway']['upstream_calls']} upstream calls · {summary['gateway']['retries']} retries")
+    print(f"  {os.path.join(args.out, 'solutions.md')}")
+
+if __name__ == "__main__":
+    main()
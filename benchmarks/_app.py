@@ -0,0 +1,163 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Shared helpers for the benchmark scripts
+
+import importlib.util
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "Physics-Maths-Solver-ChatBot.py")
+
+# The app's helper modules (graph_worker, quick_plot, ...) live next to it
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+def configure_environment(live=False, stub_delay=None, cache_dir=None):
+    """Point the app at the stub model and a throwaway cache unless told otherwise"""
+    if not live:
+        os.environ["CHATBOT_STUB_MODEL"] = "1"
+    if stub_delay is not None:
+        os.environ["CHATBOT_STUB_DELAY"] = str(stub_delay)
+    os.environ["CHATBOT_CACHE_DIR"] = cache_dir or tempfile.mkdtemp(prefix="chatbot-bench-")
+
+def load_app(live=False, stub_delay=None, cache_dir=None):
+    """Import the Streamlit script as a module (its file name isn't a valid module name)"""
+    configure_environment(live, stub_delay, cache_dir)
+    spec = importlib.util.spec_from_file_location("chatbot_app", APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(values, pcts=(50, 95)):
+    """Format the given percentiles and the mean of a list of seconds as milliseconds"""
+    if not values:
+        return "n/a"
+    parts = [f"p{pct} {percentile(values, pct) * 1000:8.1f} ms" for pct in pcts]
+    return " · ".join(parts + [f"mean {statistics.mean(values) * 1000:8.1f} ms"])
+
+def start_fake_image_server(latency=1.0, jitter=0.0, error_rate=0.0):
+    """Serve a PNG for any request after a log-normal delay, failing a share of requests with 503.
+    Returns the base URL to put in CHATBOT_IMAGE_API_BASE."""
+    buf = io.BytesIO()
+    Image.effect_noise((512, 512), 64).convert("RGB").save(buf, format="PNG")
+    png = buf.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _respond(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            time.sleep(latency * random.lognormvariate(0, jitter))
+            failed = random.random() < error_rate
+            self.send_response(503 if failed else 200)
+            self.send_header("Content-Type", "text/plain" if failed else "image/png")
+            self.send_header("Content-Length", "0" if failed else str(len(png)))
+            self.end_headers()
+            if not failed:
+                self.wfile.write(png)
+
+        do_GET = do_POST = _respond
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def start_fake_gemini_server(rpm=15, latency=0.5, chunks=8):
+    """Answer Gemini REST calls (generateContent and streamGenerateContent) after `latency`
+    seconds, enforcing `rpm` requests per minute per API key with 429 RESOURCE_EXHAUSTED like the
+    real API. Returns the base URL for CHATBOT_GEMINI_API_BASE and a Counter of
+    (key, status) pairs."""
+    lock = threading.Lock()
+    windows = {}
+    counts = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            key = self.headers.get("x-goog-api-key", "")
+            now = time.monotonic()
+            with lock:
+                window = windows.setdefault(key, deque())
+                while window and window[0] <= now - 60:
+                    window.popleft()
+                allowed = len(window) < rpm
+                if allowed:
+                    window.append(now)
+                counts[key, 200 if allowed else 429] += 1
+            if not allowed:
+                self._send_json(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                                "message": "Resource has been exhausted (e.g. check quota)."}})
+                return
+
+            words = [f"word{i} " for i in range(chunks)]
+            def piece(text, last):
+                body = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+                if last:
+                    body["candidates"][0]["finishReason"] = "STOP"
+                    body["usageMetadata"] = {"promptTokenCount": 50, "candidatesTokenCount": chunks,
+                                             "totalTokenCount": 50 + chunks}
+                return body
+            if ":streamGenerateContent" not in self.path:
+                time.sleep(latency)
+                self._send_json(200, piece("".join(words), True))
+                return
+            # Streamed as server-sent events, one piece at a time, as the REST API does with alt=sse
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i, word in enumerate(words):
+                time.sleep(latency / chunks)
+                self.wfile.write(b"data: " + json.dumps(piece(word, i == chunks - 1)).encode() + b"\r\n\r\n")
+                self.wfile.flush()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", counts
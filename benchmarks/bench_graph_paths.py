@@ -0,0 +1,92 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Compares graph latency on the local fast path (quick_plot) and the LLM path.
+#
+#   python benchmarks/bench_graph_paths.py              # stub model, offline
+#   python benchmarks/bench_graph_paths.py --live       # real Gemini (needs .streamlit/secrets.toml)
+
+import argparse
+import time
+
+from _app import load_app, summarize
+
+import quick_plot
+
+PROMPTS = [
+    "plot y = sin(x) from 0 to 2pi",
+    "graph v = u + at",
+    "plot sin(x) and cos(x)",
+    "plot x = cos(t), y = sin(t)",
+    "Plot y = x^2 - 5x + 6 from -1 to 6",
+    "plot tan(x)",
+    "graph s = ut + 1/2 at^2 with u = 2 and a = 9.8",
+    "plot f(x) = e^(-x^2)",
+    "Plot y = x^3 for -2 <= x <= 2",
+    "plot x^2, x^3 for x in [-2, 2]",
+    "plot the trajectory of a projectile launched at 30 degrees",
+    "graph the electric field of a point charge against distance",
+    "plot a velocity-time graph for a car accelerating then braking",
+    "draw a diagram of function composition f(g(x))",
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare graph latency on the local fast path and the LLM path")
+    parser.add_argument("--live", action="store_true", help="use the real Gemini API instead of the stub model")
+    parser.add_argument("--stub-delay", type=float, default=0.05, help="seconds per stub model chunk")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per prompt")
+    args = parser.parse_args()
+
+    app = load_app(live=args.live, stub_delay=args.stub_delay)
+    model = app.create_model('gemini-2.0-flash-exp')
+    pool = app.GraphWorkerPool()
+    pool.warm()
+    
+    timings = {"fast": {"codegen": [], "render": [], "total": []},
+               "llm": {"codegen": [], "render": [], "total": []}}
+    for prompt in PROMPTS:
+        path = "fast" if quick_plot.build_plot_code(prompt) is not None else "llm"
+        for run in range(args.repeat):
+            start = time.perf_counter()
+            code = quick_plot.build_plot_code(prompt)
+            if code is None:
+                # A unique prompt per run so the graph code cache can't answer it
+                code = app.request_graph_code(model, f"{prompt} (run {run})")
+            codegen = time.perf_counter() - start
+            
+            # Rendering goes straight to the worker pool, bypassing the PNG cache
+            start = time.perf_counter()
+            try:
+                pool.render(code)
+            except Exception as e:
+                print(f"  render failed for {prompt!r}: {e}")
+            render = time.perf_counter() - start
+            
+            timings[path]["codegen"].append(codegen)
+            timings[path]["render"].append(render)
+            timings[path]["total"].append(codegen + render)
+        print(f"[{path:4}] {prompt}")
+
+    fast_share = sum(1 for p in PROMPTS if quick_plot.build_plot_code(p) is not None) / len(PROMPTS)
+    print()
+    print(f"Fast path handled {fast_share:.0%} of {len(PROMPTS)} prompts")
+    for path, label in (("fast", "Fast path"), ("llm", "LLM path")):
+        print(f"{label}:")
+        for stage in ("codegen", "render", "total"):
+            print(f"  {stage:8} {summarize(timings[path][stage])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# API key pool benchmark: sends a burst of questions from many sessions through the real Gemini
+# SDK and the model gateway to a local fake API that enforces a per-key requests-per-minute
+# quota, once per key count. With one key most of the burst is refused with 429; with more
+# keys the calls are spread over them and the answered share and throughput grow.
+#
+#   python benchmarks/bench_keys.py
+#   python benchmarks/bench_keys.py --keys 1 2 4 --rpm 20 --questions 80
+
+import argparse
+import logging
+import os
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from _app import load_app, start_fake_gemini_server, summarize
+
+def run(app, keys, questions, sessions, run_id):
+    """Ask `questions` distinct questions from `sessions` sessions at once over `keys` keys"""
+    os.environ["CHATBOT_GEMINI_API_KEYS"] = ",".join(f"bench-{run_id}-key-{number:04d}" for number in range(keys))
+    app.get_key_pool.clear()
+    app.get_model.clear()
+    model = app.get_model(app.MODEL_NAME, app.SYSTEM_PROMPT)
+    gateway = app.get_model_gateway()
+    clients = []
+    for session in range(sessions):
+        session_id = f"bench-{run_id}-{session}"
+        gateway.set_session_limit(session_id, 100.0, 100)
+        clients.append(app.GatewayModel(model, session_id))
+
+    def ask(number):
+        start = time.perf_counter()
+        try:
+            clients[number % sessions].generate_content(f"Question {number} of run {run_id}").text
+            return "answered", time.perf_counter() - start
+        except Exception as e:
+            return type(e).__name__, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(ask, range(questions)))
+    return results, time.perf_counter() - start, app.get_key_pool().health()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput against a per-key quota with more API keys")
+    parser.add_argument("--keys", type=int, nargs="*", default=[1, 3], help="key counts to compare")
+    parser.add_argument("--rpm", type=int, default=20, help="requests per minute the fake API allows each key")
+    parser.add_argument("--questions", type=int, default=60, help="questions asked per run")
+    parser.add_argument("--sessions", type=int, default=8, help="sessions asking at once")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds the fake API takes to answer")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    base, counts = start_fake_gemini_server(rpm=args.rpm, latency=args.latency)
+    os.environ["CHATBOT_GEMINI_API_BASE"] = base
+    os.environ["CHATBOT_GEMINI_KEY_RPM"] = str(args.rpm)
+    app = load_app(live=True)
+    from streamlit import logger
+    logger.set_log_level(logging.ERROR)
+
+    for run_id, keys in enumerate(args.keys):
+        before = Counter(counts)
+        results, elapsed, health = run(app, keys, args.questions, args.sessions, run_id)
+        outcomes = Counter(outcome for outcome, _ in results)
+        upstream = Counter(counts)
+        upstream.subtract(before)
+        refused = sum(count for (_, status), count in upstream.items() if status == 429)
+        answered = [latency for outcome, latency in results if outcome == "answered"]
+        print(f"{keys} key{'s' if keys > 1 else ''}: {outcomes['answered']}/{args.questions} answered in {elapsed:.1f}s "
+              f"({outcomes['answered'] / elapsed * 60:.0f} per minute) · {refused} upstream 429s"
+              + "".join(f" · {count} {outcome}" for outcome, count in outcomes.items() if outcome != "answered"))
+        print(f"  latency {summarize(answered)}")
+        for key in health:
+            print(f"  {key['name']} {key['key']}: {key['calls']} calls · {key['throttled']} 429s · "
+                  f"resting {key['cooldown']:.0f}s")
+
+if __name__ == "__main__":
+    main()
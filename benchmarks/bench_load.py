@@ -0,0 +1,285 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Load test: replays the example questions through the whole app (main() via Streamlit's
+# AppTest) from several concurrent sessions, against local stand-ins for Gemini, the image
+# providers and text-to-speech, and reports end-to-end and per-stage latency.
+#
+#   python benchmarks/bench_load.py                                 # 4 sessions, defaults
+#   python benchmarks/bench_load.py --sessions 16 --model-error-rate 0.05
+#   python benchmarks/bench_load.py --max-p95 5 --max-error-rate 0.02   # exits 1 if a gate fails
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from _app import APP_PATH, REPO_DIR, configure_environment, percentile, start_fake_image_server, summarize
+
+QUESTIONS_PATH = os.path.join(REPO_DIR, "Chatbot_Examples_Questions.txt")
+LEVELS = ["Easy", "Basic", "Intermediate", "Challenging", "Advanced"]
+
+# Mixed into the workload so the graph and image paths are exercised too
+GRAPH_PROMPTS = [
+    "plot y = sin(x) from 0 to 2pi",
+    "graph s = ut + 1/2 at^2 with u = 2 and a = 9.8",
+    "plot the trajectory of a projectile launched at 30 degrees",
+    "graph the electric field of a point charge against distance",
+]
+IMAGE_PROMPTS = [
+    "draw a simple pendulum with its forces labelled",
+    "picture of the magnetic field around a bar magnet",
+    "show me a diagram of a convex lens forming an image",
+]
+
+def load_questions(path=QUESTIONS_PATH):
+    """Parse the example questions into (topic, level, question) tuples"""
+    with open(path, encoding="utf-8") as f:
+        blocks = [block.strip() for block in re.split(r"\n\s*\n", f.read().replace("\r\n", "\n"))]
+
+    questions = []
+    topic = None
+    for block in filter(None, blocks):
+        match = re.match(r"\((\w+)\)\s*(.*)", block, re.S)
+        if match:
+            questions.append((topic, match.group(1), " ".join(match.group(2).split())))
+        else:
+            topic = block
+    return questions
+
+def build_workload(questions, args, session):
+    """Pick this session's prompts as (kind, level, prompt) tuples"""
+    rng = random.Random(args.seed + session)
+    workload = []
+    for turn in range(args.questions):
+        roll = rng.random()
+        if roll < args.graph_share:
+            workload.append(("graph", None, rng.choice(GRAPH_PROMPTS)))
+        elif roll < args.graph_share + args.image_share:
+            workload.append(("image", None, rng.choice(IMAGE_PROMPTS)))
+        else:
+            topic, level, question = rng.choice(questions)
+            if args.unique:
+                # Defeat the answer cache so every question reaches the model
+                question = f"{question} (student {session}, turn {turn})"
+            workload.append(("answer", level, question))
+    return workload
+
+def wait_for_first_audio(at, metrics, timeout):
+    """AppTest doesn't run the speech polling fragment, so poll this answer's speech job directly"""
+    deadline = time.perf_counter() + timeout
+    jobs = [job for job in at.session_state["speech_jobs"] if job.metrics is metrics]
+    while jobs and "ttfa" not in metrics and not jobs[0].done and time.perf_counter() < deadline:
+        jobs[0].ready_chunks()
+        time.sleep(0.01)
+
+def last_reply(at):
+    messages = at.session_state["messages"]
+    return messages[-1].content if messages and messages[-1].role == "assistant" else ""
+
+def share_compiled_script():
+    """A real server compiles the script once, but AppTest compiles it on every run, and concurrent
+    compiles can crash CPython's AST builder. Give every session one shared, lock-protected copy."""
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    get_bytecode = ScriptCache.get_bytecode
+    shared = ScriptCache()
+    lock = threading.Lock()
+
+    def get_shared_bytecode(self, script_path):
+        with lock:
+            return get_bytecode(shared, script_path)
+
+    ScriptCache.get_bytecode = get_shared_bytecode
+
+def run_session(session, workload, args, results, lock):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    start = time.perf_counter()
+    at.run()
+    record = {"session": session, "load": time.perf_counter() - start, "turns": []}
+    if not args.tts:
+        at.checkbox(key="tts_toggle").uncheck().run()
+
+    for kind, level, prompt in workload:
+        previous = at.session_state["response_metrics"][-1] if at.session_state["response_metrics"] else None
+        start = time.perf_counter()
+        error = None
+        try:
+            at.chat_input[0].set_value(prompt).run()
+            if at.exception:
+                error = at.exception[0].value
+        except Exception as e:
+            error = str(e)
+        end_to_end = time.perf_counter() - start
+
+        metrics = at.session_state["response_metrics"][-1] if at.session_state["response_metrics"] else None
+        metrics = metrics if metrics is not previous else {}
+        if args.tts and error is None:
+            wait_for_first_audio(at, metrics, args.timeout)
+
+        reply = last_reply(at)
+        if error is None and reply.startswith(("⚠️", "❌")):
+            error = reply.splitlines()[0]
+        record["turns"].append({"kind": kind, "level": level, "end_to_end": end_to_end, "error": error,
+                                **{stage: metrics.get(stage) for stage in ("ttft", "total", "ttfa", "graph", "image")}})
+        time.sleep(args.think_time)
+
+    record["gateway"] = at.session_state["model"].gateway.stats()
+    with lock:
+        results.append(record)
+
+def report(results, wall_time, args):
+    """Print the summary and return it as a dict (for --json and the gates)"""
+    turns = [turn for record in results for turn in record["turns"]]
+    ok = [turn for turn in turns if turn["error"] is None]
+    errors = [turn for turn in turns if turn["error"] is not None]
+    latencies = [turn["end_to_end"] for turn in ok]
+    summary = {
+        "sessions": args.sessions,
+        "questions": len(turns),
+        "errors": len(errors),
+        "error_rate": len(errors) / len(turns) if turns else 0.0,
+        "throughput": len(turns) / wall_time if wall_time else 0.0,
+        "wall_time": wall_time,
+        "end_to_end": {f"p{pct}": percentile_or_none(latencies, pct) for pct in (50, 95, 99)},
+        "stages": {},
+    }
+
+    pcts = (50, 95, 99)
+    print(f"{len(turns)} questions from {args.sessions} concurrent sessions in {wall_time:.1f}s "
+          f"→ {summary['throughput']:.2f} questions/s")
+    print(f"End to end     {summarize(latencies, pcts)}")
+    for level in LEVELS:
+        values = [turn["end_to_end"] for turn in ok if turn["level"] == level]
+        if values:
+            print(f"  {level:12} {summarize(values, pcts)}")
+    for kind in ("graph", "image"):
+        values = [turn["end_to_end"] for turn in ok if turn["kind"] == kind]
+        if values:
+            print(f"  {kind + ' turns':12} {summarize(values, pcts)}")
+
+    print("Stages:")
+    stages = {"load": [record["load"] for record in results]}
+    for stage in ("ttft", "total", "ttfa", "graph", "image"):
+        stages[stage] = [turn[stage] for turn in ok if turn[stage] is not None]
+    labels = {"load": "page load", "ttft": "first token", "total": "answer", "ttfa": "first audio",
+              "graph": "graph", "image": "image"}
+    for stage, values in stages.items():
+        summary["stages"][stage] = {f"p{pct}": percentile_or_none(values, pct) for pct in pcts}
+        if values:
+            print(f"  {labels[stage]:12} {summarize(values, pcts)}")
+
+    print(f"Errors: {len(errors)} ({summary['error_rate']:.1%})")
+    for message in sorted({turn["error"] for turn in errors})[:5]:
+        print(f"  {message[:100]}")
+
+    # The gateway is shared by the whole process, so the latest snapshot covers every session
+    gateway = max((record["gateway"] for record in results), key=lambda stats: stats["requests"], default=None)
+    if gateway:
+        summary["gateway"] = gateway
+        print(f"Gateway: {gateway['upstream_calls']} upstream calls for {gateway['requests']} requests · "
+              f"{gateway['coalescing_ratio']:.0%} coalesced · {gateway['retries']} retries · "
+              f"{gateway['rate_limited']} rate-limited · wait p95 {gateway['wait_p95']:.2f}s")
+    return summary
+
+def percentile_or_none(values, pct):
+    return percentile(values, pct) if values else None
+
+def check_gates(summary, args):
+    """Return the regression gates this run failed"""
+    failures = []
+    p95, p99 = summary["end_to_end"]["p95"], summary["end_to_end"]["p99"]
+    if args.max_p95 is not None and (p95 is None or p95 > args.max_p95):
+        failures.append(f"p95 end-to-end {p95}s > {args.max_p95}s")
+    if args.max_p99 is not None and (p99 is None or p99 > args.max_p99):
+        failures.append(f"p99 end-to-end {p99}s > {args.max_p99}s")
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {summary['error_rate']:.1%} > {args.max_error_rate:.1%}")
+    if args.min_throughput is not None and summary["throughput"] < args.min_throughput:
+        failures.append(f"throughput {summary['throughput']:.2f}/s < {args.min_throughput}/s")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the example questions through the app from concurrent sessions")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent student sessions")
+    parser.add_argument("--questions", type=int, default=5, help="questions asked by each session")
+    parser.add_argument("--think-time", type=float, default=1.0, help="seconds a student waits between questions")
+    parser.add_argument("--graph-share", type=float, default=0.1, help="share of turns that ask for a graph")
+    parser.add_argument("--image-share", type=float, default=0.05, help="share of turns that ask for an image")
+    parser.add_argument("--unique", action="store_true", help="make every question unique so the answer cache can't help")
+    parser.add_argument("--no-tts", dest="tts", action="store_false", help="turn speech off in every session")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed for one script run")
+
+    stand_ins = parser.add_argument_group("stand-ins")
+    stand_ins.add_argument("--model-latency", type=float, default=0.8, help="median seconds before the model's first chunk")
+    stand_ins.add_argument("--model-jitter", type=float, default=0.3, help="log-normal sigma of the model latency")
+    stand_ins.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    stand_ins.add_argument("--model-error-rate", type=float, default=0.0, help="share of model calls failing with 429/503")
+    stand_ins.add_argument("--image-latency", type=float, default=2.0, help="median seconds per image provider request")
+    stand_ins.add_argument("--image-jitter", type=float, default=0.3)
+    stand_ins.add_argument("--image-error-rate", type=float, default=0.1, help="share of image requests failing with 503")
+    stand_ins.add_argument("--tts-delay", type=float, default=0.002, help="seconds of synthesis per character")
+
+    gates = parser.add_argument_group("regression gates (exit status 1 when one fails)")
+    gates.add_argument("--max-p95", type=float, help="seconds")
+    gates.add_argument("--max-p99", type=float, help="seconds")
+    gates.add_argument("--max-error-rate", type=float, help="fraction, e.g. 0.02")
+    gates.add_argument("--min-throughput", type=float, help="questions per second")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    configure_environment(stub_delay=args.chunk_delay)
+    os.environ.update({
+        "CHATBOT_STUB_LATENCY": str(args.model_latency),
+        "CHATBOT_STUB_JITTER": str(args.model_jitter),
+        "CHATBOT_STUB_ERROR_RATE": str(args.model_error_rate),
+        "CHATBOT_STUB_TTS": "1",
+        "CHATBOT_STUB_TTS_DELAY": str(args.tts_delay),
+        "CHATBOT_IMAGE_API_BASE": start_fake_image_server(args.image_latency, args.image_jitter, args.image_error_rate),
+    })
+
+    share_compiled_script()
+    questions = load_questions()
+    results = []
+    lock = threading.Lock()
+    threads = [threading.Thread(target=run_session, args=(session, build_workload(questions, args, session), args, results, lock))
+               for session in range(args.sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    summary = report(results, wall_time, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    failures = check_gates(summary, args)
+    for failure in failures:
+        print(f"GATE FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Multi-part question benchmark: streams answers to questions with parts (a)-(e) and numbered
+# worksheets, once as a single request and once split into parts answered in parallel, and
+# reports the time to the first token, to each part's heading and to the whole answer.
+# It then asks a six-part worksheet with a graph under the default per-student rate limit and
+# checks that none of its model calls is held in the gateway queue by the student's own limit.
+#
+#   python benchmarks/bench_parts.py
+#   python benchmarks/bench_parts.py --runs 5 --stub-delay 0.05
+#   python benchmarks/bench_parts.py --max-queue-wait 0.5   # exits 1 if a call waits longer
+
+import argparse
+import logging
+import re
+import sys
+import tempfile
+import time
+
+from _app import load_app, summarize
+
+QUESTIONS = [
+    "A ball is thrown at 20 m/s at 30 degrees above the horizontal from level ground. (a) Find the time of flight. "
+    "(b) Find the horizontal range. (c) Find the maximum height. (d) Find the speed at the highest point. "
+    "(e) Explain why the horizontal component of velocity is constant.",
+    "A 2 kg block rests on a rough slope inclined at 30 degrees, with a coefficient of friction of 0.2.\n"
+    "(a) Draw the forces acting on the block.\n(b) Find the normal reaction.\n"
+    "(c) Hence find the maximum friction force.\n(d) Decide whether the block slides.",
+    "1. Differentiate x^3 sin(x).\n2. Integrate x e^x.\n3. Solve x^2 - 5x + 6 = 0.\n"
+    "4. Find the inverse of the matrix [[2, 1], [1, 1]].",
+]
+
+# As many parts as a question may be split into (FANOUT_MAX_GROUPS), none depending on another
+WORKSHEET = ("1. State Newton's first law.\n2. Define momentum.\n3. Convert 72 km/h to m/s.\n"
+             "4. Name the SI unit of power.\n5. Define specific heat capacity.\n6. Describe a longitudinal wave.")
+
+PART_HEADING = re.compile(r"\*\*\((?:[a-h]|[1-9]\d?|[ivx]+)\)")
+
+def ask(app, question, fan_out):
+    """Stream one answer; returns the seconds to the first token, to each part heading and in all"""
+    state = app.st.session_state
+    state["fan_out"] = fan_out
+    state.messages = []
+    state.context.reset()
+    start = time.perf_counter()
+    answer, first, headings = "", None, []
+    for text in app.stream_bot_response(question, "Standard", metrics={}):
+        now = time.perf_counter() - start
+        headings.extend(now for _ in PART_HEADING.findall(text))
+        # A part's heading is shown before its answer starts
+        if first is None and not PART_HEADING.match(text.strip()):
+            first = now
+        answer += text
+    return first, headings, time.perf_counter() - start
+
+def queue_waits(app, question):
+    """Ask a question split into parts while its graph is drawn, under the default per-student
+    limit; returns the seconds each of the model calls waited in the gateway queue"""
+    state = app.st.session_state
+    gateway = state.model.gateway
+    gateway.set_session_limit(state.session_id, app.GATEWAY_SESSION_RATE, app.GATEWAY_SESSION_BURST)
+    gateway.loop.call_soon_threadsafe(gateway.wait_times.clear)
+    # The graph starts before the answer, as in the chat
+    stages = app.AnswerStages()
+    stages.start("graph.code", app.request_graph_code, state.utility_model, question)
+    ask(app, question, True)
+    stages.get("graph.code")
+    return list(gateway.wait_times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare multi-part questions answered whole and split into parts")
+    parser.add_argument("--runs", type=int, default=3, help="passes over the questions per mode")
+    parser.add_argument("--stub-delay", type=float, default=0.03, help="seconds per stub model chunk")
+    parser.add_argument("--max-queue-wait", type=float, default=1.0,
+                        help="seconds a call of the six-part question may wait in the queue")
+    args = parser.parse_args()
+
+    app = load_app(stub_delay=args.stub_delay)
+    from streamlit import logger
+    logger.set_log_level(logging.ERROR)
+    app.initialize_session_state()
+    state = app.st.session_state
+    # Every question should reach the model, and one student's rate limit shouldn't hold the parts back
+    state["local_solver"] = False
+    state.model.gateway.set_session_limit(state.session_id, 100.0, 100)
+
+    for fan_out in (False, True):
+        firsts, last_parts, totals = [], [], []
+        for run in range(args.runs):
+            # A fresh answer cache per pass, so every answer is generated
+            app.CACHE_DIR = tempfile.mkdtemp(prefix="chatbot-bench-parts-")
+            app.get_answer_cache.clear()
+            for question in QUESTIONS:
+                first, headings, total = ask(app, question, fan_out)
+                firsts.append(first)
+                totals.append(total)
+                if headings:
+                    last_parts.append(headings[-1])
+        print(f"{'split into parts' if fan_out else 'one request'}: {len(totals)} answers")
+        print(f"  first token: {summarize(firsts)}")
+        if last_parts:
+            print(f"  last part:   {summarize(last_parts)}")
+        print(f"  whole answer: {summarize(totals)}")
+
+    app.CACHE_DIR = tempfile.mkdtemp(prefix="chatbot-bench-parts-")
+    app.get_answer_cache.clear()
+    waits = queue_waits(app, WORKSHEET)
+    print(f"{app.FANOUT_MAX_GROUPS} parts and a graph under the student's limit: {len(waits)} calls")
+    print(f"  queue wait: {summarize(waits, (50, 100))}")
+    if max(waits) > args.max_queue_wait:
+        print(f"  a call waited {max(waits):.1f}s > {args.max_queue_wait}s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Rerun benchmark: how long main() takes to redraw the page when nothing new was asked, for
+# chats of different lengths. Each history is filled with worked answers (and a graph every
+# few turns), then the page is rerun with the default paging and with every message shown.
+# AppTest reruns the whole script when a widget changes, so the 🔊 column is the cost of a
+# full rerun; a real server only reruns the controls fragment for it.
+#
+#   python benchmarks/bench_render.py
+#   python benchmarks/bench_render.py --sizes 10 100 1000 --reruns 20
+
+import argparse
+import io
+import statistics
+
+from PIL import Image
+
+from _app import APP_PATH, configure_environment
+
+ANSWER = """**Step 1:** Write down what we know: $m = 2\\ \\text{kg}$, $v = 3\\ \\text{m/s}$
+
+**Step 2:** Use the kinetic energy formula $E_k = \\frac{1}{2} m v^2$
+
+**Step 3:** Substitute: $E_k = \\frac{1}{2} \\cdot 2 \\cdot 3^2$
+
+| Quantity | Value |
+|---|---|
+| mass | 2 kg |
+| speed | 3 m/s |
+
+**Answer:** $E_k = 9\\ \\text{J}$"""
+
+def fill_history(at, app_module, size, image_every):
+    """Replace the chat with `size` messages: questions and worked answers, some with a graph"""
+    store = at.session_state["messages"]
+    store.clear()
+    media = app_module.get_media_store()
+    for index in range(size):
+        if index % 2 == 0:
+            store.append(app_module.ChatMessage("user", f"Question {index}: what is the kinetic energy of a 2 kg mass at 3 m/s?"))
+        else:
+            graph = None
+            if image_every and index % image_every == 1:
+                # Distinct images, so the media store has to serve each one
+                buf = io.BytesIO()
+                Image.effect_noise((600, 400), 64 + index % 50).convert("RGB").save(buf, format="PNG")
+                graph = media.put(buf.getvalue(), app_module.MEDIA_DISPLAY_SIZE)
+            store.append(app_module.ChatMessage("assistant", f"{ANSWER}\n\n(answer {index})", graph=graph))
+
+def time_reruns(at, reruns):
+    """Median time main() took, as the app records it (AppTest recompiles the script on every
+    run, which a real server doesn't, so the wall time around at.run() would overstate it)"""
+    timings = []
+    for _ in range(reruns):
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        timings.append(at.session_state["render_times"][-1])
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure rerun time against chat length")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="messages in the chat")
+    parser.add_argument("--reruns", type=int, default=10, help="reruns timed per size; the median is reported")
+    parser.add_argument("--image-every", type=int, default=6, help="attach a graph to every Nth message (0 for none)")
+    args = parser.parse_args()
+
+    configure_environment()
+    import importlib.util
+    from streamlit.testing.v1 import AppTest
+
+    # The app module gives access to ChatMessage and the shared media store the script uses
+    spec = importlib.util.spec_from_file_location("chatbot_app", APP_PATH)
+    app_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app_module)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.checkbox(key="tts_toggle").uncheck().run()
+
+    print(f"{'messages':>9} {'rerun (latest page)':>21} {'rerun (all shown)':>19} {'toggle 🔊 (full)':>17}")
+    for size in args.sizes:
+        fill_history(at, app_module, size, args.image_every)
+        at.session_state["messages_shown"] = app_module.CHAT_PAGE_SIZE
+        paged = time_reruns(at, args.reruns)
+        at.checkbox(key="tts_toggle").check().run()
+        toggle = at.session_state["render_times"][-1]
+        at.checkbox(key="tts_toggle").uncheck().run()
+        toggle = (toggle + at.session_state["render_times"][-1]) / 2
+        at.session_state["messages_shown"] = size
+        everything = time_reruns(at, max(1, args.reruns // 5))
+        print(f"{size:9d} {paged * 1000:18.1f} ms {everything * 1000:16.1f} ms {toggle * 1000:14.1f} ms")
+
+if __name__ == "__main__":
+    main()
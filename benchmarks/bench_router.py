@@ -0,0 +1,134 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Measures the intent router: precision and recall per route, the graph and image calls it would
+# waste or miss, and routing time. The old substring checks are measured alongside.
+#
+# The cue patterns were written against the labelled prompts (intent_prompts.tsv) and the example
+# questions (which all need just an answer), so the rules' score there is in-sample; the
+# classifier is scored on them with k-fold cross-validation. The held-out prompts
+# (intent_prompts_holdout.tsv) are never used to tune the rules or train the classifier, and
+# their scores are the ones to quote.
+#
+#   python benchmarks/bench_router.py
+#   python benchmarks/bench_router.py --show-errors
+
+import argparse
+import os
+import random
+import time
+
+from _app import REPO_DIR, percentile
+
+import intent_router
+from bench_load import load_questions
+
+PROMPTS_PATH = os.path.join(REPO_DIR, "intent_prompts.tsv")
+HOLDOUT_PATH = os.path.join(REPO_DIR, "intent_prompts_holdout.tsv")
+
+def keyword_route(prompt):
+    """The substring checks the app used before the router"""
+    graph = any(keyword in prompt.lower() for keyword in ["plot", "graph", "chart", "diagram of function"])
+    image = any(keyword in prompt.lower() for keyword in
+                ["draw", "create image", "generate image", "show me", "picture of", "image of", "visualize"])
+    # An image request was answered with the image alone, and ignored when a graph was also wanted
+    return intent_router.Route(answer=not (image and not graph), graph=graph, image=image and not graph)
+
+def cross_validated(examples, folds, seed):
+    """(prompt, expected, routed) with each fold routed by a router trained on the other folds"""
+    order = list(range(len(examples)))
+    random.Random(seed).shuffle(order)
+    results = [None] * len(examples)
+    for fold in range(folds):
+        held_out = set(order[fold::folds])
+        training = [example for index, example in enumerate(examples) if index not in held_out]
+        router = intent_router.IntentRouter(intent_router.NaiveBayes(training))
+        for index in held_out:
+            prompt, expected = examples[index]
+            results[index] = (prompt, expected, router.route(prompt))
+    return results
+
+def score(results):
+    scores = {}
+    for label in intent_router.LABELS:
+        tp = sum(1 for _, expected, routed in results if getattr(expected, label) and getattr(routed, label))
+        fp = sum(1 for _, expected, routed in results if not getattr(expected, label) and getattr(routed, label))
+        fn = sum(1 for _, expected, routed in results if getattr(expected, label) and not getattr(routed, label))
+        precision = tp / (tp + fp) if tp + fp else 1.0
+        recall = tp / (tp + fn) if tp + fn else 1.0
+        scores[label] = (precision, recall, fp, fn)
+    exact = sum(1 for _, expected, routed in results if expected == routed) / len(results)
+    return scores, exact
+
+def time_routing(route, prompts, repeat):
+    timings = []
+    for _ in range(repeat):
+        for prompt in prompts:
+            start = time.perf_counter()
+            route(prompt)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def describe(route):
+    return "+".join(label for label in intent_router.LABELS if getattr(route, label)) or "nothing"
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the intent router on labelled prompts")
+    parser.add_argument("--folds", type=int, default=5, help="cross-validation folds for the classifier")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="timing passes over the prompts")
+    parser.add_argument("--show-errors", action="store_true", help="list the prompts each router gets wrong")
+    args = parser.parse_args()
+
+    labelled = intent_router.load_examples(PROMPTS_PATH)
+    answer_only = intent_router.Route(answer=True, graph=False, image=False)
+    corpus = [(question, answer_only) for _, _, question in load_questions()]
+    examples = labelled + corpus
+    holdout = intent_router.load_examples(HOLDOUT_PATH)
+
+    rules = intent_router.IntentRouter()
+    trained = intent_router.IntentRouter(intent_router.NaiveBayes(examples))
+    print(f"Tuning set: {len(labelled)} labelled prompts + {len(corpus)} example questions "
+          f"(the rules were written against these)")
+    report([
+        ("keywords (old)", [(p, e, keyword_route(p)) for p, e in examples], keyword_route),
+        ("router, rules only", [(p, e, rules.route(p)) for p, e in examples], rules.route),
+        (f"router + classifier ({args.folds}-fold)", cross_validated(examples, args.folds, args.seed), trained.route),
+    ], [prompt for prompt, _ in examples], args)
+
+    print(f"\nHeld-out set: {len(holdout)} labelled prompts (never used for tuning or training)")
+    report([
+        ("keywords (old)", [(p, e, keyword_route(p)) for p, e in holdout], keyword_route),
+        ("router, rules only", [(p, e, rules.route(p)) for p, e in holdout], rules.route),
+        ("router + classifier", [(p, e, trained.route(p)) for p, e in holdout], trained.route),
+    ], [prompt for prompt, _ in holdout], args)
+
+def report(runs, prompts, args):
+    for title, results, route in runs:
+        scores, exact = score(results)
+        timings = time_routing(route, prompts, args.repeat)
+        print(f"\n{title}: exact route {exact:.1%} · "
+              f"p50 {percentile(timings, 50) * 1e6:.0f} µs · p99 {percentile(timings, 99) * 1e6:.0f} µs")
+        for label, (precision, recall, fp, fn) in scores.items():
+            wasted = f" · {fp} wasted calls · {fn} missed" if label != "answer" else f" · {fp} unneeded · {fn} missing"
+            print(f"  {label:7} precision {precision:6.1%} · recall {recall:6.1%}{wasted}")
+        if args.show_errors:
+            for prompt, expected, routed in results:
+                if expected != routed:
+                    print(f"    want {describe(expected):13} got {describe(routed):13} {prompt}")
+
+if __name__ == "__main__":
+    main()
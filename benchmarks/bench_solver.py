@@ -0,0 +1,68 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Measures the built-in solver on the example questions: how many it answers without a model
+# call, how long a solved question and a fall-through take, and the one-off cost of starting
+# the SymPy worker process on the first call. Pass extra questions on the command line to try them too.
+#
+#   python benchmarks/bench_solver.py
+#   python benchmarks/bench_solver.py --show "What is the weight of a 5 kg mass?"
+
+import argparse
+import time
+
+from _app import summarize
+
+import local_solver
+from bench_load import load_questions
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the built-in solver on the example questions")
+    parser.add_argument("questions", nargs="*", help="extra questions to try")
+    parser.add_argument("--repeat", type=int, default=5, help="timing passes over the questions")
+    parser.add_argument("--show", action="store_true", help="print each worked solution")
+    args = parser.parse_args()
+
+    questions = [(f"{topic} ({level})", question) for topic, level, question in load_questions()]
+    questions += [("command line", question) for question in args.questions]
+
+    solver = local_solver.LocalSolver()
+    start = time.perf_counter()
+    solver.solve("Solve: x + 1 = 2")
+    first_call = time.perf_counter() - start
+
+    hits, misses = [], []
+    results = {}
+    for _ in range(args.repeat):
+        for label, question in questions:
+            start = time.perf_counter()
+            solution = solver.solve(question)
+            (hits if solution else misses).append(time.perf_counter() - start)
+            results[question] = (label, solution)
+
+    solved = sum(1 for _, solution in results.values() if solution)
+    print(f"{solved}/{len(results)} questions solved locally · first call {first_call * 1000:.0f} ms (starts the SymPy worker)")
+    if hits:
+        print(f"  solved:        {summarize(hits)}")
+    if misses:
+        print(f"  sent to model: {summarize(misses)}")
+    for question, (label, solution) in results.items():
+        print(f"\n{'✓' if solution else '·'} [{label}] {question}")
+        if solution and args.show:
+            print("    " + local_solver.to_markdown(solution).replace("\n", "\n    "))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Stage overlap benchmark: asks questions that need a written answer plus a graph, or a written
+# answer plus an AI image, through the whole page (AppTest), against the stub model, stub speech
+# and a local fake image server. The request time is compared with the time each stage takes on
+# its own; when the stages overlap it is close to the slowest one rather than their sum.
+#
+#   python benchmarks/bench_stages.py
+#   python benchmarks/bench_stages.py --runs 10 --stub-delay 0.04 --image-latency 2
+
+import argparse
+import logging
+import os
+import shutil
+
+from _app import APP_PATH, configure_environment, percentile, start_fake_image_server
+
+PROMPTS = {
+    "answer + graph": "Explain projectile motion and plot the trajectory of a ball thrown at 45 degrees (run {run})",
+    "answer + image": "Draw a simple pendulum with its forces labelled and explain how it works (run {run})",
+}
+
+# The spans that make up each stage; a stage's time is what it takes on its own
+STAGE_SPANS = {
+    "answer": ("answer",),
+    "graph": ("graph.codegen", "graph.render"),
+    "image": ("image.generate",),
+}
+
+def request_duration(trace):
+    return next(span.duration for span in trace.spans if span.parent_id is None)
+
+def stage_duration(trace, stage):
+    return sum(span.duration for span in trace.spans if span.name in STAGE_SPANS[stage] and span.duration)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how much the answer, graph and image stages overlap")
+    parser.add_argument("--runs", type=int, default=5, help="questions asked per kind and mode")
+    parser.add_argument("--stub-delay", type=float, default=0.03, help="seconds per stub model chunk")
+    parser.add_argument("--image-latency", type=float, default=1.5, help="seconds the fake image server takes")
+    args = parser.parse_args()
+
+    configure_environment(stub_delay=args.stub_delay)
+    # AppTest runs the script without a server, so every st call would warn about it
+    from streamlit import logger
+    logger.set_log_level(logging.ERROR)
+    os.environ["CHATBOT_STUB_TTS"] = "1"
+    os.environ["CHATBOT_IMAGE_API_BASE"] = start_fake_image_server(latency=args.image_latency)
+    graph_dir = os.path.join(os.environ["CHATBOT_CACHE_DIR"], "graphs")
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.checkbox(key="enable_image_gen").check().run()
+    # One student asking this fast would be held back by their own rate limit
+    at.session_state["model"].gateway.set_session_limit(at.session_state["session_id"], 100.0, 100)
+
+    print(f"{'question':>15} {'mode':>10} {'request p50':>12} {'answer':>9} {'graph':>9} {'image':>9} {'sum of stages':>14}")
+    for streaming in (True, False):
+        checkbox = at.checkbox(key="stream_responses")
+        (checkbox.check() if streaming else checkbox.uncheck()).run()
+        for kind, prompt in PROMPTS.items():
+            requests, stages = [], {stage: [] for stage in STAGE_SPANS}
+            for run in range(args.runs):
+                # Every run is a new conversation and renders its graph from scratch
+                at.session_state["messages"] = []
+                at.session_state["context"].reset()
+                shutil.rmtree(graph_dir, ignore_errors=True)
+                os.makedirs(graph_dir, exist_ok=True)
+                at.chat_input[0].set_value(prompt.format(run=f"{'s' if streaming else 'n'}{run}")).run()
+                if at.exception:
+                    raise RuntimeError(at.exception[0].value)
+                trace = at.session_state["traces"][-1]
+                requests.append(request_duration(trace))
+                for stage, durations in stages.items():
+                    durations.append(stage_duration(trace, stage))
+            p50 = {name: percentile(values, 50) for name, values in stages.items()}
+            print(f"{kind:>15} {'stream' if streaming else 'blocking':>10} {percentile(requests, 50) * 1000:9.0f} ms"
+                  f" {p50['answer'] * 1000:6.0f} ms {p50['graph'] * 1000:6.0f} ms {p50['image'] * 1000:6.0f} ms"
+                  f" {sum(p50.values()) * 1000:11.0f} ms")
+
+if __name__ == "__main__":
+    main()
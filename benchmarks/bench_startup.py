@@ -0,0 +1,151 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Startup benchmark: how long a fresh server process takes to render the first page, how long
+# a new session takes once the process is warm, and the overhead of every later rerun.
+# Each cold start runs in its own interpreter so nothing is already imported.
+#
+#   python benchmarks/bench_startup.py                      # the working tree
+#   python benchmarks/bench_startup.py --compare HEAD~1     # before/after against an older revision
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_FILE = "Physics-Maths-Solver-ChatBot.py"
+
+# Reported so it is obvious which of the expensive libraries a plain page load pulls in
+HEAVY_MODULES = ["google.genai", "pyttsx3", "requests", "matplotlib", "numpy", "PIL"]
+
+def measure(app_dir, reruns):
+    """Runs inside a fresh interpreter; prints one JSON result"""
+    sys.path.insert(0, app_dir)
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    framework = time.perf_counter() - start
+
+    at = AppTest.from_file(os.path.join(app_dir, APP_FILE), default_timeout=120)
+    start = time.perf_counter()
+    at.run()
+    first_page = time.perf_counter() - start
+    errors = [str(error.value) for error in at.exception]
+
+    rerun_times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        rerun_times.append(time.perf_counter() - start)
+
+    # A second student arriving at an already-running server
+    start = time.perf_counter()
+    AppTest.from_file(os.path.join(app_dir, APP_FILE), default_timeout=120).run()
+    new_session = time.perf_counter() - start
+
+    print(json.dumps({
+        "framework": framework,
+        "first_page": first_page,
+        "new_session": new_session,
+        "rerun": statistics.median(rerun_times) if rerun_times else float("nan"),
+        "loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        "errors": errors,
+    }))
+
+def cold_start(app_dir, reruns):
+    """One cold start in a new interpreter; wall time includes interpreter startup"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", app_dir, "--reruns", str(reruns)],
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"startup run failed in {app_dir}:\n{result.stderr[-2000:]}")
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    measured["cold_start"] = wall
+    return measured
+
+def benchmark(app_dir, repeat, reruns):
+    runs = [cold_start(app_dir, reruns) for _ in range(repeat)]
+    result = {key: statistics.median(run[key] for run in runs)
+              for key in ("cold_start", "framework", "first_page", "new_session", "rerun")}
+    result["loaded"] = runs[-1]["loaded"]
+    result["errors"] = runs[-1]["errors"]
+    return result
+
+def extract_revision(revision):
+    """Check out an older revision of the app into a temporary directory"""
+    from _app import REPO_DIR
+    target = tempfile.mkdtemp(prefix="chatbot-startup-")
+    archive = subprocess.run(["git", "-C", REPO_DIR, "archive", revision], capture_output=True, check=True)
+    subprocess.run(["tar", "-x", "-C", target], input=archive.stdout, check=True)
+    return target
+
+def report(results):
+    labels = list(results)
+    rows = [
+        ("cold start (process + first page)", "cold_start"),
+        ("  streamlit import", "framework"),
+        ("  first page render", "first_page"),
+        ("new session, warm process", "new_session"),
+        ("rerun overhead (median)", "rerun"),
+    ]
+    print(f"{'':36}" + "".join(f"{label:>16}" for label in labels))
+    for title, key in rows:
+        print(f"{title:36}" + "".join(f"{results[label][key] * 1000:13.1f} ms" for label in labels))
+    for label in labels:
+        print(f"\n{label}: loaded on first page: {', '.join(results[label]['loaded']) or 'none of the heavy modules'}")
+        for error in results[label]["errors"]:
+            print(f"  app raised: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3, help="cold starts per tree; the median is reported")
+    parser.add_argument("--reruns", type=int, default=10, help="reruns timed after the first page")
+    parser.add_argument("--compare", metavar="REV", help="also measure this git revision, for a before/after")
+    parser.add_argument("--live", action="store_true", help="use the real Gemini API (needs GOOGLE_API_KEY)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--child", metavar="APP_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child, args.reruns)
+        return
+
+    from _app import REPO_DIR, configure_environment
+    configure_environment(live=args.live)
+
+    trees = {}
+    if args.compare:
+        trees[args.compare] = extract_revision(args.compare)
+    trees["working tree"] = REPO_DIR
+    try:
+        results = {label: benchmark(app_dir, args.repeat, args.reruns) for label, app_dir in trees.items()}
+    finally:
+        for label, app_dir in trees.items():
+            if app_dir != REPO_DIR:
+                shutil.rmtree(app_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+if __name__ == "__main__":
+    main()
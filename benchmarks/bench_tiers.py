@@ -0,0 +1,116 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Model tiering benchmark: asks every example question at every difficulty with tiering on and
+# off, and reports which tier each question type went to and the per-tier latency and tokens.
+# Against the stub model each tier's model streams at its own speed (--tier-delay), so the
+# effect of routing on latency can be seen without spending quota; --live uses Gemini.
+#
+#   python benchmarks/bench_tiers.py
+#   python benchmarks/bench_tiers.py --tier-delay fast=0.01 standard=0.03 deep=0.08
+#   python benchmarks/bench_tiers.py --classify-only
+
+import argparse
+import logging
+import tempfile
+import time
+from collections import Counter
+
+from _app import load_app, summarize
+
+import model_tiers
+from bench_load import load_questions
+
+DIFFICULTIES = ("Beginner", "Standard", "Advanced", "Expert")
+
+def parse_delays(values):
+    delays = {}
+    for value in values:
+        name, _, seconds = value.partition("=")
+        delays[name] = float(seconds)
+    return delays
+
+def print_routing(questions, policy):
+    print(f"{'type':>11} " + " ".join(f"{difficulty:>10}" for difficulty in DIFFICULTIES) + "   questions")
+    types = Counter(model_tiers.classify(question) for _, _, question in questions)
+    for question_type in model_tiers.QUESTION_TYPES:
+        tiers = [policy.rules[question_type][difficulty] for difficulty in DIFFICULTIES]
+        print(f"{question_type:>11} " + " ".join(f"{tier:>10}" for tier in tiers) + f"   {types[question_type]}")
+
+def run(app, questions, tiering):
+    """Ask every question at every difficulty; returns the latency of each answer"""
+    state = app.st.session_state
+    state["model_tiering"] = tiering
+    # A fresh answer cache, so neither mode is served from the other's answers
+    app.CACHE_DIR = tempfile.mkdtemp(prefix="chatbot-bench-tiers-")
+    app.get_answer_cache.clear()
+    latencies = []
+    for difficulty in DIFFICULTIES:
+        for _, _, question in questions:
+            state.messages = []
+            state.context.reset()
+            start = time.perf_counter()
+            app.get_bot_response(question, difficulty)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how questions are spread over the model tiers")
+    parser.add_argument("--live", action="store_true", help="call Gemini instead of the stub model")
+    parser.add_argument("--tier-delay", nargs="*", default=["fast=0.01", "standard=0.03", "deep=0.06"],
+                        help="seconds per stub chunk for each tier's model, as tier=seconds")
+    parser.add_argument("--classify-only", action="store_true", help="only show how the questions are routed")
+    args = parser.parse_args()
+
+    questions = load_questions()
+    if args.classify_only:
+        print_routing(questions, model_tiers.TierPolicy(load_app().MODEL_TIERS))
+        return
+
+    app = load_app(live=args.live)
+    from streamlit import logger
+    logger.set_log_level(logging.ERROR)
+    app.initialize_session_state()
+    state = app.st.session_state
+    # Every question should reach a model, at the rate one student would be allowed
+    state["local_solver"] = False
+    state.model.gateway.set_session_limit(state.session_id, 100.0, 100)
+    if not args.live:
+        delays = parse_delays(args.tier_delay)
+        for name, model in state.tier_models.items():
+            model.model.delay = delays.get(name, model.model.delay)
+
+    policy = app.get_tier_policy()
+    print_routing(questions, policy)
+    print()
+    untiered = run(app, questions, tiering=False)
+    tiered = run(app, questions, tiering=True)
+    print(f"{len(untiered)} answers per mode")
+    print(f"  one model:   {summarize(untiered)} · total {sum(untiered):.1f}s")
+    print(f"  tiered:      {summarize(tiered)} · total {sum(tiered):.1f}s")
+    print()
+    print(f"{'tier':>9} {'model':>24} {'calls':>6} {'p50':>8} {'p95':>8} {'prompt tok':>11} {'output tok':>11} {'at budget':>10}  types")
+    for tier in app.MODEL_TIERS:
+        stats = policy.stats.snapshot().get(tier.name)
+        if stats is None:
+            continue
+        types = ", ".join(f"{count} {name}" for name, count in sorted(stats["types"].items()))
+        print(f"{tier.name:>9} {tier.model_name:>24} {stats['calls']:>6} {stats['latency_p50']:7.2f}s "
+              f"{stats['latency_p95']:7.2f}s {stats['avg_prompt_tokens']:>11.0f} {stats['avg_output_tokens']:>11.0f} "
+              f"{stats['capped']:>10}  {types}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# The curated example questions (Chatbot_Examples_Questions.txt) as a structured bank, and a
+# versioned on-disk store of their precomputed answers and graphs.
+#
+# The store keeps one directory per version (a hash of the model and the system prompt), so
+# answers written for an older prompt are never served; warm_examples.py fills it, and the app
+# refreshes it in the background when the version changes.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+Example = namedtuple("Example", ["topic", "level", "text"])
+
+# A precomputed example: graph_path is None when the question doesn't ask for a graph
+Entry = namedtuple("Entry", ["example", "difficulty", "answer", "graph_path", "created"])
+
+def load_bank(path):
+    """Parse the examples file: blank-line separated blocks, "(Level) question" blocks for
+    questions and anything else as the topic of the questions that follow"""
+    with open(path, encoding="utf-8") as f:
+        content = f.read().replace("\r\n", "\n")
+    examples = []
+    topic = None
+    for block in filter(None, (block.strip() for block in re.split(r"\n\s*\n", content))):
+        match = re.match(r"\((\w+)\)\s*(.*)", block, re.S)
+        if match:
+            examples.append(Example(topic, match.group(1), " ".join(match.group(2).split())))
+        else:
+            topic = " ".join(block.split())
+    return examples
+
+def by_topic(examples):
+    """{topic: [examples]} in the order the topics appear"""
+    topics = {}
+    for example in examples:
+        topics.setdefault(example.topic, []).append(example)
+    return topics
+
+def store_version(model_name, system_prompt):
+    return hashlib.sha256(f"{model_name}\n{system_prompt}".encode()).hexdigest()[:12]
+
+def _entry_key(text, difficulty):
+    # Same normalization as the answer cache, so a copied question still matches
+    text = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text).lower()).strip().rstrip(" ?.!")
+    return hashlib.sha256(f"{difficulty}\n{text}".encode()).hexdigest()[:16]
+
+class ExampleStore:
+    """Precomputed answers and graphs for one version, indexed in memory for instant lookups"""
+    def __init__(self, directory, version):
+        self.root = directory
+        self.version = version
+        self.directory = os.path.join(directory, version)
+        os.makedirs(self.directory, exist_ok=True)
+        self.entries = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                        record = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                self.entries[name[:-5]] = self._entry(record)
+
+    def _entry(self, record):
+        graph = record.get("graph")
+        return Entry(Example(record["topic"], record["level"], record["question"]), record["difficulty"],
+                     record["answer"], os.path.join(self.directory, graph) if graph else None, record["created"])
+
+    def get(self, text, difficulty):
+        """The precomputed entry for a question, or None"""
+        return self.entries.get(_entry_key(text, difficulty))
+
+    def has(self, example, difficulty):
+        return _entry_key(example.text, difficulty) in self.entries
+
+    def missing(self, examples, difficulty):
+        return [example for example in examples if not self.has(example, difficulty)]
+
+    def put(self, example, difficulty, answer, graph_png=None):
+        key = _entry_key(example.text, difficulty)
+        graph = None
+        if graph_png is not None:
+            graph = f"{key}.png"
+            self._write(graph, graph_png)
+        record = {"topic": example.topic, "level": example.level, "question": example.text,
+                  "difficulty": difficulty, "answer": answer, "graph": graph, "created": time.time()}
+        # The JSON is written last, so an entry is only visible once its graph is on disk
+        self._write(f"{key}.json", json.dumps(record, ensure_ascii=False).encode("utf-8"))
+        self.entries[key] = self._entry(record)
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def previous_versions(self):
+        """Other versions on disk, i.e. the examples were warmed for an earlier prompt or model"""
+        return [name for name in os.listdir(self.root)
+                if name != self.version and os.path.isdir(os.path.join(self.root, name))]
+
+    def prune(self):
+        """Remove the other versions once this one is complete"""
+        for name in self.previous_versions():
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
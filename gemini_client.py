@@ -0,0 +1,79 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Gemini models on the google.genai SDK, with one client per API key.
+#
+# The app calls generate_content(contents, stream=False, generation_config=None) the way
+# google.generativeai models took it: plain strings and PIL images, or a list of
+# {"role", "parts"} turns. GeminiModel makes that call through a google.genai Client. Each
+# client is created with its own api_key, so every key in the pool gets a client of its own
+# without process-wide configuration. The SDK takes most of a second to import, so it is only
+# loaded when the first client is made.
+
+import io
+
+def make_client(api_key, base_url=None):
+    """A client for one API key. base_url points it at another endpoint, such as a local fake API."""
+    from google import genai
+    from google.genai import types
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(base_url=base_url) if base_url else None)
+
+def model_path(model_name):
+    """The model's resource name ("models/..."). google.generativeai reported this name, and the
+    caches are keyed on it."""
+    return model_name if "/" in model_name else f"models/{model_name}"
+
+def to_part(part):
+    """A google.genai Part for a string or a PIL image; anything else is passed through"""
+    from google.genai import types
+    if isinstance(part, str):
+        return types.Part.from_text(text=part)
+    if hasattr(part, "save"):
+        image_format = "JPEG" if part.format == "JPEG" else "PNG"
+        buf = io.BytesIO()
+        part.save(buf, format=image_format)
+        return types.Part.from_bytes(data=buf.getvalue(), mime_type=f"image/{image_format.lower()}")
+    return part
+
+def to_contents(contents):
+    """Convert google.generativeai-style contents: a part, a list of parts, or {"role", "parts"} turns"""
+    from google.genai import types
+    if isinstance(contents, dict):
+        return types.Content(role=contents["role"], parts=[to_part(part) for part in contents["parts"]])
+    if isinstance(contents, (list, tuple)):
+        return [to_contents(item) if isinstance(item, dict) else to_part(item) for item in contents]
+    return to_part(contents)
+
+class GeminiModel:
+    """One model on one key's client, with the generate_content() the rest of the app calls"""
+    def __init__(self, client, model_name, system_instruction=None):
+        self.client = client
+        self.model_name = model_path(model_name)
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, stream=False, generation_config=None):
+        """A response (or, with stream=True, an iterator of chunks) with .text and .usage_metadata"""
+        from google.genai import types
+        config = types.GenerateContentConfig(system_instruction=self.system_instruction, **(generation_config or {}))
+        if not stream:
+            return self.client.models.generate_content(model=self.model_name, contents=to_contents(contents), config=config)
+        return self._stream(self.client.models.generate_content_stream(
+            model=self.model_name, contents=to_contents(contents), config=config))
+
+    def _stream(self, chunks):
+        """Iterate the chunks while holding the model: a Client closes its connections once it is
+        garbage collected, which would cut off a stream whose model has been dropped"""
+        yield from chunks
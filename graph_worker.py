@@ -0,0 +1,117 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Runs AI-generated matplotlib code inside worker processes, so it never touches the
+# Streamlit process's pyplot state and a runaway script can be stopped.
+
+import io
+import os
+import signal
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the time limit still applies there via the parent
+    resource = None
+
+class GraphTimeout(Exception):
+    """The graph code ran past its time limit"""
+
+class GraphCancelled(Exception):
+    """The parent no longer needs the graph"""
+
+# Set up by init_worker when the parent can cancel renders: `started` tells the parent which
+# worker runs which task, and `cancelled` holds the ids of the tasks it has cancelled
+_started = None
+_cancelled = None
+_task_id = 0
+
+def init_worker(memory_limit, started=None, cancelled=None):
+    """Import matplotlib once per worker with the Agg backend and cap the worker's memory"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+    import numpy
+
+    if resource is not None and memory_limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError):
+            pass
+
+    global _started, _cancelled
+    if started is not None and hasattr(signal, "SIGUSR1"):
+        _started, _cancelled = started, cancelled
+        signal.signal(signal.SIGUSR1, _on_cancel)
+
+def ping():
+    """No-op task used to start the workers ahead of the first graph"""
+    return True
+
+def _on_alarm(signum, frame):
+    raise GraphTimeout("Graph code took too long to run")
+
+def _on_cancel(signum, frame):
+    # A signal that arrives after its task finished must not stop the worker's next task
+    if _task_id and _task_id in _cancelled[:]:
+        raise GraphCancelled("the graph is no longer needed")
+
+def render_graph(code, time_limit, dpi, task_id=0):
+    """Execute the plotting code and return the figure as PNG bytes, with (start, end) wall-clock
+    nanoseconds of the exec and savefig steps for tracing"""
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    global _task_id
+    _task_id = task_id
+    if _started is not None and task_id:
+        _started.put((task_id, os.getpid()))
+
+    # The worker is reused, so the CPU limit is set relative to the time it has already used
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = int(usage.ru_utime + usage.ru_stime) + time_limit + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(time_limit)
+
+    try:
+        # Create a new figure
+        fig = plt.figure(figsize=(10, 6))
+
+        # Execute the code
+        exec_start = time.time_ns()
+        exec_globals = {'plt': plt, 'np': np, 'fig': fig}
+        exec(code, exec_globals)
+
+        # Save to buffer
+        save_start = time.time_ns()
+        buf = io.BytesIO()
+        plt.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+        timings = {"exec": (exec_start, save_start), "savefig": (save_start, time.time_ns())}
+        return buf.getvalue(), timings
+    finally:
+        _task_id = 0
+        if use_alarm:
+            signal.alarm(0)
+        plt.close('all')
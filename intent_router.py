@@ -0,0 +1,205 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Decides what a prompt needs: a written answer, a plotted graph, a generated image, or a mix.
+# A graph or image costs a model call and seconds to minutes of work, so a false positive is far
+# more expensive than the routing: "show me how to solve" must not start an image generation,
+# and "a graph theory question" must not ask for plot code.
+#
+# All cue phrases are compiled into one regex with word boundaries and scanned in a single pass.
+# Each cue has a strength; strong cues decide on their own, "avoid" cues cancel the weaker
+# positives (e.g. "real image" in optics), and weak cues are left to a small naive Bayes
+# classifier trained on labelled prompts when one is available, otherwise they don't fire.
+
+import math
+import re
+from collections import Counter, namedtuple
+
+Route = namedtuple("Route", ["answer", "graph", "image"])
+
+LABELS = ("answer", "graph", "image")
+
+COMMAND, STRONG, WEAK, AVOID = 3, 2, 1, -1
+
+# Optional politeness before a command at the start of the prompt
+LEAD = r"^(?:(?:please|pls|now|ok|okay|also|and|then)\s+)*(?:(?:can|could|would|will) you\s+(?:please\s+)?)?"
+GRAPH_NOUN = r"(?:graph|plot|curve|chart)s?"
+PICTURE_NOUN = r"(?:picture|image|illustration|drawing|photo|cartoon|painting|poster|artwork|diagram|sketch)s?"
+ARTICLE = r"(?:(?:me|us)\s+)?(?:(?:a|an|the|some|another)\s+)?"
+
+# (label, strength, name, pattern); the names show up in traces and the router benchmark
+CUES = [
+    # Graphs
+    ("graph", COMMAND, "graph_command", LEAD + r"(?:plot|graph|chart)\b"),
+    ("graph", COMMAND, "draw_graph", LEAD + r"(?:draw|sketch|make|create|generate|show)\s+" + ARTICLE
+     + r"(?:(?:line|bar|scatter|pie|velocity|position|displacement|acceleration|distance|speed|time)[-\s]+)*"
+     + GRAPH_NOUN + r"\b"),
+    ("graph", COMMAND, "sketch_formula", LEAD + r"(?:draw|sketch|visuali[sz]e)\s+[a-z]\s*(?:\([a-z]\)\s*)?="),
+    ("graph", STRONG, "graph_request", r"\b(?:a|an|me|us)\s+(?:\w+[-\s]+)?(?:plot|graph|chart)\s+(?:of|for|showing|comparing)\b"),
+    ("graph", STRONG, "then_plot", r"(?:\b(?:and|then|also|please)|[.?!,;])\s+(?:(?:also|then|please)\s+)?(?:plot|graph|chart)\s+(?!of\b)"),
+    ("graph", STRONG, "graph_verb", r"\b(?:plot|graph|chart)\s+(?:it|this|that|them|these|the (?:function|equation|curve|result|motion|data))\b"),
+    ("graph", STRONG, "plot_over", r"\b(?:plot|graph|sketch)\b[^.?!]*\b(?:from|between|for)\s+-?\d"),
+    ("graph", STRONG, "typed_chart", r"\b(?:line|bar|scatter|pie)\s+(?:chart|graph|plot)s?\b"),
+    ("graph", STRONG, "function_diagram", r"\bdiagram of (?:the |this |a )?function\b"),
+    ("graph", STRONG, "plot_against", r"\b(?:plot|graph)\b[^.?!]*\b(?:against|versus|vs\.?)\b"),
+    ("graph", WEAK, "graph_word", r"\b(?:plot|plots|plotting|graph|graphs|graphing|chart)\b"),
+    ("graph", WEAK, "visualize_formula", r"\bvisuali[sz](?:e|ation)\b[^.?!]*(?:=|\bfunction\b|\bequation\b|\bcurve\b)"),
+    ("graph", AVOID, "graph_theory", r"\bgraph (?:theory|coloring|colouring|isomorphism|traversal|algorithms?)\b"),
+    ("graph", AVOID, "graph_structure", r"\b(?:directed|undirected|bipartite|planar|complete|weighted|connected|acyclic|cyclic|simple|regular|eulerian|hamiltonian)\s+graphs?\b"),
+    ("graph", AVOID, "graph_parts", r"\b(?:vertex|vertices|adjacency|spanning tree|in-degree|out-degree)\b"),
+    ("graph", AVOID, "given_graph", r"\b(?:from|in|on|using|read|reading|interpret|interpreting|given|shown|attached|above|below|following|this|the|that)\s+(?:graph|chart|plot)\b"),
+    ("graph", AVOID, "how_to_plot", r"\bhow (?:do|does|should|would|can|to) (?:i |you |we |one )?(?:draw|sketch|plot|graph)\b"),
+    ("graph", AVOID, "graph_tool", r"\bgraph(?:ing)? (?:paper|calculator)\b"),
+    ("graph", AVOID, "story_plot", r"\bplot (?:twist|of (?:the )?(?:story|novel|book|film|movie|play|land))\b"),
+
+    # Images
+    ("image", COMMAND, "image_command", LEAD + r"(?:draw|paint|illustrate|sketch|visuali[sz]e)\b(?!\s+" + ARTICLE + GRAPH_NOUN + r"\b)"),
+    ("image", COMMAND, "make_picture", LEAD + r"(?:generate|create|make|produce|render|give|show|design)\s+" + ARTICLE
+     + r"(?:\w+\s+){0,3}?" + PICTURE_NOUN + r"\b"),
+    ("image", COMMAND, "picture_title", LEAD + r"(?:picture|image|illustration|drawing|photo|cartoon|painting)s? of\b"),
+    ("image", STRONG, "picture_of", r"\b(?:picture|illustration|drawing|photo|cartoon|painting|artwork)s? of\b"),
+    ("image", STRONG, "image_of", r"\bimages? of\b"),
+    ("image", STRONG, "generate_picture", r"\b(?:generate|create|make|produce|render|draw|paint|show)\s+" + ARTICLE
+     + r"(?:\w+\s+){0,3}?(?:picture|image|illustration|drawing|photo|cartoon|painting|artwork)s?\b"),
+    ("image", STRONG, "draw_diagram", r"\b(?:draw|sketch|illustrate)\s+" + ARTICLE + r"(?:\w+\s+){0,3}?(?:diagram|picture|figure)s?\b"),
+    ("image", WEAK, "show_me", r"\bshow me\b"),
+    ("image", WEAK, "visualize", r"\bvisuali[sz](?:e|ation)\b"),
+    ("image", WEAK, "diagram", r"\bdiagram\b"),
+    ("image", AVOID, "show_me_working", r"\bshow me (?:how|why|what|where|when|which|that|if|whether|the (?:steps|working|workings|method|solution|derivation|proof|answer|formula|calculation))\b"),
+    ("image", AVOID, "how_to_draw", r"\bhow (?:do|does|should|would|can|to) (?:i |you |we |one )?(?:draw|sketch|illustrate)\b"),
+    ("image", AVOID, "optics_image", r"\b(?:real|virtual|inverted|upright|erect|magnified|diminished|final|intermediate|sharp|focused)\s+images?\b"),
+    ("image", AVOID, "optics_terms", r"\bimage (?:distance|formed|is formed|height|position|size|location|forms)\b|\bimages? (?:of|formed by) (?:an|the) object\b"),
+    ("image", AVOID, "maths_image", r"\bimages? (?:of|under) (?:the |a )?(?:set|function|map|mapping|interval|transformation|matrix|point|f|g|t|x)\b|\bpre-?image\b"),
+    ("image", AVOID, "given_picture", r"\b(?:this|the|attached|uploaded|above|below|given|following)\s+(?:picture|image|photo|diagram|figure)\b(?!\s+of\b)"),
+]
+
+# Anything that asks for an explanation or a calculation needs a written answer even alongside a graph or image
+EXPLAIN = re.compile(r"\b(?:explain|explaining|why|how|what|which|when|calculate|compute|find|solve|derive|describe|"
+                     r"determine|prove|show that|estimate|evaluate|work out|compare|discuss|identify|label|and tell)\b")
+
+# One zero-width scan finds every position where some cue starts
+MATCHER = re.compile("(?=" + "|".join(f"(?:{pattern})" for _, _, _, pattern in CUES) + ")")
+CUE_INFO = {name: (label, strength) for label, strength, name, _ in CUES}
+
+# Alternation only reports the first cue that matches at a position, so the individual cues
+# are then tried at just those positions
+CUE_PATTERNS = {name: re.compile(pattern) for _, _, name, pattern in CUES}
+
+def find_cues(prompt):
+    """Names of every cue in the prompt (lower-cased)"""
+    found = set()
+    for match in MATCHER.finditer(prompt):
+        start = match.start()
+        for name, pattern in CUE_PATTERNS.items():
+            if name not in found and pattern.match(prompt, start):
+                found.add(name)
+    return found
+
+def tokenize(text):
+    words = re.findall(r"[a-z]+|\d+|[=^?]", text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+class NaiveBayes:
+    """Multinomial naive Bayes over words and word pairs, one yes/no model per label"""
+    def __init__(self, examples, labels=LABELS, alpha=1.0):
+        self.labels = labels
+        self.alpha = alpha
+        self.counts = {}
+        self.totals = {}
+        self.priors = {}
+        vocabulary = set()
+        for label in labels:
+            for positive in (True, False):
+                self.counts[label, positive] = Counter()
+                self.totals[label, positive] = 0
+            positives = sum(1 for _, route in examples if getattr(route, label))
+            self.priors[label] = (positives + 1) / (len(examples) + 2)
+        for prompt, route in examples:
+            tokens = tokenize(prompt)
+            vocabulary.update(tokens)
+            for label in labels:
+                key = label, bool(getattr(route, label))
+                self.counts[key].update(tokens)
+                self.totals[key] += len(tokens)
+        self.vocabulary_size = len(vocabulary)
+
+    def probability(self, prompt, label):
+        """P(label | prompt)"""
+        scores = {}
+        tokens = tokenize(prompt)
+        for positive in (True, False):
+            prior = self.priors[label] if positive else 1 - self.priors[label]
+            counts, total = self.counts[label, positive], self.totals[label, positive]
+            denominator = total + self.alpha * self.vocabulary_size
+            scores[positive] = math.log(prior) + sum(
+                math.log((counts[token] + self.alpha) / denominator) for token in tokens)
+        top = max(scores.values())
+        yes, no = (math.exp(scores[True] - top), math.exp(scores[False] - top))
+        return yes / (yes + no)
+
+class IntentRouter:
+    """Routes a prompt with the cue matcher, asking the classifier (if any) about weak cues only"""
+    def __init__(self, classifier=None, threshold=0.5):
+        self.classifier = classifier
+        self.threshold = threshold
+
+    def decide(self, prompt, label, strengths):
+        positive = max((s for s in strengths.get(label, ()) if s > 0), default=0)
+        avoided = AVOID in strengths.get(label, ())
+        if positive == COMMAND:
+            return True
+        if avoided or positive == 0:
+            return False
+        if positive == STRONG:
+            return True
+        return self.classifier is not None and self.classifier.probability(prompt, label) >= self.threshold
+
+    def route(self, prompt):
+        text = " ".join(prompt.lower().split())
+        cues = find_cues(text)
+        strengths = {}
+        for name in cues:
+            label, strength = CUE_INFO[name]
+            strengths.setdefault(label, set()).add(strength)
+
+        graph = self.decide(text, "graph", strengths)
+        # A prompt that is both is a plot request worded as a drawing ("draw the curve y = x^2")
+        image = not graph and self.decide(text, "image", strengths)
+
+        # A bare "plot ..." or "draw ..." command doesn't need a written answer as well
+        command = (graph and COMMAND in strengths.get("graph", ())) or (image and COMMAND in strengths.get("image", ()))
+        answer = not command or bool(EXPLAIN.search(text))
+        return Route(answer, graph, image)
+
+def parse_labels(text):
+    """'answer+graph' -> Route(True, True, False)"""
+    names = set(text.split("+"))
+    unknown = names - set(LABELS)
+    if unknown:
+        raise ValueError(f"unknown intent label(s): {', '.join(sorted(unknown))}")
+    return Route(*(label in names for label in LABELS))
+
+def load_examples(path):
+    """Read labelled prompts: one 'labels<TAB>prompt' per line, '#' starts a comment"""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            labels, prompt = line.split("\t", 1)
+            examples.append((prompt, parse_labels(labels)))
+    return examples
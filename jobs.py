@@ -0,0 +1,163 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Cancellable jobs: all the work done for one question (model calls, graph, image, speech),
+# across threads and processes, so it can be stopped when the student asks something else or
+# clears the chat.
+#
+# Cancelling is cooperative. Long-running steps check the job (or wait on its event) and
+# register callbacks that abort what can be aborted from outside: queued futures, upstream
+# streams, image downloads and graph workers. The current job travels in a context variable,
+# so tracing.bind() carries it into worker threads along with the current span.
+
+import contextvars
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("chatbot_job", default=None)
+
+class JobCancelled(Exception):
+    """The work is no longer needed: its question was superseded or the chat was cleared"""
+
+class WorkStats:
+    """Process-wide counts of work by outcome: delivered to the student, wasted (finished, but
+    for a question that was cancelled) or stopped early (cut short by a cancellation)"""
+    OUTCOMES = ("delivered", "wasted", "stopped")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.cancelled = Counter()
+
+    def add(self, kind, outcome, count=1):
+        if count:
+            with self.lock:
+                self.counts.setdefault(kind, Counter())[outcome] += count
+
+    def snapshot(self):
+        """{"cancelled": {reason: jobs}, "work": {kind: {outcome: count}}}"""
+        with self.lock:
+            return {"cancelled": dict(self.cancelled),
+                    "work": {kind: {outcome: counts[outcome] for outcome in self.OUTCOMES}
+                             for kind, counts in self.counts.items()}}
+
+STATS = WorkStats()
+
+class Job:
+    """The work for one question. Finished work is held as pending until it is shown to the
+    student (deliver), and counted as wasted if the job is cancelled first."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.pending = Counter()
+        self.reason = None
+        self.closed = False
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        """Raise JobCancelled if the job was cancelled"""
+        if self.event.is_set():
+            raise JobCancelled(self.reason)
+
+    def on_cancel(self, callback):
+        """Call callback() when the job is cancelled, or now if it already was"""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return callback
+        callback()
+        return callback
+
+    def remove(self, callback):
+        """Forget a callback whose work has finished"""
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def record(self, kind, count=1):
+        """A piece of work finished; it counts as delivered once the student sees it"""
+        with self.lock:
+            if not self.event.is_set():
+                self.pending[kind] += count
+                return
+        STATS.add(kind, "wasted", count)
+
+    def stopped(self, kind, count=1):
+        """A piece of work was cut short by the cancellation"""
+        STATS.add(kind, "stopped", count)
+
+    def deliver(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        for kind, count in pending.items():
+            STATS.add(kind, "delivered", count)
+
+    def close(self):
+        """Everything was delivered; later cancel() calls do nothing"""
+        self.deliver()
+        with self.lock:
+            self.closed = True
+            self.callbacks = []
+
+    def cancel(self, reason="superseded"):
+        """Stop the job's work; returns False if it had already finished or been cancelled"""
+        with self.lock:
+            if self.closed or self.event.is_set():
+                return False
+            self.reason = reason
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+            pending, self.pending = self.pending, Counter()
+        with STATS.lock:
+            STATS.cancelled[reason] += 1
+        for kind, count in pending.items():
+            STATS.add(kind, "wasted", count)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+def current():
+    """The job the calling code is working for, or None outside a job"""
+    return _current.get()
+
+def check():
+    """Raise JobCancelled if the current job was cancelled"""
+    job = _current.get()
+    if job is not None:
+        job.check()
+
+@contextmanager
+def running(job):
+    """Make job the current job. Work finished inside is delivered on the way out; if the block
+    is interrupted (e.g. Streamlit stops the script run for a newer one) the job is cancelled."""
+    token = _current.set(job)
+    try:
+        yield job
+    except BaseException:
+        job.cancel("interrupted")
+        raise
+    else:
+        job.deliver()
+    finally:
+        _current.reset(token)
@@ -0,0 +1,172 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# API key pool: spreads model calls over several Gemini API keys (or projects), so the deployment
+# gets the sum of their per-minute quotas instead of one key's.
+#
+# Each call goes to the key with the most quota left this minute (its requests-per-minute limit
+# minus the calls made in the last 60 s and those still running). A key answering 429 cools down
+# for an exponentially growing, jittered interval and the call moves on to the next key; a key
+# that answers normally again resets its backoff. Quota is estimated locally, so the limits only
+# need to be roughly right: a 429 corrects an estimate that was too generous.
+
+import random
+import threading
+import time
+from collections import deque, namedtuple
+
+ApiKey = namedtuple("ApiKey", ["name", "api_key", "rpm"])
+
+QUOTA_WINDOW = 60.0                   # seconds the requests-per-minute limits are counted over
+
+class KeysExhausted(Exception):
+    """Every key is cooling down after a 429; carries code 429 so callers back off and retry"""
+    code = 429
+
+    def __init__(self, wait):
+        super().__init__(f"all API keys are rate limited for another {wait:.0f}s")
+        self.wait = wait
+
+def is_quota_error(error):
+    """A 429 from the API: that key's quota is used up, but another key may still have some"""
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    return code == 429 or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+def mask(api_key):
+    """Enough of a key to tell them apart on a dashboard"""
+    return f"…{api_key[-4:]}" if api_key and len(api_key) > 8 else "…"
+
+class KeySlot:
+    """One API key with its client, local quota estimate and health"""
+    def __init__(self, key, client=None):
+        self.name = key.name
+        self.rpm = key.rpm
+        self.masked = mask(key.api_key)
+        self.client = client
+        self.recent = deque()
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.last_used = 0.0
+        # Totals for the dashboard
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=200)
+
+    def remaining(self, now):
+        while self.recent and self.recent[0] <= now - QUOTA_WINDOW:
+            self.recent.popleft()
+        return self.rpm - len(self.recent) - self.in_flight
+
+class KeyPool:
+    """Picks the least-loaded healthy key for each call; safe to use from any thread"""
+    def __init__(self, slots, backoff_base=2.0, backoff_max=60.0):
+        if not slots:
+            raise ValueError("the key pool needs at least one API key")
+        self.slots = list(slots)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+
+    def acquire(self, exclude=()):
+        """Reserve the key with the most quota left, skipping cooling keys and those in exclude.
+        Raises KeysExhausted if none is available."""
+        with self.lock:
+            now = time.monotonic()
+            ready = [slot for slot in self.slots if slot.cooldown_until <= now and slot not in exclude]
+            if not ready:
+                cooling = [slot.cooldown_until - now for slot in self.slots if slot.cooldown_until > now]
+                raise KeysExhausted(min(cooling) if cooling else 0.0)
+            slot = max(ready, key=lambda slot: (slot.remaining(now), -slot.in_flight, -slot.last_used))
+            slot.in_flight += 1
+            slot.last_used = now
+            slot.recent.append(now)
+            slot.calls += 1
+            return slot
+
+    def release(self, slot, latency=None, error=None):
+        """Return a key after its call; a 429 starts (or lengthens) its cooldown"""
+        with self.lock:
+            slot.in_flight -= 1
+            if error is None:
+                slot.strikes = 0
+                if latency is not None:
+                    slot.latencies.append(latency)
+            elif is_quota_error(error):
+                slot.throttled += 1
+                slot.strikes += 1
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** (slot.strikes - 1))
+                slot.cooldown_until = time.monotonic() + backoff * random.uniform(0.75, 1.25)
+            else:
+                slot.errors += 1
+
+    def health(self):
+        """Per-key state for the dashboard"""
+        with self.lock:
+            now = time.monotonic()
+            rows = []
+            for slot in self.slots:
+                latencies = sorted(slot.latencies)
+                rows.append({
+                    "name": slot.name, "key": slot.masked, "rpm": slot.rpm,
+                    "remaining": slot.remaining(now), "in_flight": slot.in_flight,
+                    "cooldown": max(0.0, slot.cooldown_until - now),
+                    "calls": slot.calls, "throttled": slot.throttled, "errors": slot.errors,
+                    "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+                })
+            return rows
+
+class PooledModel:
+    """A model spread over the pool's keys, with the generate_content() of the model it wraps.
+    models maps each key's name to a model bound to that key's client. A 429 moves the call to
+    the next key; once every key has refused, the error is raised for the caller to retry."""
+    def __init__(self, pool, models, model_name, system_instruction=None):
+        self.pool = pool
+        self.models = models
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        tried = []
+        while True:
+            slot = self.pool.acquire(exclude=tried)
+            start = time.perf_counter()
+            try:
+                response = self.models[slot.name].generate_content(contents, stream=stream, **kwargs)
+            except Exception as e:
+                self.pool.release(slot, error=e)
+                tried.append(slot)
+                if not is_quota_error(e) or len(tried) == len(self.pool.slots):
+                    raise
+                continue
+            if not stream:
+                self.pool.release(slot, time.perf_counter() - start)
+                return response
+            return self._stream(slot, response, start)
+
+    def _stream(self, slot, response, start):
+        """Iterate a streamed response, keeping its key in use until the stream ends"""
+        error = None
+        try:
+            yield from response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.pool.release(slot, time.perf_counter() - start, error)
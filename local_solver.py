@@ -0,0 +1,1013 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Solves closed-form textbook questions locally, with worked steps, in milliseconds:
+# one-formula physics problems (Ohm's law, the field of a wire, photon energy, ...),
+# unit conversions, SI units and constants, and algebra/calculus that SymPy can do
+# mechanically (equations, systems, factorising, derivatives, integrals, eigenvalues,
+# first-order ODEs). Anything it doesn't recognise with certainty returns None and the
+# question goes to the model as before.
+#
+# Everything is matched with cheap regexes first; SymPy (~0.4 s to import) is only loaded
+# once a question looks solvable. Without SymPy only facts and unit conversions are answered here.
+#
+# SymPy puts no bound on the work a question asks for ("Evaluate: 9^9^9"), so it runs in worker
+# processes under a time and memory limit, and a worker that overruns is killed. Large powers are
+# refused before anything is evaluated, and so are answers too long to read.
+
+import math
+import queue
+import re
+import signal
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the parent still kills a worker that runs too long
+    resource = None
+
+TIME_LIMIT = 2.0                      # seconds solve() may take on a question before it goes to the model
+STARTUP_LIMIT = 30.0                  # seconds a new worker may take to start and import SymPy
+KILL_MARGIN = 0.5                     # seconds past the deadline before a worker that didn't stop itself is killed
+MEMORY_LIMIT = 1024 ** 3              # bytes of address space per worker
+MAX_EXPONENT = 12                     # larger powers ((x+y+z)^200, 9^9^9) are left to the model
+MAX_ANSWER_CHARS = 3000               # longer worked answers are left to the model
+
+# ---- Physics registry ----
+
+# dimension: (SI unit symbol, quantity name)
+DIMENSIONS = {
+    "current": ("A", "current"),
+    "voltage": ("V", "voltage"),
+    "resistance": ("\\Omega", "resistance"),
+    "length": ("m", "length"),
+    "mass": ("kg", "mass"),
+    "time": ("s", "time"),
+    "velocity": ("m/s", "velocity"),
+    "acceleration": ("m/s^2", "acceleration"),
+    "force": ("N", "force"),
+    "energy": ("J", "energy"),
+    "power": ("W", "power"),
+    "charge": ("C", "charge"),
+    "frequency": ("Hz", "frequency"),
+    "temperature": ("K", "temperature"),
+    "pressure": ("Pa", "pressure"),
+    "magnetic_field": ("T", "magnetic field"),
+    "electric_field": ("N/C", "electric field"),
+    "capacitance": ("F", "capacitance"),
+    "momentum": ("kg\\,m/s", "momentum"),
+    "angle": ("rad", "angle"),
+}
+
+# (unit as written, dimension, factor to SI); longest spellings are tried first
+UNITS = [
+    ("ohms", "resistance", 1), ("ohm", "resistance", 1), ("Ω", "resistance", 1),
+    ("kΩ", "resistance", 1e3), ("kohm", "resistance", 1e3), ("MΩ", "resistance", 1e6),
+    ("volts", "voltage", 1), ("volt", "voltage", 1), ("V", "voltage", 1), ("kV", "voltage", 1e3), ("mV", "voltage", 1e-3),
+    ("amperes", "current", 1), ("ampere", "current", 1), ("amps", "current", 1), ("amp", "current", 1),
+    ("A", "current", 1), ("mA", "current", 1e-3),
+    ("m/s^2", "acceleration", 1), ("m/s²", "acceleration", 1), ("m s^-2", "acceleration", 1),
+    ("m/s", "velocity", 1), ("m s^-1", "velocity", 1), ("km/h", "velocity", 1 / 3.6), ("kmh", "velocity", 1 / 3.6),
+    ("mph", "velocity", 0.44704), ("cm/s", "velocity", 1e-2),
+    ("km", "length", 1e3), ("cm", "length", 1e-2), ("mm", "length", 1e-3), ("μm", "length", 1e-6),
+    ("um", "length", 1e-6), ("nm", "length", 1e-9), ("metres", "length", 1), ("meters", "length", 1),
+    ("metre", "length", 1), ("meter", "length", 1), ("m", "length", 1),
+    ("kg", "mass", 1), ("g", "mass", 1e-3), ("grams", "mass", 1e-3), ("tonnes", "mass", 1e3),
+    ("ms", "time", 1e-3), ("seconds", "time", 1), ("second", "time", 1), ("s", "time", 1),
+    ("minutes", "time", 60), ("min", "time", 60), ("hours", "time", 3600), ("h", "time", 3600),
+    ("kN", "force", 1e3), ("newtons", "force", 1), ("N", "force", 1),
+    ("kJ", "energy", 1e3), ("MJ", "energy", 1e6), ("joules", "energy", 1), ("J", "energy", 1),
+    ("eV", "energy", 1.602176634e-19),
+    ("kW", "power", 1e3), ("MW", "power", 1e6), ("watts", "power", 1), ("W", "power", 1),
+    ("μC", "charge", 1e-6), ("uC", "charge", 1e-6), ("microcoulombs", "charge", 1e-6), ("microcoulomb", "charge", 1e-6),
+    ("nC", "charge", 1e-9), ("mC", "charge", 1e-3), ("coulombs", "charge", 1), ("C", "charge", 1),
+    ("GHz", "frequency", 1e9), ("MHz", "frequency", 1e6), ("kHz", "frequency", 1e3), ("Hz", "frequency", 1),
+    ("kPa", "pressure", 1e3), ("Pa", "pressure", 1), ("atm", "pressure", 101325),
+    ("mT", "magnetic_field", 1e-3), ("μT", "magnetic_field", 1e-6), ("T", "magnetic_field", 1),
+    ("μF", "capacitance", 1e-6), ("uF", "capacitance", 1e-6), ("nF", "capacitance", 1e-9), ("pF", "capacitance", 1e-12),
+    ("F", "capacitance", 1),
+    ("K", "temperature", 1),
+    ("degrees", "angle", math.pi / 180), ("degree", "angle", math.pi / 180), ("°", "angle", math.pi / 180),
+]
+UNIT_FACTORS = {unit: (dimension, factor) for unit, dimension, factor in UNITS}
+
+# symbol: (value in SI, LaTeX, unit, name, spellings the question may use to give its own value)
+CONSTANTS = {
+    "g": (9.81, "g", "m/s^2", "acceleration due to gravity", ("g",)),
+    "c": (2.998e8, "c", "m/s", "speed of light", ("c",)),
+    "h": (6.626e-34, "h", "J\\,s", "Planck's constant", ("h",)),
+    "mu0": (4 * math.pi * 1e-7, "\\mu_0", "T\\,m/A", "permeability of free space", ("mu0", "mu_0", "μ0", "μ_0", "u0")),
+    "eps0": (8.854e-12, "\\varepsilon_0", "F/m", "permittivity of free space", ("epsilon0", "eps0", "ε0", "ε_0")),
+    "k": (8.988e9, "k", "N\\,m^2/C^2", "Coulomb's constant", ("k",)),
+    "e": (1.602e-19, "e", "C", "elementary charge", ()),
+    "G": (6.674e-11, "G", "N\\,m^2/kg^2", "gravitational constant", ("G",)),
+    "R": (8.314, "R", "J/(mol\\,K)", "molar gas constant", ()),
+    "NA": (6.022e23, "N_A", "mol^{-1}", "Avogadro's number", ("NA", "N_A")),
+    "kB": (1.381e-23, "k_B", "J/K", "Boltzmann constant", ("kB", "k_B")),
+    "me": (9.109e-31, "m_e", "kg", "electron mass", ("me", "m_e")),
+}
+CONSTANT_SPELLINGS = {spelling: symbol for symbol, entry in CONSTANTS.items() for spelling in entry[4]}
+
+# Questions asking for a constant's value, e.g. "What is Planck's constant symbol and approximate value?"
+CONSTANT_NAMES = [
+    (r"planck'?s? constant", "h"), (r"speed of light", "c"), (r"gravitational constant", "G"),
+    (r"acceleration (?:due to|of) (?:free fall|gravity)", "g"), (r"permeability of free space", "mu0"),
+    (r"permittivity of free space", "eps0"), (r"coulomb'?s? constant", "k"),
+    (r"(?:elementary charge|charge (?:on|of) an? electron)", "e"), (r"avogadro'?s? (?:number|constant)", "NA"),
+    (r"boltzmann'?s? constant", "kB"), (r"(?:molar )?gas constant", "R"), (r"mass of an? electron|electron mass", "me"),
+]
+
+SI_UNITS = [
+    (r"electric current|current", "electric current", "the ampere (A)"),
+    (r"potential difference|voltage|electromotive force|emf", "potential difference", "the volt (V)"),
+    (r"resistance", "resistance", "the ohm (Ω)"), (r"electric charge|charge", "electric charge", "the coulomb (C)"),
+    (r"capacitance", "capacitance", "the farad (F)"), (r"magnetic flux density|magnetic field", "magnetic flux density", "the tesla (T)"),
+    (r"magnetic flux", "magnetic flux", "the weber (Wb)"), (r"inductance", "inductance", "the henry (H)"),
+    (r"force", "force", "the newton (N)"), (r"energy|work|heat", "energy", "the joule (J)"), (r"power", "power", "the watt (W)"),
+    (r"pressure", "pressure", "the pascal (Pa)"), (r"frequency", "frequency", "the hertz (Hz)"),
+    (r"mass", "mass", "the kilogram (kg)"), (r"length|distance", "length", "the metre (m)"), (r"time", "time", "the second (s)"),
+    (r"(?:thermodynamic )?temperature", "thermodynamic temperature", "the kelvin (K)"),
+    (r"amount of substance", "amount of substance", "the mole (mol)"), (r"luminous intensity", "luminous intensity", "the candela (cd)"),
+    (r"momentum", "momentum", "the kilogram metre per second (kg·m/s)"),
+    (r"acceleration", "acceleration", "the metre per second squared (m/s²)"), (r"velocity|speed", "velocity", "the metre per second (m/s)"),
+]
+
+# Words a one-formula question may use without changing its physics. Any other word (a planet,
+# a medium, "relativistic", "decelerates") may change it, so the question goes to the model.
+PLAIN_WORDS = set("""
+a an the is are was were be been has have had it its this that of to for in on at by with from into as and
+each per what which find calculate determine compute work out how much fast long far high give state value
+answer your please use take given approximately approximate
+object body ball car block box stone particle person cyclist runner train vehicle trolley
+resistor battery cell circuit component wire lamp bulb heater kettle appliance device motor supply source
+connected across through carries carrying flows flowing passes passing applied placed
+moves moving travels travelling traveling accelerates accelerating uniformly constant steady
+distance point away apart separated between two charges rest start starts
+current voltage potential difference pd emf resistance power kinetic energy work done force weight tension
+acceleration final initial velocity speed wavelength frequency period time length displacement height momentum
+charge capacitance mass magnetic electric field flux density strength
+""".split())
+
+# Words allowed around a constant's name in "What is the value of ...?"
+FACT_WORDS = {"what", "whats", "is", "the", "value", "symbol", "of", "and", "its", "approximate",
+              "approximately", "numerical", "give", "state", "write", "down", "please"}
+
+Formula = namedtuple("Formula", ["name", "equation", "variables", "cues", "roles"])
+
+def formula(name, equation, cues=(), roles=None, **variables):
+    """variables map each symbol to its dimension; roles tell apart two symbols of one dimension"""
+    return Formula(name, equation, variables, cues, roles or {})
+
+FORMULAS = [
+    formula("Ohm's law", "V = I*R", V="voltage", I="current", R="resistance"),
+    formula("electrical power", "P = V*I", ("power",), P="power", V="voltage", I="current"),
+    formula("electrical power", "P = I**2*R", ("power",), P="power", I="current", R="resistance"),
+    formula("electrical power", "P = V**2/R", ("power",), P="power", V="voltage", R="resistance"),
+    formula("charge and current", "Q = I*t", ("charge", "flow", "pass"), Q="charge", I="current", t="time"),
+    formula("charge on a capacitor", "Q = C*V", ("capacit",), Q="charge", C="capacitance", V="voltage"),
+    formula("magnetic field of a long straight wire", "B = mu0*I/(2*pi*r)", ("wire",),
+            B="magnetic_field", I="current", r="length"),
+    formula("electric field of a point charge", "E = k*q/r**2", ("field",), E="electric_field", q="charge", r="length"),
+    formula("Coulomb's law", "F = k*q1*q2/r**2", ("charge",), {"q1": "first", "q2": "second"},
+            F="force", q1="charge", q2="charge", r="length"),
+    formula("photon energy", "E = h*c/lambda_", ("photon", "light", "wavelength"), E="energy", lambda_="length"),
+    formula("photon energy", "E = h*f", ("photon",), E="energy", f="frequency"),
+    formula("the wave equation", "v = f*lambda_", ("wave",), v="velocity", f="frequency", lambda_="length"),
+    formula("Newton's second law", "F = m*a", F="force", m="mass", a="acceleration"),
+    formula("weight", "W = m*g", ("weight", "weigh"), W="force", m="mass"),
+    formula("kinetic energy", "E_k = m*v**2/2", ("kinetic",), E_k="energy", m="mass", v="velocity"),
+    formula("gravitational potential energy", "E_p = m*g*h", ("potential", "lift", "raise"), E_p="energy", m="mass", h="length"),
+    formula("momentum", "p = m*v", ("momentum",), p="momentum", m="mass", v="velocity"),
+    formula("power", "P = E/t", ("power",), P="power", E="energy", t="time"),
+    formula("frequency and period", "T = 1/f", ("period",), T="time", f="frequency"),
+    formula("period of a simple pendulum", "T = 2*pi*sqrt(L/g)", ("pendulum",), T="time", L="length"),
+    formula("average speed", "v = d/t", ("speed", "velocity", "travel"), v="velocity", d="length", t="time"),
+    formula("the equations of motion", "v = u + a*t", ("rest",), {"u": "initial", "v": "final"},
+            v="velocity", u="velocity", a="acceleration", t="time"),
+    formula("the equations of motion", "s = u*t + a*t**2/2", ("rest",), {"u": "initial"},
+            s="length", u="velocity", a="acceleration", t="time"),
+    formula("the equations of motion", "v**2 = u**2 + 2*a*s", ("rest",), {"u": "initial", "v": "final"},
+            v="velocity", u="velocity", a="acceleration", s="length"),
+]
+
+# Words in the question that name the unknown: (pattern, dimension, role)
+TARGETS = [
+    (r"magnetic (?:field|flux density)", "magnetic_field", None), (r"electric field(?: strength)?", "electric_field", None),
+    (r"potential difference|voltage|p\.?d\.?|emf", "voltage", None), (r"current", "current", None),
+    (r"resistance", "resistance", None), (r"power", "power", None),
+    (r"kinetic energy|potential energy|energy|work done", "energy", None),
+    (r"force|weight|tension", "force", None), (r"acceleration", "acceleration", None),
+    (r"final (?:velocity|speed)", "velocity", "final"), (r"initial (?:velocity|speed)", "velocity", "initial"),
+    (r"velocity|speed|how fast", "velocity", "final"), (r"wavelength", "length", None),
+    (r"frequency", "frequency", None), (r"period", "time", None), (r"time|how long", "time", None),
+    (r"distance|displacement|height|how far|how high", "length", None), (r"momentum", "momentum", None),
+    (r"charge", "charge", None), (r"capacitance", "capacitance", None), (r"mass", "mass", None),
+]
+TARGET_PATTERNS = [(re.compile(rf"\b(?:{pattern})\b"), dimension, role) for pattern, dimension, role in TARGETS]
+
+NUMBER = (r"(?<![\w.])(?P<mantissa>\d+(?:\.\d+)?|\.\d+)\s*(?P<pi>π|pi)?"
+          r"(?:\s*(?:x|×|\*)\s*10\s*\^\s*\(?(?P<exponent>[-−+]?\d+)\)?|[eE](?P<e>[-+]?\d+))?")
+UNIT_ALTERNATIVES = "|".join(re.escape(unit) for unit in sorted(UNIT_FACTORS, key=len, reverse=True))
+QUANTITY = re.compile(rf"{NUMBER}\s*(?P<unit>{UNIT_ALTERNATIVES})(?![\w/^²])")
+BARE_NUMBER = re.compile(NUMBER)
+# "(mu0 = 4pi x 10^-7 T·m/A)" supplies a constant; the units after it run to the next comma or bracket
+ASSIGNMENT = re.compile(rf"(?P<name>[A-Za-zμε_0-9]+)\s*=\s*{NUMBER}[^,;)\n]*")
+QUESTION = re.compile(r"(?:what|find|calculate|determine|compute|work out|how much|how fast|how long|how far|how high)\b[^.!]*",
+                      re.I)
+AT_REST = re.compile(r"\b(?:from rest|at rest|starts? from rest|is dropped|is released)\b", re.I)
+
+def parse_number(match):
+    value = float(match.group("mantissa"))
+    if match.group("pi"):
+        value *= math.pi
+    exponent = match.group("exponent") or match.group("e")
+    if exponent:
+        # A float power, so 10^999999999 overflows at once instead of building a huge integer
+        value *= 10.0 ** int(exponent.replace("−", "-"))
+    return value
+
+# ---- Output ----
+
+Solution = namedtuple("Solution", ["title", "steps", "answer"])
+
+FOOTER = "_Solved instantly by the built-in solver. Ask a follow-up if you'd like the ideas behind it explained._"
+
+def to_markdown(solution):
+    lines = [f"**{solution.title}**", ""]
+    for number, step in enumerate(solution.steps, 1):
+        lines += [f"**Step {number}:** {step}", ""]
+    lines += [f"**Answer:** {solution.answer}", "", FOOTER]
+    return "\n".join(lines)
+
+def format_value(value, figures=3, trim=False):
+    """A number to 3 significant figures in LaTeX, in standard form when very large or small.
+    trim drops trailing zeros, for values quoted from the question."""
+    if value == 0:
+        return "0"
+    exponent = math.floor(math.log10(abs(value)))
+    if -3 <= exponent < 5:
+        digits = f"{round(value, figures - 1 - exponent):.{max(0, figures - 1 - exponent)}f}"
+        return digits.rstrip("0").rstrip(".") if trim and "." in digits else digits
+    mantissa = value / 10 ** exponent
+    if round(mantissa, figures - 1) >= 10:
+        mantissa, exponent = mantissa / 10, exponent + 1
+    digits = f"{mantissa:.{figures - 1}f}"
+    if trim:
+        digits = digits.rstrip("0").rstrip(".")
+    return f"{digits} \\times 10^{{{exponent}}}"
+
+def with_unit(value, dimension, trim=False):
+    return f"{format_value(value, trim=trim)}\\ \\mathrm{{{DIMENSIONS[dimension][0]}}}"
+
+# ---- Solver ----
+
+class SolverTimeout(Exception):
+    """The SymPy work ran past its time limit"""
+
+def _on_alarm(signum, frame):
+    raise SolverTimeout("the solver took too long")
+
+def worker_main(conn, memory_limit):
+    """Run SymPy tasks sent by the parent, one at a time, until the pipe closes"""
+    # Load SymPy and its parser once, before the first question
+    parse("x + 1")
+
+    if resource is not None and memory_limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError):
+            pass
+    use_alarm = hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+    conn.send("ready")
+    while True:
+        try:
+            function, args, time_limit = conn.recv()
+        except EOFError:
+            return
+        # The alarm interrupts Python code; the parent kills a worker stuck inside C code
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, time_limit)
+        try:
+            solution = function(*args)
+            if solution is not None and len(to_markdown(solution)) > MAX_ANSWER_CHARS:
+                solution = None
+        except BaseException:
+            solution = None
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        conn.send(solution)
+
+class SolverWorker:
+    """One worker process and the pipe to it"""
+    def __init__(self, context, memory_limit):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child, memory_limit),
+                                       name="chatbot-solver", daemon=True)
+        self.process.start()
+        child.close()
+        self.created = time.monotonic()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        """Whether the worker has loaded SymPy, waiting up to timeout seconds for it"""
+        if not self.ready and self.conn.poll(max(0.0, timeout)):
+            self.conn.recv()
+            self.ready = True
+        return self.ready
+
+    def run(self, function, args, time_limit):
+        """The task's result, or SolverTimeout if the worker doesn't answer in time"""
+        self.conn.send((function, args, time_limit))
+        # The worker stops itself at the limit; the margin covers work it can't interrupt
+        if not self.conn.poll(time_limit + KILL_MARGIN):
+            raise SolverTimeout("the solver took too long")
+        return self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+class LocalSolver:
+    """Counts what it solves. Facts and conversions are answered in-process; SymPy work goes to
+    up to `workers` worker processes, and a question they can't finish in time goes to the model."""
+    def __init__(self, workers=1, time_limit=TIME_LIMIT, memory_limit=MEMORY_LIMIT):
+        self.workers = workers
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.lock = threading.Lock()
+        self.idle = queue.Queue()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def warm(self):
+        """Start the workers now so the first question doesn't wait for SymPy to load"""
+        for _ in range(self.workers - self.started):
+            self.idle.put(self._start_worker())
+
+    def _start_worker(self):
+        import multiprocessing
+        with self.lock:
+            self.started += 1
+        return SolverWorker(multiprocessing.get_context("spawn"), self.memory_limit)
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            spare = self.started < self.workers
+        # Every worker is busy: the question goes straight to the model rather than queue here
+        return self._start_worker() if spare else None
+
+    def run(self, function, *args, deadline=None):
+        """function(*args) in a worker process, or None if no worker was free, it failed or it
+        didn't finish by the deadline (a time.monotonic() value; time_limit from now by default)"""
+        if deadline is None:
+            deadline = time.monotonic() + self.time_limit
+        worker = self._acquire()
+        if worker is None:
+            return None
+        try:
+            if not worker.wait_ready(deadline - time.monotonic()):
+                # Still loading SymPy, so it is kept for a later question unless it seems stuck
+                if time.monotonic() - worker.created < STARTUP_LIMIT:
+                    self.idle.put(worker)
+                    return None
+                raise SolverTimeout("the solver worker didn't start")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.idle.put(worker)
+                return None
+            result = worker.run(function, args, remaining)
+        except Exception:
+            # The worker may still be computing, so it is replaced rather than reused
+            with self.lock:
+                self.started -= 1
+                self.timeouts += 1
+            worker.kill()
+            return None
+        self.idle.put(worker)
+        return result
+
+    def solve(self, question):
+        """A Solution, or None to leave the question to the model"""
+        text = "\n".join(" ".join(line.split()) for line in question.splitlines() if line.strip())
+        # One time limit for the whole question, however many tiers get to try it
+        deadline = time.monotonic() + self.time_limit
+        solution = None
+        tiers = (solve_fact, solve_conversion, partial(self.solve_physics, deadline=deadline),
+                 partial(self.solve_maths, deadline=deadline))
+        for tier in tiers:
+            try:
+                solution = tier(text)
+            except Exception:
+                solution = None
+            if solution is not None:
+                break
+        if solution is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return solution
+
+    def solve_physics(self, text, deadline=None):
+        problem = match_physics(text)
+        if problem is None:
+            return None
+        return self.run(work_formula, *problem, deadline=deadline)
+
+    def solve_maths(self, text, deadline=None):
+        if not MATHS_COMMAND.search(text):
+            return None
+        return self.run(solve_maths, text, deadline=deadline)
+
+def solve_fact(text):
+    lower = text.lower().rstrip("?. ")
+    match = re.fullmatch(r"(?:what is|what's|state|give) the si unit (?:of|for) (?:an? |the )?(.+)", lower)
+    if match:
+        for pattern, quantity, unit in SI_UNITS:
+            if re.fullmatch(pattern, match.group(1)):
+                return Solution(f"SI unit of {quantity}", [], f"The SI unit of {quantity} is {unit}.")
+        return None
+    value_question = (re.search(r"\b(?:value|symbol)\b", lower) and len(lower.split()) <= 14
+                      and not BARE_NUMBER.search(lower))
+    asked = re.fullmatch(r"(?:what is|what's) (?:the )?(?:value of )?(?:the )?(.+)", lower)
+    for pattern, symbol in CONSTANT_NAMES:
+        named = re.search(rf"\b(?:{pattern})", lower)
+        # "the gravitational constant on Jupiter" asks for more than the constant
+        plain = named and set(re.findall(r"[a-z]{2,}", lower[:named.start()] + " " + lower[named.end():])) <= FACT_WORDS
+        if (value_question and plain) or (asked and re.fullmatch(pattern, asked.group(1))):
+            value, latex, unit, name, _ = CONSTANTS[symbol]
+            subject = name if "'" in name else f"the {name}"
+            return Solution(name[0].upper() + name[1:], [],
+                            f"{subject[0].upper() + subject[1:]} has the symbol ${latex}$ and is approximately "
+                            f"${format_value(value, 4)}\\ \\mathrm{{{unit}}}$.")
+    return None
+
+def solve_conversion(text):
+    match = re.fullmatch(rf"(?:please )?convert (?P<number>{NUMBER})\s*(?P<from_unit>\S+) (?:to|into) (?P<to_unit>[^?.\s]+)[?.]?", text, re.I)
+    if not match:
+        return None
+    source, target = UNIT_FACTORS.get(match.group("from_unit")), UNIT_FACTORS.get(match.group("to_unit"))
+    if source is None or target is None or source[0] != target[0]:
+        return None
+    value = parse_number(match)
+    factor = source[1] / target[1]
+    result = value * factor
+    from_unit, to_unit = match.group("from_unit"), match.group("to_unit")
+    steps = [f"One {from_unit} is ${format_value(factor, 4)}$ {to_unit}.",
+             f"Multiply: ${format_value(value, 4, trim=True)} \\times {format_value(factor, 4)} = {format_value(result)}$"]
+    # The question's number is echoed as the student typed it
+    return Solution("Unit conversion", steps, f"{match.group('number').strip()} {from_unit} = ${format_value(result)}$ {to_unit}")
+
+def read_problem(text):
+    """Given quantities, constants supplied by the question, and whether every number was understood"""
+    constants = {}
+    def take_constant(match):
+        symbol = CONSTANT_SPELLINGS.get(match.group("name"))
+        if symbol is None:
+            return match.group(0)
+        constants[symbol] = parse_number(match)
+        return " "
+    body = ASSIGNMENT.sub(take_constant, text)
+
+    quantities = []
+    for match in QUANTITY.finditer(body):
+        dimension, factor = UNIT_FACTORS[match.group("unit")]
+        # Values converted to SI keep a note of how the question wrote them
+        note = match.group(0).strip() if factor != 1 else None
+        quantities.append((dimension, parse_number(match) * factor, note))
+    # Any number left once the quantities are taken out (e.g. "n = 2") is something we don't understand
+    understood = not BARE_NUMBER.search(QUANTITY.sub(" ", body))
+    return quantities, constants, understood, body
+
+def find_target(body):
+    """(dimension, role) of the quantity asked for"""
+    questions = QUESTION.findall(body)
+    if not questions:
+        return None
+    clause = questions[-1].lower()
+    found = [(match.start(), dimension, role) for pattern, dimension, role in TARGET_PATTERNS
+             for match in [pattern.search(clause)] if match]
+    if not found:
+        return None
+    _, dimension, role = min(found)
+    return dimension, role
+
+def bind(formula, quantities, target, at_rest, text):
+    """Assign the given quantities to the formula's symbols; None unless every one is used exactly once"""
+    dimension, role = target
+    unknowns = [symbol for symbol, dim in formula.variables.items() if dim == dimension]
+    if len(unknowns) > 1:
+        unknowns = [symbol for symbol in unknowns if formula.roles.get(symbol) == role]
+    if len(unknowns) != 1:
+        return None
+    unknown = unknowns[0]
+
+    values = {}
+    remaining = [symbol for symbol in formula.variables if symbol != unknown]
+    if at_rest and formula.roles.get("u") == "initial" and "u" in remaining:
+        values["u"] = (0.0, "at rest")
+        remaining.remove("u")
+    pool = list(quantities)
+    for symbol in remaining:
+        matches = [quantity for quantity in pool if quantity[0] == formula.variables[symbol]]
+        if not matches:
+            return None
+        if len(matches) > 1 and not formula.roles.get(symbol) in ("first", "second"):
+            return None
+        quantity = matches[0]
+        pool.remove(quantity)
+        values[symbol] = (quantity[1], quantity[2])
+    if pool:
+        return None
+    if formula.cues and not any(cue in text for cue in formula.cues):
+        return None
+    return unknown, values
+
+def match_physics(text):
+    """(formula, unknown, values, supplied, dimension) for work_formula, or None; regexes only"""
+    quantities, supplied, understood, body = read_problem(text)
+    if not quantities or not understood:
+        return None
+    target = find_target(body)
+    if target is None:
+        return None
+    lower = text.lower()
+    at_rest = bool(AT_REST.search(text))
+    candidates = [(formula, binding) for formula in FORMULAS
+                  for binding in [bind(formula, quantities, target, at_rest, lower)] if binding]
+    if len({formula.equation for formula, _ in candidates}) != 1:
+        # Nothing fits, or several formulas do and the question is ambiguous
+        return None
+    formula, (unknown, values) = candidates[0]
+    if unexplained_words(body, formula):
+        # "on the Moon", "in water", "relativistic": the formula alone would give a wrong answer
+        return None
+    return formula, unknown, values, supplied, target[0]
+
+def unexplained_words(body, formula):
+    """Words of the question that neither the formula nor PLAIN_WORDS accounts for"""
+    known = PLAIN_WORDS | set(re.findall(r"[a-z]+", formula.name.lower()))
+    words = re.findall(r"[a-z]{2,}", QUANTITY.sub(" ", body).lower())
+    return {word for word in words if word not in known and not any(word.startswith(cue) for cue in formula.cues)}
+
+def solve_physics(text):
+    problem = match_physics(text)
+    return work_formula(*problem) if problem is not None else None
+
+def work_formula(formula, unknown, values, supplied, dimension):
+    import sympy
+
+    names = set(formula.variables) | set(CONSTANTS) | {"pi"}
+    symbols = {name: sympy.Symbol(name) for name in names if name != "pi"}
+    symbols["pi"] = sympy.pi
+    lhs, rhs = formula.equation.split("=")
+    equation = sympy.Eq(sympy.sympify(lhs, locals=symbols), sympy.sympify(rhs, locals=symbols))
+    solutions = [s for s in sympy.solve(equation, symbols[unknown])]
+
+    substitutions = {symbols[symbol]: value for symbol, (value, _) in values.items()}
+    used_constants = [name for name in CONSTANTS
+                      if name not in formula.variables and symbols[name] in equation.free_symbols]
+    for name in used_constants:
+        substitutions[symbols[name]] = supplied.get(name, CONSTANTS[name][0])
+    results = [float(solution.subs(substitutions).evalf()) for solution in solutions]
+    if not all(math.isfinite(result) for result in results):
+        return None
+    # Keep the physical root when rearranging gives ±
+    picked = [(solution, result) for solution, result in zip(solutions, results) if result >= 0] or list(zip(solutions, results))
+    if len(picked) != 1:
+        return None
+    solution, result = picked[0]
+
+    latex_names = {symbols[name]: sympy.Symbol(CONSTANTS[name][1]) for name in used_constants}
+    latex_names.update({symbols[symbol]: sympy.Symbol(latex_symbol(symbol)) for symbol in formula.variables})
+    def show(expression):
+        return sympy.latex(expression.subs(latex_names, simultaneous=True))
+
+    given = []
+    for symbol, (value, note) in values.items():
+        given.append(f"${latex_symbol(symbol)} = {with_unit(value, formula.variables[symbol], trim=True)}$"
+                     + (f" ({note})" if note else ""))
+    for name in used_constants:
+        value = supplied.get(name, CONSTANTS[name][0])
+        source = "given" if name in supplied else CONSTANTS[name][3]
+        given.append(f"${CONSTANTS[name][1]} = {format_value(value, 4, trim=True)}\\ \\mathrm{{{CONSTANTS[name][2]}}}$ ({source})")
+
+    steps = ["Write down what we know: " + ", ".join(given) + "."]
+    steps.append(f"Use {formula.name}: ${show(equation.lhs)} = {show(equation.rhs)}$")
+    target_symbol = latex_symbol(unknown)
+    if equation.lhs != symbols[unknown]:
+        steps.append(f"Rearrange for ${target_symbol}$: ${target_symbol} = {show(solution)}$")
+    numbers = {symbols[symbol]: format_value(value, 4, trim=True) for symbol, (value, _) in values.items()}
+    numbers.update({symbols[name]: format_value(supplied.get(name, CONSTANTS[name][0]), 4, trim=True)
+                    for name in used_constants})
+    substituted = sympy.latex(solution, symbol_names=numbers, mul_symbol="dot")
+    steps.append(f"Substitute the values (in SI units): ${target_symbol} = {substituted}$")
+
+    answer = f"${target_symbol} = {with_unit(result, dimension)}$"
+    if dimension == "energy" and 0 < result < 1e-15:
+        answer += f" $= {format_value(result / UNIT_FACTORS['eV'][1])}\\ \\mathrm{{eV}}$"
+    return Solution(formula.name[0].upper() + formula.name[1:], steps, answer)
+
+def latex_symbol(symbol):
+    return {"lambda_": "\\lambda", "E_k": "E_k", "E_p": "E_p", "q1": "q_1", "q2": "q_2"}.get(symbol, symbol)
+
+# ---- Maths tier (SymPy) ----
+
+MATHS_COMMAND = re.compile(
+    r"^(?:(?:please|can you|could you)\s+)*(?:solve|factori[sz]e|factor|expand|differentiate|integrate|evaluate|"
+    r"find (?:the )?(?:roots|derivative|integral|eigenvalues|determinant|inverse)|(?:the )?(?:derivative|integral|roots) of|"
+    r"d/dx)\b|\bfind the (?:eigenvalues|determinant|inverse) of\b", re.I)
+
+# Only these words may reach SymPy's parser (it evaluates the text as Python); any other word
+# is read as a product of single-letter variables
+ALLOWED_WORDS = {"sin", "cos", "tan", "sec", "csc", "cot", "asin", "acos", "atan", "sinh", "cosh", "tanh",
+                 "exp", "log", "ln", "sqrt", "pi", "abs"}
+SAFE_EXPRESSION = re.compile(r"[a-z0-9\s+\-*/^().,=\[\]]*")
+MAX_EXPRESSION = 120
+
+FUNCTION_POWER = re.compile(r"\b(sin|cos|tan|sec|csc|cot|sinh|cosh|tanh)\s*\^\s*(\d+)\s*\(([^()]*)\)")
+
+def normalize_maths(text):
+    text = (text.replace("−", "-").replace("·", "*").replace("×", "*").replace("π", "pi")
+            .replace("²", "^2").replace("³", "^3").replace("√", "sqrt"))
+    # sin^2(x) -> (sin(x))^2
+    return FUNCTION_POWER.sub(r"(\1(\3))^\2", text).strip().rstrip(".?")
+
+def split_word(word, keep=()):
+    """'xsinx' -> 'x sin x', so only known functions and single letters reach the parser"""
+    if word in ALLOWED_WORDS or word in keep:
+        return word
+    parts = []
+    rest = word
+    while rest:
+        prefix = next((name for name in sorted(ALLOWED_WORDS, key=len, reverse=True) if rest.startswith(name)), rest[0])
+        parts.append(prefix)
+        rest = rest[len(prefix):]
+    # "xy" or "xsinx" is maths; "box" or "for" means the question is prose
+    if len(word) >= 3 and sum(1 for part in parts if len(part) == 1) > 2:
+        raise ValueError(f"{word!r} is a word, not an expression")
+    return " ".join(parts)
+
+def check_size(expression):
+    """Refuse powers too large to work out, before SymPy evaluates anything"""
+    import sympy
+    for node in sympy.preorder_traversal(expression):
+        # Outer powers come first, so 9^9^9 is refused on its 9^9 exponent without evaluating it
+        if node.is_Pow and node.exp.is_number and not abs(node.exp.evalf(5)) <= MAX_EXPONENT:
+            raise ValueError(f"the power {node.exp} is too large")
+
+def parse(text, extra=None):
+    import sympy
+    from sympy.parsing.sympy_parser import (parse_expr, standard_transformations,
+                                            implicit_multiplication_application, convert_xor)
+
+    extra = extra or {}
+    text = normalize_maths(text).lower()
+    if len(text) > MAX_EXPRESSION or not SAFE_EXPRESSION.fullmatch(text):
+        raise ValueError("not a plain expression")
+    text = re.sub(r"[a-z]+", lambda match: split_word(match.group(0), extra), text)
+    names = {letter: sympy.Symbol(letter) for letter in "abcdfghijklmnopqrstuvwxyz"}
+    names.update({"e": sympy.E, "pi": sympy.pi, "ln": sympy.log, "log": sympy.log, "abs": sympy.Abs})
+    names.update(extra)
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+
+    def read(source):
+        check_size(parse_expr(source, local_dict=names, transformations=transformations, evaluate=False))
+        expression = parse_expr(source, local_dict=names, transformations=transformations)
+        if expression.has(sympy.zoo, sympy.nan, sympy.oo, -sympy.oo):
+            raise ValueError(f"{source!r} is undefined")
+        return expression
+
+    if "=" in text:
+        lhs, rhs = text.split("=", 1)
+        return sympy.Eq(read(lhs), read(rhs))
+    return read(text)
+
+def after_colon(text, command):
+    """The maths after 'Solve:' / 'Differentiate' / ..."""
+    rest = text[command.end():] if command else text
+    return rest.lstrip(" :").strip()
+
+def solve_maths(text):
+    lower = text.lower()
+    if re.search(r"\bdifferential equation\b|dy/dx.*=", lower) and "solve" in lower:
+        return solve_ode(text)
+    if "eigenvalue" in lower or "determinant" in lower or "inverse" in lower:
+        return solve_matrix(text)
+    command = re.match(r"(?:(?:please|can you|could you)\s+)*(factori[sz]e|factor|expand|differentiate|integrate|evaluate|solve"
+                       r"(?: (?:the )?system)?|find (?:the )?(?:roots|derivative|integral) of|(?:the )?(?:derivative|integral|roots) of)"
+                       r"\b:?", text, re.I)
+    if command is None and lower.startswith("d/dx"):
+        return solve_derivative(text)
+    if command is None:
+        return None
+    verb = command.group(1).lower()
+    rest = after_colon(text, command)
+    if verb.startswith("factor"):
+        return solve_factor(rest)
+    if verb == "expand":
+        return solve_expand(rest)
+    if verb in ("differentiate", "find the derivative of", "find derivative of", "derivative of", "the derivative of"):
+        return solve_derivative(rest)
+    if "integral" in verb or verb == "integrate" or (verb == "evaluate" and ("∫" in rest or "integral" in rest.lower())):
+        return solve_integral(rest)
+    if "roots" in verb:
+        return solve_equations(rest if "=" in rest else rest + " = 0")
+    if verb.startswith("solve"):
+        return solve_equations(rest)
+    if verb == "evaluate":
+        return solve_evaluate(rest)
+    return None
+
+def pick_variable(expression):
+    import sympy
+    symbols = sorted(expression.free_symbols, key=lambda symbol: symbol.name)
+    x = sympy.Symbol("x")
+    if x in symbols:
+        return x
+    return symbols[0] if len(symbols) == 1 else None
+
+def latex(expression):
+    import sympy
+    return sympy.latex(expression)
+
+def solve_equations(rest):
+    import sympy
+    parts = [part for part in re.split(r"\n|;|,\s*(?=[^,]*=)|\band\b", rest) if part.strip()]
+    if len(parts) == 1 and parts[0].count("=") > 1:
+        # Two equations typed on one line: "2x + 3y = 12 4x - y = 5"
+        parts = re.split(r"(?<=[\d)])\s+(?=[-+]?\s*\d*\.?\d*\s*[a-z(])", parts[0])
+    equations = [parse(part) for part in parts]
+    equations = [eq if isinstance(eq, sympy.Equality) else sympy.Eq(eq, 0) for eq in equations]
+    if len(equations) == 1:
+        return solve_single(equations[0])
+    if len(equations) == 2:
+        return solve_system(equations)
+    return None
+
+def solve_single(equation):
+    import sympy
+    x = pick_variable(equation.lhs - equation.rhs)
+    if x is None:
+        return None
+    expression = sympy.together(equation.lhs - equation.rhs)
+    numerator, denominator = sympy.fraction(expression)
+    numerator = sympy.expand(numerator)
+    if not numerator.is_polynomial(x) or not denominator.is_polynomial(x):
+        return None
+    polynomial = sympy.Poly(numerator, x)
+    degree = polynomial.degree()
+    if degree < 1 or degree > 4:
+        return None
+
+    steps = []
+    if denominator.free_symbols:
+        steps.append(f"Multiply through by ${latex(sympy.factor(denominator))}$ to clear the fractions: "
+                     f"${latex(numerator)} = 0$ (with ${latex(sympy.factor(denominator))} \\neq 0$)")
+    elif degree > 1 or equation.rhs != 0:
+        steps.append(f"Bring everything to one side: ${latex(numerator)} = 0$")
+
+    if degree == 1:
+        a, b = polynomial.all_coeffs()
+        if b != 0:
+            steps.append(f"Move the constant across: ${latex(a * x)} = {latex(-b)}$")
+        if a != 1:
+            steps.append(f"Divide both sides by ${latex(a)}$")
+        roots = [sympy.nsimplify(-b / a)]
+    elif degree == 2:
+        a, b, c = polynomial.all_coeffs()
+        discriminant = b ** 2 - 4 * a * c
+        steps.append(f"This is a quadratic with $a = {latex(a)}$, $b = {latex(b)}$, $c = {latex(c)}$. "
+                     f"The discriminant is $b^2 - 4ac = {latex(discriminant)}$")
+        factored = sympy.factor(numerator)
+        if factored.is_Mul or factored.is_Pow:
+            steps.append(f"Factorise: ${latex(factored)} = 0$")
+        else:
+            steps.append(f"Use the quadratic formula: ${latex(x)} = \\frac{{-b \\pm \\sqrt{{b^2 - 4ac}}}}{{2a}}"
+                         f" = \\frac{{{latex(-b)} \\pm \\sqrt{{{latex(discriminant)}}}}}{{{latex(2 * a)}}}$")
+        roots = sympy.solve(numerator, x)
+    else:
+        factored = sympy.factor(numerator)
+        steps.append(f"Factorise: ${latex(factored)} = 0$")
+        roots = sympy.solve(numerator, x)
+
+    excluded = [root for root in roots if denominator.subs(x, root) == 0]
+    roots = [root for root in roots if root not in excluded]
+    if excluded:
+        steps.append("Reject " + ", ".join(f"${latex(x)} = {latex(root)}$" for root in excluded)
+                     + ", which makes a denominator zero")
+    if not roots:
+        return Solution("Solving the equation", steps, "There are no solutions.")
+    answer = ", ".join(f"${latex(x)} = {describe_root(root)}$" for root in roots)
+    return Solution("Solving the equation", steps, answer)
+
+def describe_root(root):
+    import sympy
+    # Undefined, infinite and complex values (1/0, sqrt(-1)) are left to the model
+    if root.has(sympy.zoo, sympy.nan) or root.is_finite is False or root.is_real is False:
+        raise ValueError(f"{root} is not a finite real number")
+    if root.is_Rational:
+        return latex(root)
+    return f"{latex(root)} \\approx {format_value(float(root), 4)}"
+
+def solve_system(equations):
+    import sympy
+    variables = sorted(set().union(*(eq.free_symbols for eq in equations)), key=lambda symbol: symbol.name)
+    if len(variables) != 2 or not all(sympy.Poly(eq.lhs - eq.rhs, *variables).is_linear for eq in equations):
+        return None
+    # Substitute using whichever variable has a coefficient of ±1, if any
+    order = [(i, v) for v in variables for i, eq in enumerate(equations)
+             if abs(sympy.Poly(eq.lhs - eq.rhs, *variables).coeff_monomial(v)) == 1]
+    index, first = order[0] if order else (0, variables[0])
+    other_index = 1 - index
+    second = variables[1] if first == variables[0] else variables[0]
+    expression = sympy.solve(equations[index], first)[0]
+    steps = [f"From equation ({index + 1}): ${latex(first)} = {latex(expression)}$"]
+    substituted = equations[other_index].subs(first, expression)
+    steps.append(f"Substitute into equation ({other_index + 1}): ${latex(sympy.expand(substituted.lhs))} = {latex(substituted.rhs)}$")
+    value = sympy.solve(substituted, second)
+    if len(value) != 1:
+        return None
+    value = value[0]
+    steps.append(f"So ${latex(second)} = {latex(value)}$")
+    first_value = expression.subs(second, value)
+    steps.append(f"Back-substitute: ${latex(first)} = {latex(expression.subs(second, value))}$")
+    return Solution("Solving the simultaneous equations", steps,
+                    f"${latex(variables[0])} = {latex({first: first_value, second: value}[variables[0]])}$, "
+                    f"${latex(variables[1])} = {latex({first: first_value, second: value}[variables[1]])}$")
+
+def solve_factor(rest):
+    import sympy
+    expression = parse(rest)
+    factored = sympy.factor(expression)
+    if factored == sympy.expand(expression) and not factored.is_Mul:
+        return None
+    steps = []
+    x = pick_variable(expression)
+    if x is not None and expression.is_polynomial(x) and sympy.Poly(expression, x).degree() == 2:
+        a, b, c = sympy.Poly(expression, x).all_coeffs()
+        if a == 1:
+            roots = sympy.solve(expression, x)
+            if all(root.is_Integer for root in roots):
+                pair = [-root for root in roots] if len(roots) == 2 else [-roots[0], -roots[0]]
+                steps.append(f"Find two numbers that multiply to ${latex(c)}$ and add to ${latex(b)}$: "
+                             f"${latex(pair[0])}$ and ${latex(pair[1])}$")
+    return Solution("Factorising", steps, f"${latex(expression)} = {latex(factored)}$")
+
+def solve_expand(rest):
+    import sympy
+    expression = parse(rest)
+    return Solution("Expanding", [], f"${latex(expression)} = {latex(sympy.expand(expression))}$")
+
+def solve_derivative(rest):
+    import sympy
+    rest = re.sub(r"^(?:d/dx\s*)", "", rest.strip(), flags=re.I)
+    rest = re.sub(r"^(?:y|f\(x\))\s*=\s*", "", rest.strip())
+    rest = re.sub(r"\s+with respect to x$", "", rest)
+    expression = parse(rest)
+    if isinstance(expression, sympy.Equality):
+        return None
+    x = pick_variable(expression)
+    if x is None:
+        return None
+    derivative = sympy.diff(expression, x)
+    steps = []
+    factors = [factor for factor in sympy.Mul.make_args(expression) if factor.has(x)]
+    if expression.is_Mul and len(factors) == 2:
+        u, v = factors
+        constant = sympy.Mul(*[factor for factor in sympy.Mul.make_args(expression) if not factor.has(x)])
+        steps.append(f"Use the product rule with $u = {latex(u)}$ and $v = {latex(v)}$: "
+                     f"$u' = {latex(sympy.diff(u, x))}$, $v' = {latex(sympy.diff(v, x))}$")
+        prefix = "" if constant == 1 else f"{latex(constant)} \\cdot "
+        steps.append(f"$\\frac{{d}}{{d{latex(x)}}} = {prefix}(u'v + uv') = {latex(derivative)}$")
+    elif expression.is_Add:
+        steps.append("Differentiate term by term: " + ", ".join(
+            f"$\\frac{{d}}{{d{latex(x)}}}\\left({latex(term)}\\right) = {latex(sympy.diff(term, x))}$"
+            for term in sympy.Add.make_args(expression)))
+    elif expression.is_Pow and expression.exp.is_number and expression.base == x:
+        steps.append(f"Use the power rule $\\frac{{d}}{{dx}} x^n = n x^{{n-1}}$ with $n = {latex(expression.exp)}$")
+    simplified = sympy.factor_terms(derivative)
+    return Solution("Differentiating", steps,
+                    f"$\\frac{{d}}{{d{latex(x)}}}\\left({latex(expression)}\\right) = {latex(simplified)}$")
+
+def solve_integral(rest):
+    import sympy
+    from sympy.integrals.manualintegrate import manualintegrate
+
+    rest = rest.replace("∫", " ").strip()
+    bounds = None
+    match = re.match(r"(?:from\s+)?(?P<lo>[^\s]+)\s+to\s+(?P<hi>[^\s]+)\s+of\s+(?P<body>.+)$", rest, re.I)
+    if match:
+        bounds = (match.group("lo"), match.group("hi"))
+        rest = match.group("body")
+    else:
+        match = re.match(r"(?P<body>.+?)\s+from\s+(?P<lo>[^\s]+)\s+to\s+(?P<hi>[^\s]+)$", rest, re.I)
+        if match:
+            bounds = (match.group("lo"), match.group("hi"))
+            rest = match.group("body")
+    rest = re.sub(r"\s*d([a-z])\s*$", "", rest.strip())
+    expression = parse(rest)
+    x = pick_variable(expression) or sympy.Symbol("x")
+    antiderivative = manualintegrate(expression, x)
+    if antiderivative.has(sympy.Integral):
+        return None
+    antiderivative = sympy.simplify(antiderivative) if sympy.count_ops(antiderivative) < 40 else antiderivative
+    steps = [f"Find an antiderivative: $\\int {latex(expression)}\\, d{latex(x)} = {latex(antiderivative)}$"]
+    if bounds is None:
+        return Solution("Integrating", steps, f"$\\int {latex(expression)}\\, d{latex(x)} = {latex(antiderivative)} + C$")
+    lo, hi = parse(bounds[0]), parse(bounds[1])
+    upper, lower = antiderivative.subs(x, hi), antiderivative.subs(x, lo)
+    value = sympy.simplify(upper - lower)
+    steps.append(f"Evaluate between the limits: $\\left[{latex(antiderivative)}\\right]_{{{latex(lo)}}}^{{{latex(hi)}}}"
+                 f" = {latex(sympy.simplify(upper))} - \\left({latex(sympy.simplify(lower))}\\right)$")
+    return Solution("Evaluating the definite integral", steps,
+                    f"$\\int_{{{latex(lo)}}}^{{{latex(hi)}}} {latex(expression)}\\, d{latex(x)} = {describe_root(value)}$")
+
+def solve_evaluate(rest):
+    import sympy
+    expression = parse(rest)
+    if isinstance(expression, sympy.Equality) or expression.free_symbols:
+        return None
+    value = sympy.nsimplify(expression) if expression.is_Rational else sympy.simplify(expression)
+    return Solution("Evaluating", [], f"${latex(expression)} = {describe_root(value)}$")
+
+def solve_matrix(text):
+    import sympy
+    match = re.search(r"\[\s*\[[-\d\s.,\[\]]+\]\s*\]", text)
+    if not match:
+        return None
+    rows = re.findall(r"\[([^\[\]]+)\]", match.group(0))
+    matrix = sympy.Matrix([[sympy.nsimplify(value) for value in row.split(",")] for row in rows])
+    if not matrix.is_square or matrix.rows > 4:
+        return None
+    lower = text.lower()
+    if "eigenvalue" in lower:
+        lam = sympy.Symbol("lambda")
+        polynomial = sympy.expand((matrix - lam * sympy.eye(matrix.rows)).det())
+        roots = sympy.solve(polynomial, lam)
+        steps = [f"Solve the characteristic equation $\\det(A - \\lambda I) = 0$: ${latex(polynomial)} = 0$"]
+        return Solution("Eigenvalues", steps, ", ".join(f"$\\lambda = {describe_root(root)}$" for root in roots))
+    if "determinant" in lower:
+        return Solution("Determinant", [], f"$\\det A = {latex(matrix.det())}$")
+    if matrix.det() == 0:
+        return Solution("Inverse", ["$\\det A = 0$"], "The matrix is singular, so it has no inverse.")
+    steps = [f"$\\det A = {latex(matrix.det())}$"]
+    return Solution("Inverse", steps, f"$A^{{-1}} = {latex(matrix.inv())}$")
+
+def solve_ode(text):
+    import sympy
+
+    match = re.search(r":\s*(.+)$", text) or re.search(r"equation\s+(.+)$", text, re.I)
+    if not match:
+        return None
+    body = match.group(1)
+    conditions = re.findall(r"y\s*\(\s*([-\d.]+)\s*\)\s*=\s*([-\d.]+)", body)
+    body = re.split(r",?\s*(?:with|given|where)\b|,\s*y\s*\(", body)[0]
+    x = sympy.Symbol("x")
+    y = sympy.Function("y")
+    body = (body.replace("d^2y/dx^2", " ypp ").replace("d2y/dx2", " ypp ").replace("dy/dx", " yp ")
+            .replace("y''", " ypp ").replace("y'", " yp "))
+    equation = parse(body, {"yp": y(x).diff(x), "ypp": y(x).diff(x, 2), "y": y(x), "x": x})
+    if not isinstance(equation, sympy.Equality):
+        return None
+    hints = sympy.classify_ode(equation, y(x))
+    allowed = [hint for hint in hints if hint in ("1st_linear", "separable", "nth_linear_constant_coeff_homogeneous",
+                                                  "nth_linear_constant_coeff_undetermined_coefficients")]
+    if not allowed:
+        return None
+    general = sympy.dsolve(equation, y(x), hint=allowed[0])
+    steps = [f"This is a {allowed[0].replace('_', ' ').replace('1st', 'first-order').replace('nth', 'constant-coefficient')} "
+             f"equation. General solution: ${latex(general)}$"]
+    if not conditions:
+        return Solution("Solving the differential equation", steps, f"${latex(general)}$")
+    ics = {y(sympy.nsimplify(point)): sympy.nsimplify(value) for point, value in conditions}
+    particular = sympy.dsolve(equation, y(x), hint=allowed[0], ics=ics)
+    steps.append("Apply " + ", ".join(f"$y({point}) = {value}$" for point, value in conditions)
+                 + " to find the constant" + ("s" if len(conditions) > 1 else ""))
+    return Solution("Solving the differential equation", steps, f"${latex(particular)}$")
@@ -0,0 +1,120 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Model tiering: picks the model and output budget for a question from the difficulty slider and
+# the kind of question asked. A beginner asking what a joule is gets a short answer from a small,
+# fast model; an expert asking for a derivation gets the large model and room to finish it.
+#
+# Questions are sorted into three types by cue phrases: "factual" (short what/define/state
+# questions with no numbers to work with), "derivation" (derive, prove, show that, from first
+# principles) and "problem" (everything else). RULES maps (type, difficulty) to a tier name, and
+# TierStats keeps per-tier latency and token counts so the rules and budgets can be tuned.
+
+import re
+import threading
+from collections import deque, namedtuple
+
+Tier = namedtuple("Tier", ["name", "model_name", "max_output_tokens"])
+Decision = namedtuple("Decision", ["tier", "question_type"])
+
+QUESTION_TYPES = ("factual", "problem", "derivation")
+
+FACTUAL = re.compile(r"^\W*(?:(?:please\s+)?(?:what(?:'s|\s+is|\s+are|\s+was|\s+were|\s+does|\s+do)|who|when|where|which"
+                     r"|define|state|name|list|give\s+(?:me\s+)?the\s+(?:definition|formula|unit|si unit|value|symbol)s?)\b)",
+                     re.IGNORECASE)
+DERIVATION = re.compile(r"\b(?:derive|derivation|prove|proof|show\s+that|demonstrate\s+that|from\s+first\s+principles"
+                        r"|rigorous(?:ly)?|in\s+full\s+detail)\b", re.IGNORECASE)
+# Numbers or formulas mean there is something to work out, however the question starts
+WORKING = re.compile(r"\d|[=^√∫∑]|\b(?:calculate|compute|solve|find|determine|evaluate|simplify|differentiate|integrate)\b",
+                     re.IGNORECASE)
+FACTUAL_MAX_WORDS = 20
+
+# Which tier answers each type of question at each difficulty
+RULES = {
+    "factual": {"Beginner": "fast", "Standard": "fast", "Advanced": "standard", "Expert": "standard"},
+    "problem": {"Beginner": "standard", "Standard": "standard", "Advanced": "standard", "Expert": "deep"},
+    "derivation": {"Beginner": "standard", "Standard": "standard", "Advanced": "deep", "Expert": "deep"},
+}
+
+def classify(question):
+    """The question's type: "factual", "problem" or "derivation\""""
+    if DERIVATION.search(question):
+        return "derivation"
+    if FACTUAL.search(question) and not WORKING.search(question) and len(question.split()) <= FACTUAL_MAX_WORDS:
+        return "factual"
+    return "problem"
+
+class TierStats:
+    """Per-tier calls, latency and the token counts reported in each response's usage_metadata"""
+    def __init__(self, window=200):
+        self.lock = threading.Lock()
+        self.window = window
+        self.tiers = {}
+
+    def record(self, tier, latency, usage_metadata=None, question_type=None):
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+        output_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+        with self.lock:
+            stats = self.tiers.setdefault(tier.name, {"calls": 0, "latencies": deque(maxlen=self.window),
+                                                      "prompt_tokens": 0, "output_tokens": 0,
+                                                      "capped": 0, "types": {}})
+            stats["calls"] += 1
+            stats["latencies"].append(latency)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["output_tokens"] += output_tokens
+            # An answer that used its whole budget was probably cut short
+            if tier.max_output_tokens and output_tokens >= tier.max_output_tokens:
+                stats["capped"] += 1
+            if question_type:
+                stats["types"][question_type] = stats["types"].get(question_type, 0) + 1
+
+    def snapshot(self):
+        """{tier: {calls, latency_p50, latency_p95, avg_prompt_tokens, avg_output_tokens, capped, types}}"""
+        with self.lock:
+            result = {}
+            for name, stats in self.tiers.items():
+                latencies = sorted(stats["latencies"])
+                calls = stats["calls"]
+                result[name] = {
+                    "calls": calls,
+                    "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+                    "latency_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+                    "avg_prompt_tokens": stats["prompt_tokens"] / calls if calls else 0.0,
+                    "avg_output_tokens": stats["output_tokens"] / calls if calls else 0.0,
+                    "capped": stats["capped"],
+                    "types": dict(stats["types"]),
+                }
+            return result
+
+class TierPolicy:
+    """Chooses a tier for each question; tiers missing from the rules fall back to the default"""
+    def __init__(self, tiers, rules=None, default="standard"):
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.rules = rules or RULES
+        self.default = self.tiers[default]
+        self.stats = TierStats()
+
+    def choose(self, question, difficulty, image=False):
+        """The Decision for a question; photos always go to the default tier's budget"""
+        question_type = classify(question)
+        if image:
+            return Decision(self.default, question_type)
+        name = self.rules.get(question_type, {}).get(difficulty)
+        return Decision(self.tiers.get(name, self.default), question_type)
+
+    def generation_config(self, tier):
+        """The generation settings passed with a tier's calls"""
+        return {"max_output_tokens": tier.max_output_tokens} if tier.max_output_tokens else None
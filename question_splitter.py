@@ -0,0 +1,102 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Splits a multi-part question, typed or transcribed from a worksheet photo, into its parts so
+# they can be answered in parallel instead of as one long request.
+#
+# Part labels are found in three styles: "(a)"/"(ii)" anywhere, "a)"/"a." at the start of a line,
+# and "1."/"Q1"/"Question 1" at the start of a line. Only a run of labels in order (a, b, c...,
+# i, ii, iii... or 1, 2, 3...) counts, so "f(a)" doesn't split anything, and bracketed numbers
+# are left alone because they are usually equation references. Text before the first label is
+# the stem, the setup every part needs. A part that builds on an earlier one ("hence", "using
+# your answer to (a)") stays with it in one group; only groups are answered in parallel.
+
+import re
+from collections import namedtuple
+
+Part = namedtuple("Part", ["label", "text"])
+Split = namedtuple("Split", ["stem", "groups"])
+
+LETTERS = "abcdefgh"
+ROMAN = ["i", "ii", "iii", "iv", "v", "vi", "vii", "viii"]
+
+# (style, pattern); the label is the "label" group
+LABEL_STYLES = [
+    ("bracketed", re.compile(r"(?<![\w)\]])\((?P<label>[a-h]|i{1,3}|iv|vi{0,3})\)(?=\s|$)", re.IGNORECASE)),
+    ("closing", re.compile(r"(?m)^[ \t]*(?:part\s+)?(?P<label>[a-h]|i{1,3}|iv|vi{0,3})[).](?=\s)", re.IGNORECASE)),
+    ("numbered", re.compile(r"(?m)^[ \t]*(?:q(?:uestion)?\s*)?(?P<label>[1-9]\d?)[).:](?=\s)", re.IGNORECASE)),
+]
+
+# A part that needs an earlier part's answer can't be answered on its own
+DEPENDS = re.compile(r"\b(?:hence|thus|using (?:your|the|this) (?:answer|result|value)s?|your (?:answer|result)s? (?:to|from|in)"
+                     r"|(?:from|in|of) part\b|previous part|part \(?[a-h1-9]\)?\s+above|the result above|this result)\b",
+                     re.IGNORECASE)
+
+def _sequences(label):
+    """The label sequences a label can belong to, with its position in each"""
+    label = label.lower()
+    found = []
+    if label in LETTERS:
+        found.append(("letter", LETTERS.index(label)))
+    if label in ROMAN:
+        found.append(("roman", ROMAN.index(label)))
+    if label.isdigit():
+        found.append(("number", int(label) - 1))
+    return found
+
+def find_parts(text):
+    """The (start, end, label) spans of the longest in-order run of part labels, or []"""
+    best = []
+    for _, pattern in LABEL_STYLES:
+        matches = list(pattern.finditer(text))
+        for sequence in ("letter", "roman", "number"):
+            run = []
+            for match in matches:
+                positions = dict(_sequences(match.group("label")))
+                if sequence in positions and positions[sequence] == len(run):
+                    run.append(match)
+            if len(run) > len(best):
+                best = run
+    return [(match.start(), match.end(), match.group("label").lower()) for match in best]
+
+def split_question(text, max_groups=6):
+    """The stem and the groups of parts of a multi-part question, or None if there aren't at
+    least two parts that can be answered on their own. Past max_groups, neighbouring groups are
+    merged so no more than that many requests are made."""
+    spans = find_parts(text)
+    if len(spans) < 2:
+        return None
+    stem = text[:spans[0][0]].strip()
+    parts = []
+    for index, (start, end, label) in enumerate(spans):
+        stop = spans[index + 1][0] if index + 1 < len(spans) else len(text)
+        body = " ".join(text[end:stop].split())
+        if not body:
+            return None
+        parts.append(Part(f"({label})", body))
+
+    groups = []
+    for part in parts:
+        if groups and DEPENDS.search(part.text):
+            groups[-1].append(part)
+        else:
+            groups.append([part])
+    if len(groups) < 2:
+        return None
+    if len(groups) > max_groups:
+        size = -(-len(groups) // max_groups)
+        groups = [sum(groups[i:i + size], []) for i in range(0, len(groups), size)]
+    return Split(stem, groups)
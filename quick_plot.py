@@ -0,0 +1,397 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Turns simple plot requests such as "plot y = sin(x) from 0 to 2pi" or "graph v = u + at"
+# into matplotlib code without asking the model. Anything it can't parse returns None,
+# and the request goes to the LLM as before.
+
+import re
+
+# Maps a function name to a template for its NumPy call
+FUNCTIONS = {
+    "sin": "np.sin({})", "cos": "np.cos({})", "tan": "np.tan({})",
+    "sec": "(1 / np.cos({}))", "csc": "(1 / np.sin({}))", "cot": "(1 / np.tan({}))",
+    "asin": "np.arcsin({})", "acos": "np.arccos({})", "atan": "np.arctan({})",
+    "arcsin": "np.arcsin({})", "arccos": "np.arccos({})", "arctan": "np.arctan({})",
+    "sinh": "np.sinh({})", "cosh": "np.cosh({})", "tanh": "np.tanh({})",
+    "exp": "np.exp({})", "ln": "np.log({})", "log": "np.log10({})",
+    "sqrt": "np.sqrt({})", "abs": "np.abs({})",
+}
+
+# Longest names first so "sinh" wins over "sin" when a name like "sinhx" is split
+FUNCTION_PREFIXES = sorted(FUNCTIONS, key=len, reverse=True)
+
+CONSTANTS = {"pi": "np.pi", "e": "np.e"}
+
+# Multi-letter names that may be used as variables
+GREEK = {"theta", "phi", "omega", "alpha", "beta"}
+
+# Short words that mean the prompt is prose, not a formula ("at" is allowed for v = u + at)
+ENGLISH_WORDS = {"the", "of", "for", "and", "in", "on", "to", "is", "it", "an", "by", "as",
+                 "vs", "how", "why", "me", "its", "if", "or", "my", "can", "you"}
+
+# Functions with poles, whose asymptotes should not be joined up by plt.plot
+POLE_FUNCTIONS = ("np.tan(", "1 / np.")
+
+MAX_PARAMETERS = 3
+SAMPLES = 1000
+MAX_BOUND = 1e6                       # larger range bounds are left to the model
+
+# A number in a generated expression (not the 10 of np.log10)
+NUMBER_LITERAL = re.compile(r"(?<![\w.])(?:\d+\.?\d*(?:e[-+]?\d+)?|\.\d+)")
+
+TOKEN = re.compile(r"\s*(?:(\d+\.?\d*(?:e[-+]?\d+)?|\.\d+)|([a-z]+)|(\*\*|[-+*/^()|]))")
+
+VERB = re.compile(r"^(?:please\s+)?(?:can you\s+)?(?:plot|graph|sketch|draw|chart)\s+"
+                  r"(?:(?:me\s+)?(?:the\s+|a\s+)?(?:graph|plot|curve|function)s?\s+(?:of\s+)?)?")
+
+NUMBER = r"[-+]?\d+\.?\d*(?:e[-+]?\d+)?"
+PARAMETERS = re.compile(rf"\s*(?:,|;|\bwith|\bwhere|\bwhen|\busing)\s+"
+                        rf"((?:[a-z]+\s*=\s*{NUMBER})(?:\s*(?:,|and)\s*[a-z]+\s*=\s*{NUMBER})*)\s*$")
+
+BOUND = r"[-+\w.*/^() ]+?"
+RANGES = [
+    re.compile(rf"\s*,?\s*\bfor\s+(?P<var>[a-z]+)\s+(?:from|between|in)\s+[\[(]?(?P<lo>{BOUND})\s*(?:to|and|,)\s*(?P<hi>{BOUND})[\])]?\s*$"),
+    re.compile(rf"\s*[,;]\s*(?P<var>[a-z]+)\s+(?:from|between|in)\s+[\[(]?(?P<lo>{BOUND})\s*(?:to|and|,)\s*(?P<hi>{BOUND})[\])]?\s*$"),
+    re.compile(rf"\s*,?\s*\bfor\s+(?P<lo>{BOUND})\s*<=?\s*(?P<var>[a-z]+)\s*<=?\s*(?P<hi>{BOUND})\s*$"),
+    re.compile(rf"\s*,?\s*\b(?:from|between|over|on)\s+[\[(]?(?P<lo>{BOUND})\s*(?:to|and|,)\s*(?P<hi>{BOUND})[\])]?\s*$"),
+]
+
+class ParseError(Exception):
+    """The prompt isn't a simple function plot"""
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if not match:
+            raise ParseError(f"unexpected character {text[pos]!r}")
+        number, name, symbol = match.groups()
+        tokens.append(("number", number) if number else ("name", name) if name else ("op", symbol))
+        pos = match.end()
+    return tokens
+
+class ExpressionParser:
+    """Recursive-descent parser that turns a maths expression into a NumPy expression. formula
+    says it is the right-hand side of an explicit y = ... or f(x) = ..."""
+    def __init__(self, text, formula=False):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.symbols = set()
+        self.formula = formula
+        self.letters = {value for kind, value in self.tokens if kind == "name" and len(value) == 1}
+
+    def parse(self):
+        if not self.tokens:
+            raise ParseError("empty expression")
+        result = self.expr()
+        if self.pos != len(self.tokens):
+            raise ParseError(f"unexpected {self.tokens[self.pos][1]!r}")
+        return result
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ParseError("expression ends too early")
+        self.pos += 1
+        return token
+
+    def expect(self, op):
+        if self.take() != ("op", op):
+            raise ParseError(f"expected {op!r}")
+
+    def starts_atom(self):
+        kind, value = self.peek()
+        return kind in ("number", "name") or (kind, value) == ("op", "(")
+
+    def expr(self):
+        result = self.term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            op = self.take()[1]
+            result = f"{result} {op} {self.term()}"
+        return result
+
+    def term(self):
+        result = self.factor()
+        while True:
+            if self.peek() in (("op", "*"), ("op", "/")):
+                op = self.take()[1]
+                result = f"{result} {op} {self.factor()}"
+            elif self.starts_atom():
+                # Implicit multiplication: 2x, 3sin(x), (x + 1)(x - 1)
+                result = f"{result} * {self.factor()}"
+            else:
+                return result
+
+    def factor(self):
+        if self.peek() in (("op", "-"), ("op", "+")):
+            op = self.take()[1]
+            operand = self.factor()
+            return f"(-{operand})" if op == "-" else operand
+        return self.power()
+
+    def power(self):
+        base = self.atom()
+        if self.peek() in (("op", "^"), ("op", "**")):
+            self.take()
+            return f"{base} ** {self.factor()}"
+        return base
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == "number":
+            return value
+        if (kind, value) == ("op", "("):
+            inner = self.expr()
+            self.expect(")")
+            return f"({inner})"
+        if (kind, value) == ("op", "|"):
+            inner = self.expr()
+            self.expect("|")
+            return f"np.abs({inner})"
+        if kind == "name":
+            return self.name(value)
+        raise ParseError(f"unexpected {value!r}")
+
+    def call(self, function):
+        if self.peek() == ("op", "("):
+            self.take()
+            argument = self.expr()
+            self.expect(")")
+        else:
+            # sin x, sin x^2
+            argument = self.power()
+        return FUNCTIONS[function].format(argument)
+
+    def symbol(self, name):
+        if name in CONSTANTS:
+            return CONSTANTS[name]
+        self.symbols.add(name)
+        return name
+
+    def name(self, name):
+        if name in FUNCTIONS:
+            return self.call(name)
+        if name in CONSTANTS or name in GREEK or len(name) == 1:
+            return self.symbol(name)
+        if name in ENGLISH_WORDS:
+            raise ParseError(f"{name!r} looks like prose")
+
+        # sinx -> sin(x), sin2x is tokenized separately
+        for function in FUNCTION_PREFIXES:
+            rest = name[len(function):]
+            if name.startswith(function) and 0 < len(rest) <= 2:
+                return FUNCTIONS[function].format(" * ".join(self.symbol(letter) for letter in rest))
+
+        # Short runs of letters are products of single-letter symbols (at -> a * t, mgh -> m * g * h),
+        # but only in an explicit formula or when each letter is also a symbol on its own, so that
+        # "plot a cat" isn't drawn as a * c * a * t
+        if len(name) <= 3 and (self.formula or set(name) <= self.letters):
+            return "(" + " * ".join(self.symbol(letter) for letter in name) + ")"
+        raise ParseError(f"unknown name {name!r}")
+
+def parse_expression(text, formula=False):
+    """Return (numpy expression, free symbols) for a maths expression, raising ParseError"""
+    parser = ExpressionParser(text, formula)
+    return parser.parse(), parser.symbols
+
+def evaluate_constant(text):
+    """Evaluate a range bound such as 2pi or -pi/2 in float64, returning (code, value)"""
+    import numpy as np
+
+    expression, symbols = parse_expression(text)
+    if symbols:
+        raise ParseError(f"range bound {text!r} is not a number")
+    # The expression only contains numbers, operators and whitelisted np functions. Its numbers
+    # are made float64, so 9^9^9 overflows to inf at once instead of building a huge integer.
+    as_floats = NUMBER_LITERAL.sub(lambda match: f"np.float64({match.group()!r})", expression)
+    with np.errstate(all="ignore"):
+        value = float(eval(as_floats, {"__builtins__": {}, "np": np}))
+    if not abs(value) <= MAX_BOUND:
+        raise ParseError(f"range bound {text!r} is not a finite number up to {MAX_BOUND:g}")
+    # The worker runs the code with Python integers, so powers go in as the value
+    return (repr(value) if "**" in expression else expression), value
+
+def normalize(prompt):
+    text = prompt.strip().lower()
+    replacements = {"π": "pi", "²": "^2", "³": "^3", "√": "sqrt", "×": "*", "·": "*",
+                    "−": "-", "–": "-", "≤": "<=", "θ": "theta", "ω": "omega", "φ": "phi"}
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+    return re.sub(r"\s+", " ", text).rstrip(" .?!")
+
+def split_top_level(text):
+    """Split curves on commas, semicolons and "and" outside brackets"""
+    parts, depth, current = [], 0, ""
+    for piece in re.split(r"(\s+and\s+|\s+vs\s+|[,;()])", text):
+        if piece == "(":
+            depth += 1
+        elif piece == ")":
+            depth -= 1
+        if depth == 0 and (piece in (",", ";") or piece.strip() in ("and", "vs")):
+            parts.append(current)
+            current = ""
+        else:
+            current += piece
+    parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+def parse_plot_request(prompt):
+    """Parse a plot request into curves, a range and parameter values, raising ParseError"""
+    text = normalize(prompt)
+    verb = VERB.match(text)
+    if not verb:
+        raise ParseError("not a plot request")
+    text = text[verb.end():]
+
+    # Ranges and parameter values come at the end, in either order
+    plot_range, parameters = None, {}
+    while True:
+        match = PARAMETERS.search(text)
+        if match:
+            for name, value in re.findall(rf"([a-z]+)\s*=\s*({NUMBER})", match.group(1)):
+                parameters[name] = value
+            text = text[:match.start()]
+            continue
+        for pattern in RANGES:
+            match = pattern.search(text)
+            if match and plot_range is None:
+                plot_range = (match.groupdict().get("var"), match.group("lo"), match.group("hi"))
+                text = text[:match.start()]
+                break
+        else:
+            break
+
+    curves = []
+    for part in split_top_level(text):
+        lhs = re.match(r"^([a-z]+)\s*(?:\(\s*([a-z]+)\s*\))?\s*=\s*(?!=)", part)
+        name, argument = (lhs.group(1), lhs.group(2)) if lhs else (None, None)
+        source = part[lhs.end():] if lhs else part
+        expression, symbols = parse_expression(source, formula=bool(lhs))
+        if name and name in symbols:
+            raise ParseError(f"{name} appears on both sides")
+        curves.append({"name": name, "argument": argument, "source": source.strip(),
+                       "label": part.strip(), "expression": expression, "symbols": symbols})
+    if not curves:
+        raise ParseError("nothing to plot")
+    return curves, plot_range, parameters
+
+def choose_variable(symbols, plot_range, curves):
+    if plot_range and plot_range[0]:
+        return plot_range[0]
+    for curve in curves:
+        if curve["argument"]:
+            return curve["argument"]
+    for candidate in ("x", "t", "theta"):
+        if candidate in symbols:
+            return candidate
+    free = sorted(symbols)
+    return free[0] if len(free) == 1 else "x"
+
+def default_range(variable, curves):
+    if variable in ("theta", "phi"):
+        return "0", "2 * np.pi"
+    if variable == "t":
+        return "0", "10"
+    if any("np.sin" in c["expression"] or "np.cos" in c["expression"] or "np.tan" in c["expression"] for c in curves):
+        return "-2 * np.pi", "2 * np.pi"
+    return "-10", "10"
+
+def build_plot_code(prompt):
+    """Return matplotlib code for a simple function plot, or None if the prompt needs the LLM"""
+    try:
+        curves, plot_range, parameters = parse_plot_request(prompt)
+    except ParseError:
+        return None
+
+    # x = f(t), y = g(t) is a parametric curve
+    names = [curve["name"] for curve in curves]
+    parametric = len(curves) == 2 and names == ["x", "y"] and not any(
+        {"x", "y"} & curve["symbols"] for curve in curves)
+
+    symbols = set().union(*(curve["symbols"] for curve in curves))
+    if parametric:
+        variable = plot_range[0] if plot_range and plot_range[0] else ("t" if "t" in symbols else "theta")
+    else:
+        variable = choose_variable(symbols, plot_range, curves)
+
+    assumed = sorted(symbols - {variable} - set(parameters))
+    if len(assumed) + len(parameters) > MAX_PARAMETERS:
+        return None
+
+    try:
+        if plot_range:
+            lo, lo_value = evaluate_constant(plot_range[1])
+            hi, hi_value = evaluate_constant(plot_range[2])
+            if not lo_value < hi_value:
+                return None
+        elif parametric:
+            lo, hi = "0", "2 * np.pi"
+        else:
+            lo, hi = default_range(variable, curves)
+    except ParseError:
+        return None
+
+    lines = ["import matplotlib.pyplot as plt", "import numpy as np", ""]
+    for name in sorted(parameters):
+        lines.append(f"{name} = {parameters[name]}")
+    for name in assumed:
+        lines.append(f"{name} = 1  # value not given, assumed 1")
+    lines.append(f"{variable} = np.linspace({lo}, {hi}, {SAMPLES})")
+    lines += ["", "plt.figure(figsize=(10, 6))"]
+
+    def values(curve):
+        # Constant expressions still need one value per sample
+        if variable in curve["symbols"]:
+            return curve["expression"]
+        return f"np.full_like({variable}, {curve['expression']}, dtype=float)"
+
+    if parametric:
+        x_curve, y_curve = curves
+        title = f"{x_curve['label']}, {y_curve['label']}"
+        lines.append(f"plt.plot({values(x_curve)}, {values(y_curve)}, label={title!r})")
+        lines.append("plt.axis('equal')")
+        x_label, y_label = "x", "y"
+    else:
+        for i, curve in enumerate(curves, start=1):
+            lines.append(f"y{i} = {values(curve)}")
+            denominator = curve["expression"].partition("/")[2]
+            if any(pole in curve["expression"] for pole in POLE_FUNCTIONS) or re.search(rf"\b{variable}\b", denominator):
+                lines.append(f"y{i}[np.abs(y{i}) > 5 * np.nanpercentile(np.abs(y{i}), 90)] = np.nan  # hide asymptotes")
+            label = curve["label"] if curve["name"] else f"y = {curve['source']}"
+            lines.append(f"plt.plot({variable}, y{i}, label={label!r})")
+        title = ", ".join(curve["label"] for curve in curves)
+        x_label = variable
+        dependent = {curve["name"] for curve in curves if curve["name"]}
+        y_label = dependent.pop() if len(dependent) == 1 else "y"
+
+    if assumed:
+        title += f" ({', '.join(f'{name} = 1' for name in assumed)})"
+    lines += [
+        f"plt.title({title!r})",
+        f"plt.xlabel({x_label!r})",
+        f"plt.ylabel({y_label!r})",
+        "plt.axhline(0, color='black', linewidth=0.5)",
+        "plt.axvline(0, color='black', linewidth=0.5)",
+        "plt.grid(True)",
+        "plt.legend()",
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,132 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Checks the part of the google.genai SDK the key pool relies on against a local fake API: each
+# key's client sends its own key, responses and stream chunks carry .text and .usage_metadata, and
+# a 429 surfaces as an error the pool treats as a quota error. An SDK upgrade that changes any of
+# these fails here instead of in production.
+#
+#   python -m pytest tests
+
+import base64
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_client
+import key_pool
+
+@pytest.fixture
+def fake_api():
+    """A Gemini REST API that answers every key except "refused-key", which gets 429.
+    Yields its base URL and the list of (path, key, body) requests it saw."""
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            key = self.headers.get("x-goog-api-key")
+            seen.append((self.path, key, body))
+            if key == "refused-key":
+                data = json.dumps({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "quota"}}).encode()
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            pieces = [{"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+                      for text in (f"answer for {key}", " (end)")]
+            pieces[-1]["usageMetadata"] = {"promptTokenCount": 7, "candidatesTokenCount": 3}
+            if ":streamGenerateContent" in self.path:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for piece in pieces:
+                    self.wfile.write(b"data: " + json.dumps(piece).encode() + b"\r\n\r\n")
+                return
+            whole = {"candidates": [{"content": {"role": "model", "parts": [{"text": f"answer for {key}"}]}}],
+                     "usageMetadata": pieces[-1]["usageMetadata"]}
+            data = json.dumps(whole).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", seen
+    server.shutdown()
+
+def make_model(base, api_key, system_instruction="Be brief."):
+    return gemini_client.GeminiModel(gemini_client.make_client(api_key, base), "gemini-test", system_instruction)
+
+def test_each_client_sends_its_own_key(fake_api):
+    base, seen = fake_api
+    one, two = make_model(base, "key-one"), make_model(base, "key-two")
+    assert one.generate_content("hi").text == "answer for key-one"
+    assert two.generate_content("hi").text == "answer for key-two"
+    assert [key for _, key, _ in seen] == ["key-one", "key-two"]
+    assert one.model_name == "models/gemini-test"
+
+def test_request_carries_turns_config_and_images(fake_api):
+    base, seen = fake_api
+    contents = [{"role": "user", "parts": ["What is this?", Image.new("RGB", (4, 4))]},
+                {"role": "model", "parts": ["A square."]},
+                {"role": "user", "parts": ["And its area?"]}]
+    response = make_model(base, "key-one").generate_content(contents, generation_config={"max_output_tokens": 64})
+    assert response.usage_metadata.prompt_token_count == 7
+    assert response.usage_metadata.candidates_token_count == 3
+    path, _, body = seen[0]
+    assert path.endswith("/models/gemini-test:generateContent")
+    assert [turn["role"] for turn in body["contents"]] == ["user", "model", "user"]
+    assert body["contents"][0]["parts"][0] == {"text": "What is this?"}
+    assert base64.b64decode(body["contents"][0]["parts"][1]["inlineData"]["data"]).startswith(b"\x89PNG")
+    assert body["systemInstruction"]["parts"] == [{"text": "Be brief."}]
+    assert body["generationConfig"] == {"maxOutputTokens": 64}
+
+def test_stream_yields_text_and_final_usage(fake_api):
+    base, _ = fake_api
+    chunks = make_model(base, "key-one").generate_content(["hi"], stream=True)
+    received = list(chunks)
+    assert "".join(chunk.text for chunk in received) == "answer for key-one (end)"
+    assert received[-1].usage_metadata.candidates_token_count == 3
+    assert callable(getattr(chunks, "close", None))
+
+def test_pool_moves_a_refused_call_to_the_next_key(fake_api):
+    base, seen = fake_api
+    keys = [key_pool.ApiKey("refused", "refused-key", 100), key_pool.ApiKey("open", "open-key", 1)]
+    slots = [key_pool.KeySlot(key, gemini_client.make_client(key.api_key, base)) for key in keys]
+    pool = key_pool.KeyPool(slots)
+    models = {slot.name: gemini_client.GeminiModel(slot.client, "gemini-test") for slot in slots}
+    model = key_pool.PooledModel(pool, models, gemini_client.model_path("gemini-test"))
+    assert model.generate_content("hi").text == "answer for open-key"
+    assert [key for _, key, _ in seen] == ["refused-key", "open-key"]
+    refused, answered = pool.health()
+    assert refused["throttled"] == 1 and refused["cooldown"] > 0
+    assert answered["calls"] == 1 and answered["throttled"] == 0
@@ -0,0 +1,92 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# What the built-in solver answers, and the questions it must leave to the model because its
+# formulas don't cover them or the SymPy work would be unbounded.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local_solver
+
+@pytest.fixture(scope="module")
+def solver():
+    solver = local_solver.LocalSolver(workers=1, time_limit=10.0)
+    solver.warm()
+    return solver
+
+@pytest.mark.parametrize("question, answer", [
+    ("What is the SI unit of force?", "The SI unit of force is the newton (N)."),
+    ("convert 5 km to m", "5 km = $5000$ m"),
+    ("Convert 2.5 h to min", "2.5 h = $150$ min"),
+    ("convert 3e5 m to km", "3e5 m = $300$ km"),
+    ("A 6 ohm resistor is connected across a 12 V battery. What is the current?", "$I = 2.00\\ \\mathrm{A}$"),
+    ("What is the kinetic energy of a 2 kg mass moving at 3 m/s?", "$E_k = 9.00\\ \\mathrm{J}$"),
+    ("A car accelerates from rest at 2 m/s^2 for 5 s. What is its final velocity?", "$v = 10.0\\ \\mathrm{m/s}$"),
+    ("Solve x^2 - 5x + 6 = 0", "$x = 2$, $x = 3$"),
+    ("Integrate 2x", "$\\int 2 x\\, dx = x^{2} + C$"),
+    ("Factorise x^2 - 9", "$x^{2} - 9 = \\left(x - 3\\right) \\left(x + 3\\right)$"),
+])
+def test_solves(solver, question, answer):
+    solution = solver.solve(question)
+    assert solution is not None and solution.answer == answer
+
+def test_constant_value(solver):
+    assert "2.998 \\times 10^{8}" in solver.solve("What is the speed of light?").answer
+
+def test_conversion_steps_show_the_typed_number():
+    solution = local_solver.solve_conversion("convert 5 km to m")
+    assert solution.steps == ["One km is $1000$ m.", "Multiply: $5 \\times 1000 = 5000$"]
+
+@pytest.mark.parametrize("question", [
+    # Unbounded or undefined SymPy work
+    "Evaluate 9^9^9",
+    "Expand (x+y+z)^200",
+    "Evaluate 1/0",
+    # No real answer to give
+    "Solve x^2 + 1 = 0",
+    # Context the formulas don't account for
+    "What is the weight of a 5 kg mass on the Moon?",
+    "Three resistors of 2, 3 and 6 ohm are connected in parallel across a 12 V battery. Find the current.",
+    "A 4 ohm and a 6 ohm resistor are connected in series across a 12 V battery. What is the current?",
+    "What is the gravitational constant on Jupiter?",
+    # Not a calculation at all
+    "Explain entropy",
+])
+def test_declines(solver, question):
+    assert solver.solve(question) is None
+
+def test_busy_solver_declines_at_once(solver):
+    worker = solver._acquire()
+    try:
+        assert solver._acquire() is None
+    finally:
+        solver.idle.put(worker)
+
+def test_time_limit_stops_slow_work():
+    slow = local_solver.LocalSolver(workers=1, time_limit=0.5)
+    slow.warm()
+    assert slow.idle.queue[0].wait_ready(local_solver.STARTUP_LIMIT)
+    start = time.monotonic()
+    assert slow.run(time.sleep, 5) is None
+    assert time.monotonic() - start < 0.5 + local_solver.KILL_MARGIN
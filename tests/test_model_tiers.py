@@ -0,0 +1,103 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Which tier model_tiers.py picks for each kind of question at each difficulty.
+#
+#   python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_tiers import Tier, TierPolicy, TierStats, classify
+
+TIERS = [Tier("fast", "fast-model", 1024), Tier("standard", "standard-model", 4096), Tier("deep", "deep-model", 8192)]
+
+# One question of each type
+QUESTIONS = {
+    "factual": "What is a joule?",
+    "problem": "A 2 kg ball moves at 3 m/s. What is its kinetic energy?",
+    "derivation": "Derive the equation for the period of a simple pendulum",
+}
+
+@pytest.mark.parametrize("question, question_type", [
+    ("What is a joule?", "factual"),
+    ("Define momentum", "factual"),
+    ("State Newton's first law.", "factual"),
+    ("Who discovered the electron?", "factual"),
+    ("Give me the SI unit of power", "factual"),
+    ("What is the kinetic energy of a 2 kg mass moving at 3 m/s?", "problem"),
+    ("What is x if 2x + 3 = 11?", "problem"),
+    ("What is the best way to calculate the area under a curve?", "problem"),
+    ("Explain why the sky is blue", "problem"),
+    ("What is the difference between speed and velocity, and why does it matter when a car goes round "
+     "a bend at a constant rate while its direction keeps changing?", "problem"),
+    ("Derive the kinematic equations", "derivation"),
+    ("Prove that the square root of 2 is irrational", "derivation"),
+    ("Show that the kinetic energy is 1/2 mv^2", "derivation"),
+    ("What is E = mc^2? Explain it from first principles", "derivation"),
+])
+def test_classify(question, question_type):
+    assert classify(question) == question_type
+
+@pytest.mark.parametrize("question_type, difficulty, tier", [
+    ("factual", "Beginner", "fast"),
+    ("factual", "Standard", "fast"),
+    ("factual", "Advanced", "standard"),
+    ("factual", "Expert", "standard"),
+    ("problem", "Beginner", "standard"),
+    ("problem", "Standard", "standard"),
+    ("problem", "Advanced", "standard"),
+    ("problem", "Expert", "deep"),
+    ("derivation", "Beginner", "standard"),
+    ("derivation", "Standard", "standard"),
+    ("derivation", "Advanced", "deep"),
+    ("derivation", "Expert", "deep"),
+])
+def test_tier_for_type_and_difficulty(question_type, difficulty, tier):
+    decision = TierPolicy(TIERS).choose(QUESTIONS[question_type], difficulty)
+    assert decision.question_type == question_type
+    assert decision.tier.name == tier
+
+def test_photos_use_the_default_tier():
+    decision = TierPolicy(TIERS).choose(QUESTIONS["derivation"], "Expert", image=True)
+    assert decision.tier.name == "standard"
+    assert decision.question_type == "derivation"
+
+def test_unknown_difficulty_and_missing_tier_fall_back_to_the_default():
+    policy = TierPolicy(TIERS)
+    assert policy.choose(QUESTIONS["factual"], "Olympiad").tier.name == "standard"
+    without_fast = TierPolicy([tier for tier in TIERS if tier.name != "fast"])
+    assert without_fast.choose(QUESTIONS["factual"], "Beginner").tier.name == "standard"
+
+def test_generation_config_caps_output_tokens():
+    policy = TierPolicy(TIERS + [Tier("open", "open-model", None)])
+    assert policy.generation_config(policy.tiers["fast"]) == {"max_output_tokens": 1024}
+    assert policy.generation_config(policy.tiers["open"]) is None
+
+def test_stats_count_answers_that_hit_the_budget():
+    class Usage:
+        prompt_token_count = 100
+        candidates_token_count = 1024
+    stats = TierStats()
+    stats.record(TIERS[0], 0.5, Usage(), "factual")
+    stats.record(TIERS[0], 1.5, None, "problem")
+    fast = stats.snapshot()["fast"]
+    assert fast["calls"] == 2 and fast["capped"] == 1
+    assert fast["avg_prompt_tokens"] == 50 and fast["types"] == {"factual": 1, "problem": 1}
@@ -0,0 +1,93 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# How question_splitter.py finds the parts of a question, keeps dependent parts together and caps
+# the number of requests.
+#
+#   python -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from question_splitter import Part, split_question
+
+def labels(split):
+    return [[part.label for part in group] for group in split.groups]
+
+def test_lettered_parts():
+    split = split_question("A ball is thrown up at 20 m/s. (a) Find the time to the top. (b) Find the maximum height. "
+                           "(c) Find the time of flight. (d) Find the speed at 1 s. (e) Explain why the speed at the top is 0.")
+    assert split.stem == "A ball is thrown up at 20 m/s."
+    assert labels(split) == [["(a)"], ["(b)"], ["(c)"], ["(d)"], ["(e)"]]
+    assert split.groups[1] == [Part("(b)", "Find the maximum height.")]
+
+def test_lettered_parts_at_line_starts():
+    split = split_question("A 4 ohm and a 6 ohm resistor are in series with a 10 V battery.\n"
+                           "a) Find the current.\nb) Find the voltage across the 4 ohm resistor.")
+    assert labels(split) == [["(a)"], ["(b)"]]
+
+def test_roman_numerals():
+    split = split_question("(i) Define work. (ii) Define power. (iii) Define efficiency.")
+    assert labels(split) == [["(i)"], ["(ii)"], ["(iii)"]]
+
+def test_numbered_worksheet():
+    split = split_question("Worksheet 3: calculus\n1. Differentiate x^3 sin(x).\n2) Integrate x e^x.\n"
+                           "Q3. Solve x^2 - 5x + 6 = 0.\nQuestion 4: Find the inverse of [[2, 1], [1, 1]].")
+    assert split.stem == "Worksheet 3: calculus"
+    assert labels(split) == [["(1)"], ["(2)"], ["(3)"], ["(4)"]]
+    assert split.groups[3][0].text == "Find the inverse of [[2, 1], [1, 1]]."
+
+def test_numbered_lines_in_order():
+    split = split_question("1. Define momentum.\n2. State Newton's third law.\n3. Convert 72 km/h to m/s.")
+    assert labels(split) == [["(1)"], ["(2)"], ["(3)"]]
+    assert split.groups[2][0].text == "Convert 72 km/h to m/s."
+
+def test_dependent_parts_stay_together():
+    split = split_question("A 2 kg block slides down a 30 degree slope. (a) Find the component of its weight along the slope. "
+                           "(b) Hence find its acceleration. (c) Using your answer to (b), find its speed after 3 s. "
+                           "(d) Name one force that was ignored.")
+    assert labels(split) == [["(a)", "(b)", "(c)"], ["(d)"]]
+
+def test_all_parts_dependent_is_one_request():
+    assert split_question("(a) Find the area of the circle. (b) Hence find its circumference.") is None
+
+def test_function_arguments_are_not_labels():
+    assert split_question("If f(x) = x^2 + 1, find f(a) and f(b) and compare them.") is None
+    assert split_question("Find f(a) - f(b) when f(x) = 3x and a = 2, b = 5") is None
+
+def test_bracketed_numbers_are_equation_references():
+    assert split_question("Use (1) and (2) to eliminate y: (1) 2x + y = 7 (2) x - y = 2") is None
+
+def test_one_part_is_not_split():
+    assert split_question("(a) Find the current through a 5 ohm resistor with 10 V across it.") is None
+    assert split_question("What is the speed of light?") is None
+
+def test_parts_out_of_order_are_not_a_run():
+    assert split_question("Answer (b) first, then (d).") is None
+
+def test_group_cap_merges_neighbours_in_order():
+    question = "\n".join(f"{number}. Question number {number}." for number in range(1, 9))
+    split = split_question(question, max_groups=3)
+    assert len(split.groups) == 3
+    assert labels(split) == [["(1)", "(2)", "(3)"], ["(4)", "(5)", "(6)"], ["(7)", "(8)"]]
+    assert [part.text for group in split.groups for part in group] == [f"Question number {n}." for n in range(1, 9)]
+
+def test_group_cap_keeps_dependent_parts_together():
+    question = ("(a) Define speed. (b) Define velocity. (c) Find a velocity. (d) Hence find the speed. "
+                "(e) Define acceleration.")
+    assert labels(split_question(question, max_groups=2)) == [["(a)", "(b)"], ["(c)", "(d)", "(e)"]]
@@ -0,0 +1,64 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Plot requests quick_plot.py turns into code itself, and prose it must leave to the model.
+#
+#   python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quick_plot
+
+@pytest.mark.parametrize("prompt", [
+    "plot a cat",
+    "draw a cat",
+    "plot a cat and a dog",
+    "sketch the dog",
+    "graph my pet",
+    "chart sales vs time",
+    "plot mgh",
+    "draw a circle",
+])
+def test_prose_goes_to_the_model(prompt):
+    assert quick_plot.build_plot_code(prompt) is None
+
+@pytest.mark.parametrize("prompt", [
+    "plot y = sin(x) from 0 to 2pi",
+    "plot sin x",
+    "plot x^2 - 3x + 2",
+    "plot 2x + 1 for x from -5 to 5",
+    "plot sinx and cosx",
+    "graph f(x) = x^2 + bx + c",
+])
+def test_function_plots_are_built_locally(prompt):
+    assert quick_plot.build_plot_code(prompt) is not None
+
+def test_letter_runs_in_a_formula_are_products():
+    code = quick_plot.build_plot_code("graph v = u + at")
+    assert "u + (a * t)" in code
+    assert "a = 1  # value not given, assumed 1" in code
+
+def test_letter_runs_of_known_symbols_are_products():
+    expression, symbols = quick_plot.parse_expression("x + xx")
+    assert expression == "x + (x * x)" and symbols == {"x"}
+
+def test_huge_range_bounds_go_to_the_model():
+    assert quick_plot.build_plot_code("plot sin(x) from 0 to 9^9^9") is None
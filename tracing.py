@@ -0,0 +1,263 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Lightweight request tracing: nested spans with timings, exported as OTLP/JSON to a
+# file or an OpenTelemetry collector, plus an opt-in sampling profiler.
+#
+# Spans are only recorded inside trace(); everywhere else span() is a cheap no-op.
+
+import contextvars
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import urllib.request
+from collections import Counter
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("chatbot_span", default=None)
+
+class Span:
+    """One timed stage of a request"""
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id=None, attributes=None, start_ns=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, end_ns=None):
+        self.end_ns = end_ns or time.time_ns()
+        self.trace.add(self)
+
+    @property
+    def duration(self):
+        """Seconds, or None while the span is still open"""
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns else None
+
+class _NoopSpan:
+    """Stands in for a span when nothing is being traced"""
+    def set(self, **attributes):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    """The spans of one request. Spans that end after the request (e.g. background speech) are
+    still added here and exported on their own."""
+    def __init__(self, name, exporter=None):
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.exporter = exporter
+        self.spans = []
+        self.exported = False
+        self.profile = None
+        self.lock = threading.Lock()
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+            late = self.exported
+        if late and self.exporter:
+            self.exporter.export(self, [span])
+
+    def close(self):
+        with self.lock:
+            self.exported = True
+            spans = list(self.spans)
+        if self.exporter:
+            self.exporter.export(self, spans)
+
+    @property
+    def root(self):
+        return next((span for span in self.spans if span.parent_id is None), None)
+
+def current_span():
+    return _current.get()
+
+@contextmanager
+def trace(name, exporter=None, **attributes):
+    """Start a trace for one request, with its root span as the current span"""
+    root = Span(Trace(name, exporter), name, attributes=attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        root.finish()
+        root.trace.close()
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """Time a stage as a child of the current span (or of parent, for work resumed later)"""
+    parent = parent or _current.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+def record(name, start_ns, end_ns, parent=None, **attributes):
+    """Add a span that was timed elsewhere, e.g. a stream consumed across yields or work in another process"""
+    parent = parent or _current.get()
+    if parent is None:
+        return
+    Span(parent.trace, name, parent.span_id, attributes, start_ns).finish(end_ns)
+
+def bind(fn):
+    """Carry the current span into a worker thread, so spans made there join the same trace"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+def to_otlp(trace, spans, service_name="physics-maths-solver"):
+    """Encode spans in the OTLP/JSON format that OpenTelemetry collectors accept"""
+    encoded = []
+    for item in spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(item.end_ns),
+            "attributes": [_attribute(key, value) for key, value in item.attributes.items()],
+            "status": {"code": 2, "message": item.error} if item.error else {"code": 1},
+        }
+        if item.parent_id:
+            otlp_span["parentSpanId"] = item.parent_id
+        encoded.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", service_name)]},
+        "scopeSpans": [{"scope": {"name": "chatbot.tracing"}, "spans": encoded}],
+    }]}
+
+class Exporter:
+    """Sends finished spans to a JSON-lines file and/or an OTLP/HTTP collector from a background thread"""
+    def __init__(self, path=None, endpoint=None):
+        self.path = path
+        self.endpoint = endpoint
+        self.queue = queue.Queue(maxsize=1000)
+        threading.Thread(target=self._run, name="chatbot-trace-export", daemon=True).start()
+
+    def export(self, trace, spans):
+        try:
+            self.queue.put_nowait(to_otlp(trace, spans))
+        except queue.Full:
+            # Tracing must never slow the app down; drop spans instead
+            pass
+
+    def _run(self):
+        while True:
+            payload = self.queue.get()
+            body = json.dumps(payload)
+            try:
+                if self.path:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(body + "\n")
+                if self.endpoint:
+                    request = urllib.request.Request(self.endpoint, data=body.encode(),
+                                                     headers={"Content-Type": "application/json"})
+                    urllib.request.urlopen(request, timeout=5).close()
+            except Exception:
+                pass
+
+class SamplingProfiler:
+    """Samples the stacks of every thread at a fixed interval while running; cheap enough for one request"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="chatbot-profiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        return self.samples
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = [f"{entry.name} ({os.path.basename(entry.filename)}:{entry.lineno})"
+                         for entry in traceback.extract_stack(frame)]
+                if _idle(stack):
+                    continue
+                self.samples[";".join([names.get(thread_id, str(thread_id))] + stack)] += 1
+
+def _idle(stack):
+    """Threads parked on an empty work queue or an event loop's select would dominate the profile"""
+    if not stack:
+        return True
+    if stack[-1].startswith("select ("):
+        return True
+    return len(stack) > 1 and stack[-1].startswith("wait (threading.py") and stack[-2].startswith("get (queue.py")
+
+def folded_stacks(samples):
+    """The profile in the folded format read by flamegraph.pl and speedscope"""
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
+
+def top_functions(samples, limit=15):
+    """(function, self samples, total samples) for the functions seen most, sorted by self time"""
+    own, total = Counter(), Counter()
+    for stack, count in samples.items():
+        frames = stack.split(";")[1:]
+        if frames:
+            own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
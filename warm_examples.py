@@ -0,0 +1,74 @@
+# Physics & Maths Question Solver – An AI-powered chatbot for solving physics and math problems
+# Copyright (C) 2025  zhengbingquant
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Warm-up job: precomputes the answer, graph and speech of every curated example question, so
+# the app serves them instantly. Run it after deploying or after changing the system prompt or
+# model; examples already in the store for the current version are skipped.
+#
+#   python warm_examples.py
+#   python warm_examples.py --workers 8 --no-speech
+#   python warm_examples.py --stub      # offline mock model, into CHATBOT_CACHE_DIR
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch_solve import load_app
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the answers to the example questions")
+    parser.add_argument("--examples", help="question file (defaults to Chatbot_Examples_Questions.txt)")
+    parser.add_argument("--workers", type=int, default=4, help="examples precomputed at once")
+    parser.add_argument("--force", action="store_true", help="precompute examples that are already stored")
+    parser.add_argument("--no-speech", action="store_true", help="don't synthesize the spoken answers")
+    parser.add_argument("--stub", action="store_true", help="use the offline mock model")
+    args = parser.parse_args()
+
+    # The stub keeps the configured cache directory, so the app can be tried against the result
+    app = load_app(stub=args.stub)
+    examples = app.example_bank.load_bank(args.examples) if args.examples else app.get_example_bank()
+    store = app.get_example_store()
+    todo = examples if args.force else store.missing(examples, app.EXAMPLE_DIFFICULTY)
+    print(f"Store {store.directory}: {len(examples) - len(todo)} of {len(examples)} examples ready",
+          file=sys.stderr)
+
+    state = app.st.session_state
+    failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(app.precompute_example, example, store, state.model, state.utility_model,
+                                   not args.no_speech): example for example in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            example = futures[future]
+            try:
+                future.result()
+                status = "ok"
+            except Exception as e:
+                failed += 1
+                status = f"error: {e}"
+            print(f"[{done}/{len(todo)}] {status:8} {example.text[:70]}", file=sys.stderr, flush=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(todo) - failed} precomputed in {elapsed:.1f}s"
+          + (f" ({(len(todo) - failed) / elapsed * 60:.1f} per minute)" if todo and elapsed else "")
+          + (f", {failed} failed; run again to retry them" if failed else ""))
+    if not failed and not store.missing(examples, app.EXAMPLE_DIFFICULTY):
+        store.prune()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()